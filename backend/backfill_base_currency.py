@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Convert historic sales, price points and travel expenses to the base currency.
+
+Run it after the base-currency migration, once the exchange rate history has
+rates for the currencies in use (the API records them as it fetches rates).
+Rows already converted are skipped, so it is safe to run again.
+"""
+
+import logging
+import os
+import sys
+
+# Add the backend directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from currency import backfill_base_amounts
+from database import SessionLocal
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def main():
+    db = SessionLocal()
+    try:
+        counts = backfill_base_amounts(db)
+        for table, count in counts.items():
+            logger.info(f"{table}: {count}")
+    except Exception as e:
+        logger.error(f"Base currency backfill failed: {e}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+import hashlib
+import os
+from abc import ABC, abstractmethod
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class TTLCache:
+    """
+    Small in-process cache whose entries expire after a fixed number of seconds.
+    Used for read-heavy aggregates that may be a few seconds stale.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._entries: Dict[Hashable, Tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+
+    def get_or_set(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """Return the cached value for key, computing and storing it when missing or expired"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                return entry[1]
+
+        value = factory()
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class CacheBackend(ABC):
+    """
+    Storage behind ReferenceDataCache. Values are bytes so a backend shared
+    between worker processes (such as Redis) can hold them as they are.
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[bytes]:
+        """Value stored under key, None when missing or expired"""
+
+    @abstractmethod
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        """Store a value that expires after ttl seconds"""
+
+    @abstractmethod
+    def delete_prefix(self, prefix: str) -> None:
+        """Remove every key starting with prefix"""
+
+    @abstractmethod
+    def clear(self) -> None:
+        """Remove every key"""
+
+
+class LocalCacheBackend(CacheBackend):
+    """In-process backend with per-entry expiry that evicts the least recently used entry when full"""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete_prefix(self, prefix: str) -> None:
+        with self._lock:
+            for key in [key for key in self._entries if key.startswith(prefix)]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Backend shared by every worker, so an invalidation in one process is seen by all.
+    `client` only needs the redis-py methods get, set, scan_iter and delete.
+    """
+
+    def __init__(self, client, namespace: str = "yanstore:refdata:"):
+        self.client = client
+        self.namespace = namespace
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.client.get(self.namespace + key)
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        self.client.set(self.namespace + key, value, px=int(ttl * 1000))
+
+    def delete_prefix(self, prefix: str) -> None:
+        keys = list(self.client.scan_iter(match=f"{self.namespace}{prefix}*"))
+        if keys:
+            self.client.delete(*keys)
+
+    def clear(self) -> None:
+        self.delete_prefix("")
+
+
+def create_cache_backend(backend: Optional[str] = None) -> CacheBackend:
+    """
+    Build the reference data cache backend configured through the environment.
+    REFERENCE_CACHE_BACKEND selects "redis" (REDIS_URL; requires the redis
+    package) or "local" (REFERENCE_CACHE_MAX_ENTRIES entries per process), and
+    defaults to redis whenever REDIS_URL is set.
+    """
+    backend = backend or os.getenv("REFERENCE_CACHE_BACKEND") or ("redis" if os.getenv("REDIS_URL") else "local")
+
+    if backend == "local":
+        return LocalCacheBackend(int(os.getenv("REFERENCE_CACHE_MAX_ENTRIES", "256")))
+
+    if backend == "redis":
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("redis is required for the redis reference cache backend")
+        return RedisCacheBackend(redis.Redis.from_url(os.environ["REDIS_URL"]))
+
+    raise ValueError(f"Unknown reference cache backend: {backend}")
+
+
+class ReferenceDataCache:
+    """
+    Cache for small lookup tables (categories, events, suppliers) that change a few
+    times a month but are read on every form load. Entries are grouped by table so
+    the write handlers of a table can drop all of its cached lists at once.
+    """
+
+    def __init__(self, backend: CacheBackend, ttl: float):
+        self.backend = backend
+        self.ttl = ttl
+
+    @staticmethod
+    def _key(table: str, key: Hashable) -> str:
+        return f"{table}:{key}"
+
+    def get(self, table: str, key: Hashable) -> Optional[bytes]:
+        return self.backend.get(self._key(table, key))
+
+    def set(self, table: str, key: Hashable, value: bytes) -> None:
+        self.backend.set(self._key(table, key), value, self.ttl)
+
+    def invalidate(self, table: str) -> None:
+        self.backend.delete_prefix(f"{table}:")
+
+    def clear(self) -> None:
+        self.backend.clear()
+
+
+def create_reference_cache() -> ReferenceDataCache:
+    """
+    Build the reference data cache configured through the environment.
+    Entries live REFERENCE_CACHE_TTL seconds (300 by default) in a shared
+    backend. A local backend only sees the invalidations of its own process, so
+    with several gunicorn workers the others would keep serving (and answering
+    304 for) old lists; its entries therefore live REFERENCE_CACHE_LOCAL_TTL
+    seconds (5 by default) unless WEB_CONCURRENCY is 1.
+    """
+    backend = create_cache_backend()
+    ttl = float(os.getenv("REFERENCE_CACHE_TTL", "300"))
+    if isinstance(backend, LocalCacheBackend) and os.getenv("WEB_CONCURRENCY") != "1":
+        ttl = min(ttl, float(os.getenv("REFERENCE_CACHE_LOCAL_TTL", "5")))
+    return ReferenceDataCache(backend, ttl=ttl)
+
+
+def etag_for(body: bytes) -> str:
+    """Strong ETag of a response body"""
+    return f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
@@ -0,0 +1,138 @@
+import logging
+from datetime import date, datetime, time, timezone
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Dict, Optional
+
+from sqlalchemy import or_, select, update
+from sqlalchemy.orm import Session
+
+import models
+from exchange_rates import rate_at
+from models import BASE_CURRENCY
+
+logger = logging.getLogger(__name__)
+
+TWO_PLACES = Decimal("0.01")
+
+# Models carrying amounts in a currency: (column dating the amount, amount column -> base-currency column)
+CONVERTED_AMOUNTS = {
+    models.Sale: ("sale_date", {"sale_price": "sale_price_base"}),
+    models.PricePoint: ("effective_from", {
+        "base_cost": "base_cost_base",
+        "selling_price": "selling_price_base",
+        "shipment_cost": "shipment_cost_base",
+    }),
+    models.TravelExpense: ("expense_date", {"amount": "amount_base"}),
+}
+
+
+class MissingExchangeRateError(Exception):
+    """Raised when no exchange rate is recorded for a currency"""
+
+
+def _as_datetime(at) -> datetime:
+    if at is None:
+        return datetime.now(timezone.utc)
+    if not isinstance(at, datetime):
+        # A date covers the whole day, so the rate published that day applies
+        at = datetime.combine(at, time.max)
+    return at if at.tzinfo else at.replace(tzinfo=timezone.utc)
+
+
+def exchange_rate(db: Session, currency: Optional[str], at=None) -> Decimal:
+    """
+    Units of `currency` per unit of BASE_CURRENCY at a point in time.
+    Amounts older than the rate history use its earliest rate.
+    """
+    if currency in (None, BASE_CURRENCY):
+        return Decimal(1)
+    rate = rate_at(db, currency, _as_datetime(at), BASE_CURRENCY)
+    if rate is None:
+        rate = db.scalar(
+            select(models.ExchangeRateHistory.rate).where(
+                models.ExchangeRateHistory.base_currency == BASE_CURRENCY,
+                models.ExchangeRateHistory.currency == currency
+            ).order_by(models.ExchangeRateHistory.effective_at).limit(1)
+        )
+    if rate is None:
+        raise MissingExchangeRateError(f"No exchange rate recorded for {currency}")
+    return Decimal(rate)
+
+
+def to_base(amount, rate: Decimal) -> Optional[Decimal]:
+    """Convert an amount to BASE_CURRENCY with the given rate"""
+    if amount is None:
+        return None
+    return (Decimal(amount) / rate).quantize(TWO_PLACES, rounding=ROUND_HALF_UP)
+
+
+def apply_base_amounts(db: Session, row) -> None:
+    """
+    Set fx_rate and the base-currency amounts of a sale, price point or travel
+    expense from its currency and date. Call it whenever a row is created or its
+    amounts, currency or date change; rows in BASE_CURRENCY get a rate of 1.
+    """
+    date_attribute, amounts = CONVERTED_AMOUNTS[type(row)]
+    rate = exchange_rate(db, row.currency, getattr(row, date_attribute))
+    row.fx_rate = rate
+    for amount_attribute, base_attribute in amounts.items():
+        setattr(row, base_attribute, to_base(getattr(row, amount_attribute), rate))
+
+
+def backfill_base_amounts(db: Session, batch_size: int = 1000) -> Dict[str, int]:
+    """
+    Fill fx_rate and the base-currency amounts of rows written before they existed.
+    Rows in BASE_CURRENCY are updated with one statement per table; other
+    currencies are converted with the rate in effect on each row's date.
+    Rows whose currency has no recorded rate are left untouched and counted
+    under "<table>_missing_rate". Returns the number of rows updated per table.
+    """
+    counts = {}
+    for model, (date_attribute, amounts) in CONVERTED_AMOUNTS.items():
+        table = model.__tablename__
+        primary_key = model.__mapper__.primary_key[0]
+        pending = model.fx_rate.is_(None)
+        in_base_currency = or_(model.currency.is_(None), model.currency == BASE_CURRENCY)
+
+        result = db.execute(
+            update(model).where(pending, in_base_currency).values(
+                fx_rate=1,
+                **{base: getattr(model, amount) for amount, base in amounts.items()}
+            ).execution_options(synchronize_session=False)
+        )
+        updated = result.rowcount
+
+        rows = db.execute(
+            select(primary_key, model.currency, getattr(model, date_attribute), *[getattr(model, a) for a in amounts])
+            .where(pending, ~in_base_currency)
+        ).all()
+        rates: Dict[tuple, Optional[Decimal]] = {}
+        missing = 0
+        changes = []
+        for row_id, currency, at, *values in rows:
+            day = at.date() if isinstance(at, datetime) else (at or date.today())
+            if (currency, day) not in rates:
+                try:
+                    rates[(currency, day)] = exchange_rate(db, currency, day)
+                except MissingExchangeRateError:
+                    rates[(currency, day)] = None
+            rate = rates[(currency, day)]
+            if rate is None:
+                missing += 1
+                continue
+            changes.append({
+                primary_key.key: row_id,
+                "fx_rate": rate,
+                **{base: to_base(value, rate) for base, value in zip(amounts.values(), values)}
+            })
+
+        for start in range(0, len(changes), batch_size):
+            db.execute(update(model), changes[start:start + batch_size])
+        updated += len(changes)
+        db.commit()
+
+        counts[table] = updated
+        if missing:
+            counts[f"{table}_missing_rate"] = missing
+            logger.warning(f"{missing} rows of {table} have no exchange rate and were not converted")
+    return counts
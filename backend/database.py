@@ -1,11 +1,15 @@
 from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 from dotenv import load_dotenv
 import os
 import logging
 from dataclasses import dataclass
 
+from pool_metrics import InstrumentedAsyncQueuePool, InstrumentedQueuePool
+
 # Set up logging to help us understand database operations
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -26,6 +30,17 @@ class DatabaseSettings:
     DB_HOST: str = os.getenv('DB_HOST', 'localhost')
     DB_PORT: str = os.getenv('DB_PORT', '5432')
     DB_NAME: str = os.getenv('DB_NAME', 'yanstore')
+    # Connection pool settings. Each process (gunicorn worker) gets its own sync and
+    # async pool, so the database sees up to
+    # workers * 2 * (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections (see gunicorn.conf.py).
+    # DB_POOL_MODE=null opens a connection per checkout, for use behind PgBouncer.
+    DB_POOL_MODE: str = os.getenv('DB_POOL_MODE', 'queue')
+    DB_POOL_SIZE: int = int(os.getenv('DB_POOL_SIZE', '5'))
+    DB_MAX_OVERFLOW: int = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+    DB_POOL_TIMEOUT: float = float(os.getenv('DB_POOL_TIMEOUT', '30'))
+    DB_POOL_RECYCLE: int = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+    DB_STATEMENT_TIMEOUT_MS: int = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', '0'))
+    DB_ECHO: bool = os.getenv('DB_ECHO', 'false').lower() == 'true'
 
     def validate(self):
         """Validate that all required settings are present"""
@@ -35,6 +50,8 @@ class DatabaseSettings:
                 missing.append(field)
         if missing:
             raise ValueError(f"Missing required database settings: {', '.join(missing)}")
+        if self.DB_POOL_MODE not in ('queue', 'null'):
+            raise ValueError(f"DB_POOL_MODE must be 'queue' or 'null', got '{self.DB_POOL_MODE}'")
 
 # Create settings instance and validate
 settings = DatabaseSettings()
@@ -48,25 +65,44 @@ except ValueError as e:
 logger.info(f"Database Configuration - Host: {settings.DB_HOST}, "
             f"Port: {settings.DB_PORT}, Database: {settings.DB_NAME}, "
             f"User: {settings.DB_USER}")
+logger.info(f"Connection pool - Mode: {settings.DB_POOL_MODE}, Size: {settings.DB_POOL_SIZE}, "
+            f"Overflow: {settings.DB_MAX_OVERFLOW}, Recycle: {settings.DB_POOL_RECYCLE}s, "
+            f"Statement timeout: {settings.DB_STATEMENT_TIMEOUT_MS}ms")
+
+def _pool_options(queue_pool_class) -> dict:
+    """Engine keyword arguments for the configured pooling mode"""
+    if settings.DB_POOL_MODE == 'null':
+        return {"poolclass": NullPool}
+    return {
+        "poolclass": queue_pool_class,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        # Enable automatic reconnection if connection is lost
+        "pool_pre_ping": True,
+    }
 
 # Construct the database URL using settings
 DATABASE_URL = f"postgresql://{settings.DB_USER}:{settings.DB_PASSWORD}@{settings.DB_HOST}:{settings.DB_PORT}/{settings.DB_NAME}"
 
 # Create the SQLAlchemy engine with important configuration options
+sync_connect_args = {
+    "application_name": f"YanStore Backend ({settings.ENV})",
+    "client_encoding": "utf8",
+    "connect_timeout": 10
+}
+if settings.DB_STATEMENT_TIMEOUT_MS:
+    sync_connect_args["options"] = f"-c statement_timeout={settings.DB_STATEMENT_TIMEOUT_MS}"
+
 engine = create_engine(
     DATABASE_URL,
-    # Echo SQL statements for debugging (only in development)
-    echo=settings.ENV == "development",
-    
-    # Enable automatic reconnection if connection is lost
-    pool_pre_ping=True,
-    
+    # Echo SQL statements for debugging (opt in with DB_ECHO=true)
+    echo=settings.DB_ECHO,
+
     # Connection arguments for better performance and security
-    connect_args={
-        "application_name": f"YanStore Backend ({settings.ENV})",
-        "client_encoding": "utf8",
-        "connect_timeout": 10
-    }
+    connect_args=sync_connect_args,
+    **_pool_options(InstrumentedQueuePool)
 )
 
 # Create session factory
@@ -76,6 +112,38 @@ SessionLocal = sessionmaker(
     autoflush=False
 )
 
+# Async engine used by the read-heavy endpoints, so they do not hold a worker
+# thread while waiting on the database. Scripts and write endpoints keep
+# using the sync engine above.
+ASYNC_DATABASE_URL = f"postgresql+asyncpg://{settings.DB_USER}:{settings.DB_PASSWORD}@{settings.DB_HOST}:{settings.DB_PORT}/{settings.DB_NAME}"
+
+async_connect_args = {
+    "server_settings": {"application_name": f"YanStore Backend async ({settings.ENV})"},
+    "timeout": 10
+}
+if settings.DB_STATEMENT_TIMEOUT_MS:
+    async_connect_args["server_settings"]["statement_timeout"] = str(settings.DB_STATEMENT_TIMEOUT_MS)
+if settings.DB_POOL_MODE == 'null':
+    # PgBouncer in transaction mode cannot keep prepared statements across transactions
+    async_connect_args["statement_cache_size"] = 0
+    async_connect_args["prepared_statement_cache_size"] = 0
+
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    echo=settings.DB_ECHO,
+    connect_args=async_connect_args,
+    **_pool_options(InstrumentedAsyncQueuePool)
+)
+
+# expire_on_commit is disabled because async sessions cannot lazy load
+# attributes once a response is being serialized
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+
 # Create base class for declarative models
 Base = declarative_base()
 
@@ -95,6 +163,10 @@ def init_db():
             if not table_exists:
                 logger.info("Tables don't exist. Creating new tables...")
                 Base.metadata.create_all(bind=engine)
+                if engine.dialect.name == "postgresql":
+                    from search import create_search_schema
+                    create_search_schema(connection)
+                    connection.commit()
                 logger.info("Created new tables successfully")
                 # Create default categories after tables are created
                 create_default_categories()
@@ -168,6 +240,22 @@ def get_db():
     finally:
         db.close()
 
+def get_session_factory():
+    """
+    Dependency returning the session factory itself, for responses that stream
+    after the request's dependencies have been closed and need their own session.
+    """
+    return SessionLocal
+
+async def get_async_db():
+    """
+    Dependency yielding an AsyncSession for each request.
+    Relationships are not lazy loaded in async code, so queries must eager
+    load everything the response needs.
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
+
 def verify_db_connection():
     """
     Verify that we can connect to the database.
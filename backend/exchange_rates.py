@@ -0,0 +1,297 @@
+import asyncio
+import logging
+import os
+import re
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from decimal import Decimal
+from functools import lru_cache
+from typing import Callable, Dict, Optional
+
+import httpx
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+import models
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_API_URL = "https://v6.exchangerate-api.com/v6/{api_key}/latest/{base_currency}"
+
+# Served when the provider has never been reached and nothing is stored yet
+FALLBACK_RATES = {"COP": 4000, "EUR": 0.92, "GBP": 0.78}
+
+# ISO 4217 currency codes; anything else is never sent to the provider
+CURRENCY_CODE = re.compile(r"^[A-Z]{3}$")
+
+
+class ExchangeRateError(Exception):
+    """Raised when the rate provider cannot be reached or returns an unusable response"""
+
+
+@dataclass
+class RateSnapshot:
+    base_currency: str
+    rates: Dict[str, float]
+    effective_at: datetime
+    fetched_at: datetime
+
+    def age(self, now: Optional[datetime] = None) -> float:
+        """Seconds since the rates were fetched"""
+        return ((now or datetime.now(timezone.utc)) - self.fetched_at).total_seconds()
+
+
+def _utc(value: datetime) -> datetime:
+    # SQLite hands timezone-aware columns back as naive datetimes
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def _upsert_insert(db: Session):
+    if db.bind.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
+
+def load_snapshots(db: Session) -> Dict[str, RateSnapshot]:
+    """Last stored rates of every base currency"""
+    return {
+        row.base_currency: RateSnapshot(row.base_currency, row.rates, _utc(row.effective_at), _utc(row.fetched_at))
+        for row in db.scalars(select(models.ExchangeRateSnapshot))
+    }
+
+
+def save_snapshot(db: Session, snapshot: RateSnapshot) -> None:
+    """
+    Store a freshly fetched snapshot and add its rates to the history.
+    The history gets one row per currency each time the provider publishes
+    new rates; refetching unchanged rates does not add rows.
+    """
+    insert = _upsert_insert(db)
+    values = {
+        "base_currency": snapshot.base_currency,
+        "rates": snapshot.rates,
+        "effective_at": snapshot.effective_at,
+        "fetched_at": snapshot.fetched_at,
+    }
+    statement = insert(models.ExchangeRateSnapshot).values(**values)
+    db.execute(statement.on_conflict_do_update(
+        index_elements=[models.ExchangeRateSnapshot.base_currency],
+        set_={key: statement.excluded[key] for key in ("rates", "effective_at", "fetched_at")}
+    ))
+    db.execute(
+        insert(models.ExchangeRateHistory).on_conflict_do_nothing(
+            index_elements=["base_currency", "currency", "effective_at"]
+        ),
+        [
+            {
+                "base_currency": snapshot.base_currency,
+                "currency": currency,
+                "rate": Decimal(str(rate)),
+                "effective_at": snapshot.effective_at,
+            }
+            for currency, rate in snapshot.rates.items()
+        ]
+    )
+    db.commit()
+
+
+def rate_at(db: Session, currency: str, at: datetime, base_currency: str = "USD") -> Optional[Decimal]:
+    """Rate of a currency that was in effect at a point in time, None when no earlier rate is recorded"""
+    if currency == base_currency:
+        return Decimal(1)
+    return db.scalar(
+        select(models.ExchangeRateHistory.rate).where(
+            models.ExchangeRateHistory.base_currency == base_currency,
+            models.ExchangeRateHistory.currency == currency,
+            models.ExchangeRateHistory.effective_at <= at
+        ).order_by(models.ExchangeRateHistory.effective_at.desc()).limit(1)
+    )
+
+
+class ExchangeRateService:
+    """
+    Keeps exchange rates in memory and refreshes them from the provider.
+
+    Rates younger than `max_age` seconds are served as they are. Older rates
+    are still served immediately while a refresh runs in the background
+    (stale-while-revalidate), so a slow or failing provider never delays a
+    request once any rates are known. Concurrent refreshes of the same base
+    currency share one outbound request. A background task also refreshes
+    every known base currency every `refresh_interval` seconds.
+
+    Every successful fetch is persisted (see save_snapshot), and the stored
+    snapshots are loaded on startup so rates survive restarts. When the first
+    fetch of a base currency fails (provider down, unknown code), the failure
+    is remembered for `failure_ttl` seconds and requests for it get None
+    without another outbound call.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        api_url: str = DEFAULT_API_URL,
+        api_key: Optional[str] = None,
+        max_age: float = 3600,
+        refresh_interval: float = 3600,
+        timeout: float = 10,
+        failure_ttl: float = 300
+    ):
+        self.session_factory = session_factory
+        self.api_url = api_url
+        self.api_key = api_key
+        self.max_age = max_age
+        self.refresh_interval = refresh_interval
+        self.timeout = timeout
+        self.failure_ttl = failure_ttl
+        self.snapshots: Dict[str, RateSnapshot] = {}
+        self._failed_at: Dict[str, float] = {}
+        self._loaded = False
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_loop = None
+        self._refreshes: Dict[str, asyncio.Task] = {}
+        self._refresher: Optional[asyncio.Task] = None
+
+    def _http_client(self) -> httpx.AsyncClient:
+        """Pooled client shared by every refresh; clients are bound to the event loop that created them"""
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=4, max_keepalive_connections=2)
+            )
+            self._client_loop = loop
+        return self._client
+
+    async def _load(self) -> None:
+        if self._loaded:
+            return
+        try:
+            stored = await asyncio.to_thread(self._run_in_session, load_snapshots)
+        except Exception as e:
+            logger.error(f"Error loading stored exchange rates: {str(e)}")
+            return
+        self._loaded = True
+        for base_currency, snapshot in stored.items():
+            current = self.snapshots.get(base_currency)
+            if current is None or current.fetched_at < snapshot.fetched_at:
+                self.snapshots[base_currency] = snapshot
+
+    def _run_in_session(self, function, *args):
+        with self.session_factory() as db:
+            return function(db, *args)
+
+    async def fetch(self, base_currency: str) -> RateSnapshot:
+        """Fetch the current rates from the provider"""
+        url = self.api_url.format(api_key=self.api_key, base_currency=base_currency)
+        try:
+            response = await self._http_client().get(url)
+        except httpx.HTTPError as e:
+            raise ExchangeRateError(f"Request to the rate provider failed: {e}")
+        if response.status_code != 200:
+            raise ExchangeRateError(f"Rate provider returned HTTP {response.status_code}")
+
+        try:
+            data = response.json()
+        except ValueError as e:
+            raise ExchangeRateError(f"Rate provider returned a body that is not JSON: {e}")
+        if not isinstance(data, dict):
+            raise ExchangeRateError("Rate provider returned an error: invalid response")
+        rates = data.get("conversion_rates")
+        if data.get("result") != "success" or not isinstance(rates, dict) or not rates:
+            raise ExchangeRateError(f"Rate provider returned an error: {data.get('error-type', 'invalid response')}")
+
+        fetched_at = datetime.now(timezone.utc)
+        updated = data.get("time_last_update_unix")
+        effective_at = datetime.fromtimestamp(updated, timezone.utc) if updated else fetched_at
+        return RateSnapshot(base_currency, rates, effective_at, fetched_at)
+
+    async def _refresh(self, base_currency: str) -> RateSnapshot:
+        snapshot = await self.fetch(base_currency)
+        self.snapshots[base_currency] = snapshot
+        try:
+            await asyncio.to_thread(self._run_in_session, save_snapshot, snapshot)
+        except Exception as e:
+            logger.error(f"Error saving exchange rates for {base_currency}: {str(e)}")
+        return snapshot
+
+    def refresh(self, base_currency: str) -> asyncio.Task:
+        """Start a refresh of one base currency, or join the one already running"""
+        task = self._refreshes.get(base_currency)
+        if task is None or task.done() or task.get_loop() is not asyncio.get_running_loop():
+            task = asyncio.create_task(self._refresh(base_currency))
+            task.add_done_callback(self._log_failed_refresh)
+            self._refreshes[base_currency] = task
+        return task
+
+    @staticmethod
+    def _log_failed_refresh(task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Error refreshing exchange rates: {str(task.exception())}")
+
+    async def get_rates(self, base_currency: str = "USD") -> Optional[RateSnapshot]:
+        """
+        Rates for a base currency, refreshing them in the background when stale.
+        Only waits for the provider when no rates are known at all, and returns
+        None if that first fetch fails or failed less than `failure_ttl` seconds ago.
+        """
+        await self._load()
+        snapshot = self.snapshots.get(base_currency)
+        if snapshot is None:
+            failed_at = self._failed_at.get(base_currency)
+            if failed_at is not None and time.monotonic() - failed_at < self.failure_ttl:
+                return None
+            try:
+                snapshot = await asyncio.shield(self.refresh(base_currency))
+            except ExchangeRateError:
+                self._failed_at[base_currency] = time.monotonic()
+                return None
+            self._failed_at.pop(base_currency, None)
+            return snapshot
+        if snapshot.age() >= self.max_age:
+            self.refresh(base_currency)
+        return snapshot
+
+    async def _refresh_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            for base_currency in list(self.snapshots) or ["USD"]:
+                try:
+                    await self.refresh(base_currency)
+                except Exception:
+                    pass  # Logged by the done callback; keep serving the last good rates
+
+    async def start(self) -> None:
+        """Load the stored rates and start the periodic refresh"""
+        await self._load()
+        if self._refresher is None:
+            self._refresher = asyncio.create_task(self._refresh_periodically())
+
+    async def stop(self) -> None:
+        if self._refresher is not None:
+            self._refresher.cancel()
+            self._refresher = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+@lru_cache(maxsize=1)
+def get_exchange_rate_service() -> ExchangeRateService:
+    """
+    Dependency returning the process-wide exchange rate service.
+    EXCHANGE_RATE_MAX_AGE and EXCHANGE_RATE_REFRESH_INTERVAL are in seconds
+    (both an hour by default; the provider publishes new rates daily), as is
+    EXCHANGE_RATE_FAILURE_TTL (five minutes by default).
+    """
+    from database import SessionLocal
+    return ExchangeRateService(
+        session_factory=SessionLocal,
+        api_url=os.getenv("EXCHANGE_RATE_API_URL", DEFAULT_API_URL),
+        api_key=os.getenv("EXCHANGE_RATE_API_KEY"),
+        max_age=float(os.getenv("EXCHANGE_RATE_MAX_AGE", "3600")),
+        refresh_interval=float(os.getenv("EXCHANGE_RATE_REFRESH_INTERVAL", "3600")),
+        failure_ttl=float(os.getenv("EXCHANGE_RATE_FAILURE_TTL", "300"))
+    )
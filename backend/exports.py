@@ -0,0 +1,168 @@
+import csv
+import io
+import json
+import zlib
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from typing import Callable, Iterator, Optional
+
+from sqlalchemy import DateTime, select
+from sqlalchemy.orm import Session
+
+import models
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+# Rows fetched per round trip from the server-side cursor
+EXPORT_FETCH_SIZE = 1000
+
+# Encoded output is buffered up to this size before being sent
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+
+def _instances_export():
+    return select(
+        models.ProductInstance.instance_id,
+        models.ProductInstance.product_id,
+        models.Product.sku,
+        models.Product.name,
+        models.Product.category_id,
+        models.ProductInstance.base_cost,
+        models.ProductInstance.status,
+        models.ProductInstance.condition,
+        models.ProductInstance.location,
+        models.ProductInstance.purchase_date,
+        models.ProductInstance.created_at,
+    ).join(
+        models.Product, models.Product.product_id == models.ProductInstance.product_id
+    ).order_by(models.ProductInstance.instance_id)
+
+
+def _sales_export():
+    return select(
+        models.Sale.sale_id,
+        models.Sale.product_id,
+        models.Product.sku,
+        models.Product.name,
+        models.Sale.sale_price,
+        models.Sale.currency,
+        models.Sale.fx_rate,
+        models.Sale.sale_price_base,
+        models.Sale.sale_date,
+        models.Sale.payment_method,
+        models.Sale.notes,
+        models.Sale.created_at,
+    ).join(
+        models.Product, models.Product.product_id == models.Sale.product_id
+    ).order_by(models.Sale.sale_id)
+
+
+def _products_export():
+    return select(
+        models.Product.product_id,
+        models.Product.sku,
+        models.Product.name,
+        models.Product.description,
+        models.Product.category_id,
+        models.Product.event_id,
+        models.Product.condition,
+        models.Product.location,
+        models.Product.is_active,
+        models.Product.purchase_date,
+        models.Product.obtained_method,
+        models.Product.created_at,
+    ).order_by(models.Product.product_id)
+
+
+def _pnl_export():
+    columns = [
+        column for column in models.ProfitAndLoss.__table__.columns
+        if column.name not in ("created_at", "updated_at")
+    ]
+    return select(*columns).order_by(models.ProfitAndLoss.month)
+
+
+# Dataset name -> (statement builder, column filtered by start_date/end_date)
+EXPORT_DATASETS = {
+    "instances": (_instances_export, models.ProductInstance.purchase_date),
+    "sales": (_sales_export, models.Sale.sale_date),
+    "products": (_products_export, models.Product.purchase_date),
+    "pnl": (_pnl_export, models.ProfitAndLoss.month),
+}
+
+
+def build_export_statement(dataset: str, start_date: Optional[date] = None, end_date: Optional[date] = None):
+    """Select statement of a dataset, optionally limited to a date range (inclusive)"""
+    build, date_column = EXPORT_DATASETS[dataset]
+    statement = build()
+    if start_date:
+        statement = statement.where(date_column >= start_date)
+    if end_date:
+        if isinstance(date_column.type, DateTime):
+            # Include the whole end day for timestamp columns
+            statement = statement.where(date_column < datetime.combine(end_date + timedelta(days=1), time.min))
+        else:
+            statement = statement.where(date_column <= end_date)
+    return statement
+
+
+def _json_value(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def _encode_rows(rows, columns, export_format: str) -> Iterator[bytes]:
+    """Serialize rows as CSV or NDJSON, yielding chunks of roughly EXPORT_CHUNK_SIZE bytes"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if export_format == "csv" else None
+    if writer:
+        writer.writerow(columns)
+
+    for row in rows:
+        if writer:
+            writer.writerow(row)
+        else:
+            buffer.write(json.dumps({column: _json_value(value) for column, value in zip(columns, row)}))
+            buffer.write("\n")
+        if buffer.tell() >= EXPORT_CHUNK_SIZE:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def _gzip(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def stream_export(
+    session_factory: Callable[[], Session],
+    statement,
+    export_format: str,
+    gzip: bool = False
+) -> Iterator[bytes]:
+    """
+    Stream the rows of a statement as CSV or NDJSON bytes.
+    Rows are fetched through a server-side cursor EXPORT_FETCH_SIZE at a time,
+    so memory use does not grow with the number of exported rows. The session
+    is opened here because the stream outlives the request's dependencies.
+    """
+    def chunks():
+        with session_factory() as db:
+            result = db.execute(statement.execution_options(stream_results=True, yield_per=EXPORT_FETCH_SIZE))
+            yield from _encode_rows(result, list(result.keys()), export_format)
+
+    return _gzip(chunks()) if gzip else chunks()
@@ -0,0 +1,55 @@
+"""
+Gunicorn settings for running the API with uvicorn workers:
+
+    gunicorn main:app -c gunicorn.conf.py
+
+Every worker opens two connection pools (the sync engine and the async
+engine in database.py), so the database can see up to
+
+    workers * 2 * (DB_POOL_SIZE + DB_MAX_OVERFLOW)
+
+connections. WEB_CONCURRENCY sets the worker count explicitly; otherwise it
+is derived from DB_MAX_CONNECTIONS (the connection limit of the database
+plan, minus what other clients need), or 2 when that is not set either. The
+host's CPU count is deliberately ignored: on a container host it says nothing
+about what the database can accept.
+"""
+import logging
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+worker_class = "uvicorn.workers.UvicornWorker"
+
+DEFAULT_WORKERS = 2
+
+
+def _connections_per_worker() -> int:
+    return 2 * (int(os.getenv("DB_POOL_SIZE", "5")) + int(os.getenv("DB_MAX_OVERFLOW", "10")))
+
+
+def _worker_count() -> int:
+    if os.getenv("WEB_CONCURRENCY"):
+        return int(os.environ["WEB_CONCURRENCY"])
+    if os.getenv("DB_MAX_CONNECTIONS"):
+        return max(1, int(os.environ["DB_MAX_CONNECTIONS"]) // _connections_per_worker())
+    return DEFAULT_WORKERS
+
+
+workers = _worker_count()
+
+if os.getenv("DB_MAX_CONNECTIONS") and workers * _connections_per_worker() > int(os.environ["DB_MAX_CONNECTIONS"]):
+    logging.getLogger(__name__).warning(
+        f"{workers} workers can open {workers * _connections_per_worker()} database connections, "
+        f"more than DB_MAX_CONNECTIONS={os.environ['DB_MAX_CONNECTIONS']}"
+    )
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = 30
+keepalive = 5
+
+# Restart workers periodically to contain memory growth
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "2000"))
+max_requests_jitter = 200
+
+accesslog = "-"
+errorlog = "-"
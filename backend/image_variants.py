@@ -0,0 +1,99 @@
+import hashlib
+import logging
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from io import BytesIO
+from typing import Dict, Optional
+
+from storage import BlobStorage
+
+logger = logging.getLogger(__name__)
+
+# Longest side in pixels of each resized rendition
+IMAGE_VARIANT_SIZES = {
+    "thumb": 100,
+    "medium": 600,
+}
+
+# Output formats a variant can be rendered in, mapped to their media type
+IMAGE_VARIANT_FORMATS = {
+    "jpeg": "image/jpeg",
+    "png": "image/png",
+    "webp": "image/webp",
+}
+
+# Resizing is CPU bound, so it runs on a small dedicated pool instead of the
+# request threads; the pool size bounds how many images are decoded at once.
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("IMAGE_VARIANT_WORKERS", "2")),
+    thread_name_prefix="image-variants"
+)
+_in_flight: Dict[str, Future] = {}
+_in_flight_lock = threading.Lock()
+
+
+def variant_key(source_hash: str, size: str, image_format: str) -> str:
+    """
+    Storage key of a rendition. It is derived from the source content hash and
+    the rendering parameters, so it is as stable as a content address and can be
+    looked up without a database table.
+    """
+    return hashlib.sha256(f"{source_hash}:{size}:{image_format}".encode()).hexdigest()
+
+
+def _render_variant(storage: BlobStorage, source_hash: str, size: str, image_format: str) -> str:
+    from PIL import Image
+
+    key = variant_key(source_hash, size, image_format)
+    if storage.exists(key):
+        return key
+
+    with storage.open(source_hash) as source:
+        image = Image.open(source)
+        image.load()
+
+    image.thumbnail((IMAGE_VARIANT_SIZES[size], IMAGE_VARIANT_SIZES[size]))
+    if image_format == "jpeg" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+
+    output = BytesIO()
+    image.save(output, format=image_format.upper(), quality=85)
+    storage.put_as(key, output.getvalue())
+    logger.info(f"Generated {size}/{image_format} variant of image {source_hash}")
+    return key
+
+
+def get_or_create_variant(storage: BlobStorage, source_hash: str, size: str, image_format: str) -> Optional[str]:
+    """
+    Return the storage key of a rendition, generating it on the worker pool the
+    first time it is requested. Concurrent requests for the same rendition share
+    one rendering job. Returns None when Pillow is not installed.
+    """
+    key = variant_key(source_hash, size, image_format)
+    if storage.exists(key):
+        return key
+
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        logger.warning("Pillow is not installed; serving original images instead of variants")
+        return None
+
+    with _in_flight_lock:
+        future = _in_flight.get(key)
+        if future is None:
+            future = _executor.submit(_render_variant, storage, source_hash, size, image_format)
+            _in_flight[key] = future
+            future.add_done_callback(lambda _: _in_flight.pop(key, None))
+    return future.result()
+
+
+def generate_default_variants(storage: BlobStorage, source_hash: str, source_format: str) -> None:
+    """Pre-render every size in the source format and as WebP, used right after an upload"""
+    for size in IMAGE_VARIANT_SIZES:
+        for image_format in {source_format, "webp"}:
+            try:
+                get_or_create_variant(storage, source_hash, size, image_format)
+            except Exception as e:
+                logger.error(f"Failed to generate {size}/{image_format} variant of image {source_hash}: {str(e)}")
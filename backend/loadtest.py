@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Simple load test for the read endpoints of the API.
+
+Fires concurrent GET requests at a running server for a fixed duration and
+reports requests per second and latency percentiles for each endpoint.
+To compare two versions, start each one under the same uvicorn settings
+against the same database and pass the older one as --baseline, e.g.:
+
+    git worktree add ../yanstore-baseline <baseline commit>
+    (cd ../yanstore-baseline/backend && uvicorn main:app --port 8001 --workers 1)
+    uvicorn main:app --port 8000 --workers 1
+    python loadtest.py --url http://127.0.0.1:8000 --baseline http://127.0.0.1:8001 --duration 20
+
+With --baseline every endpoint is loaded on both servers in turn and the
+results are printed side by side, ready to paste into a commit message.
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+DEFAULT_ENDPOINTS = [
+    "/products/",
+    "/categories/",
+    "/events/",
+    "/instances/?limit=100",
+    "/sales/?limit=100",
+]
+
+
+async def _worker(client: httpx.AsyncClient, endpoint: str, deadline: float, latencies: list, errors: list):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            response = await client.get(endpoint)
+            if response.status_code >= 400:
+                errors.append(response.status_code)
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+        latencies.append(time.perf_counter() - started)
+
+
+async def run_endpoint(url: str, endpoint: str, concurrency: int, duration: float) -> dict:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    latencies, errors = [], []
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30) as client:
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(*[
+            _worker(client, endpoint, deadline, latencies, errors) for _ in range(concurrency)
+        ])
+
+    latencies.sort()
+    return {
+        "endpoint": endpoint,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "rps": len(latencies) / duration,
+        "p50_ms": statistics.median(latencies) * 1000 if latencies else 0,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000 if latencies else 0,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='Load test the YanStore read endpoints')
+    parser.add_argument('--url', default='http://127.0.0.1:8000', help='Base URL of the running API')
+    parser.add_argument('--baseline', help='Base URL of a second server (the version to compare against)')
+    parser.add_argument('--concurrency', type=int, default=50, help='Concurrent requests per endpoint')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds to load each endpoint')
+    parser.add_argument('--endpoint', action='append', help='Endpoint to test (repeatable); defaults to the hot reads')
+    args = parser.parse_args()
+
+    if args.baseline is None:
+        print(f"{'endpoint':30} {'req/s':>10} {'p50 ms':>10} {'p95 ms':>10} {'errors':>8}")
+        for endpoint in args.endpoint or DEFAULT_ENDPOINTS:
+            result = await run_endpoint(args.url, endpoint, args.concurrency, args.duration)
+            print(f"{result['endpoint']:30} {result['rps']:10.1f} {result['p50_ms']:10.1f} "
+                  f"{result['p95_ms']:10.1f} {result['errors']:8}")
+        return
+
+    print(f"{'endpoint':30} {'version':>9} {'req/s':>10} {'p50 ms':>10} {'p95 ms':>10} {'errors':>8}")
+    for endpoint in args.endpoint or DEFAULT_ENDPOINTS:
+        for version, url in (("baseline", args.baseline), ("current", args.url)):
+            result = await run_endpoint(url, endpoint, args.concurrency, args.duration)
+            print(f"{result['endpoint']:30} {version:>9} {result['rps']:10.1f} {result['p50_ms']:10.1f} "
+                  f"{result['p95_ms']:10.1f} {result['errors']:8}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
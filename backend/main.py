@@ -1,20 +1,45 @@
-from fastapi import FastAPI, Depends, HTTPException, Form, File, UploadFile
+from fastapi import FastAPI, Depends, HTTPException, Form, File, UploadFile, Query, Request, BackgroundTasks
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import extract
+from pydantic import TypeAdapter
+from sqlalchemy.orm import Session, joinedload, contains_eager, undefer
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import Integer, any_, case, cast, func, insert, literal, select, update
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
 from typing import List, Optional
-from datetime import datetime, date, timedelta
+from datetime import datetime, date, timedelta, timezone
+from decimal import Decimal
+from email.utils import format_datetime, parsedate_to_datetime
 import logging
 import argparse
+import csv
+from collections import defaultdict
+import json
 import os
+import re
 
 from fastapi import Response, HTTPException
-from fastapi.responses import StreamingResponse
-from io import BytesIO
+from fastapi.responses import StreamingResponse, JSONResponse, FileResponse
 
 # Import modules
-from database import get_db, init_db, engine
+from database import get_db, get_async_db, get_session_factory, init_db, engine, async_engine, settings as db_settings
+from pool_metrics import pool_status
+from storage import BlobStorage, BlobTooLargeError, get_blob_storage, CHUNK_SIZE as STORAGE_CHUNK_SIZE
+from uploads import MultipartSizeLimitMiddleware, StoredUpload, UnsupportedUploadError, store_image_upload
+from image_variants import IMAGE_VARIANT_SIZES, IMAGE_VARIANT_FORMATS, get_or_create_variant, generate_default_variants
+from pnl import compute_profit_and_loss, save_profit_and_loss, month_starts
+from cache import TTLCache, create_reference_cache, etag_for
+from sales_rollup import ROLLUP_PERIODS, ROLLUP_GROUPS, add_sales_to_rollup, remove_sales_from_rollup, rebuild_sales_rollup
+from product_import import IMPORT_FORMATS, DEFAULT_IMPORT_BATCH_SIZE, ProductImporter, detect_import_format, iter_import_rows
+from skus import allocate_skus, sku_prefix
+from exchange_rates import CURRENCY_CODE, FALLBACK_RATES, ExchangeRateService, get_exchange_rate_service, rate_at
+from currency import MissingExchangeRateError, apply_base_amounts, exchange_rate, to_base
+from search import search_products
+from exports import EXPORT_DATASETS, EXPORT_FORMATS, build_export_statement, stream_export
+from rentability import RENTABILITY_SORT_FIELDS, refresh_product_rentability, refresh_missing_rentability
 from models import Base
 import models
 import schema
@@ -30,6 +55,11 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Refuse oversized uploads from their Content-Length, before Starlette spools
+# them to disk; bulk imports are only bounded by their row validation. Added
+# before CORS so that its 413 responses still carry the CORS headers.
+app.add_middleware(MultipartSizeLimitMiddleware, exempt_paths=("/products/import",))
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -45,6 +75,7 @@ app.add_middleware(
     expose_headers=["*"]
 )
 
+
 # Initialize database tables on startup
 @app.on_event("startup")
 async def startup_event():
@@ -54,6 +85,13 @@ async def startup_event():
     except Exception as e:
         logger.error(f"Database initialization failed: {str(e)}")
         raise
+    # Fail the boot rather than the first upload when blob storage is misconfigured
+    get_blob_storage()
+    await get_exchange_rate_service().start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await get_exchange_rate_service().stop()
 
 
 @app.get("/")
@@ -71,6 +109,55 @@ async def health_check():
     """Check if the API is running and database is connected"""
     return {"status": "healthy", "version": "1.0.0"}
 
+@app.get("/metrics/db-pool")
+async def db_pool_metrics():
+    """
+    Connection pool occupancy and checkout wait times of this worker process.
+    Rising wait times or timeouts mean requests are queuing for connections.
+    """
+    return {
+        "pid": os.getpid(),
+        "mode": db_settings.DB_POOL_MODE,
+        "sync": pool_status(engine),
+        "async": pool_status(async_engine.sync_engine),
+    }
+
+# Categories, events and suppliers change a few times a month but are listed on
+# every form load, so their list responses are cached as encoded JSON
+reference_cache = create_reference_cache()
+
+def _encode_reference_list(rows, response_schema) -> bytes:
+    """Serialize ORM rows the way the endpoint's response_model would"""
+    adapter = TypeAdapter(List[response_schema])
+    return adapter.dump_json(adapter.validate_python(rows, from_attributes=True))
+
+def _reference_response(request: Request, body: bytes) -> Response:
+    """
+    Send a cached list with a strong ETag. Cache-Control: no-cache makes browsers
+    revalidate on every use, which costs a 304 while the data is unchanged.
+    """
+    etag = etag_for(body)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if _is_not_modified(request, etag, None):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def _apply_base_amounts(db: Session, row) -> None:
+    """Store the exchange rate and base-currency amounts of a row, answering 400 when no rate is known"""
+    try:
+        apply_base_amounts(db, row)
+    except MissingExchangeRateError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _store_image_upload(storage: BlobStorage, upload: UploadFile, unsupported_detail: str) -> StoredUpload:
+    """Stream an uploaded JPG or PNG into blob storage, answering 413 when too large and 400 for other files"""
+    try:
+        return store_image_upload(storage, upload)
+    except BlobTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UnsupportedUploadError:
+        raise HTTPException(status_code=400, detail=unsupported_detail)
+
 # Event endpoints
 @app.post("/events/", response_model=schema.EventResponse)
 def create_event(
@@ -83,6 +170,7 @@ def create_event(
         db.add(db_event)
         db.commit()
         db.refresh(db_event)
+        reference_cache.invalidate("events")
         return db_event
     except IntegrityError as e:
         db.rollback()
@@ -92,26 +180,55 @@ def create_event(
         )
 
 @app.get("/events/", response_model=List[schema.EventResponse])
-def list_events(
+async def list_events(
+    request: Request,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """List all events"""
-    events = db.query(models.Event).offset(skip).limit(limit).all()
-    return events
+    cache_key = f"{skip}:{limit}"
+    body = reference_cache.get("events", cache_key)
+    if body is None:
+        result = await db.execute(
+            select(models.Event).order_by(models.Event.event_id).offset(skip).limit(limit)
+        )
+        body = _encode_reference_list(result.scalars().all(), schema.EventResponse)
+        reference_cache.set("events", cache_key, body)
+    return _reference_response(request, body)
 
 @app.get("/events/{event_id}", response_model=schema.EventResponse)
-def get_event(
+async def get_event(
     event_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get a specific event by ID"""
-    event = db.query(models.Event).filter(models.Event.event_id == event_id).first()
+    event = await db.get(models.Event, event_id)
     if not event:
         raise HTTPException(status_code=404, detail="Event not found")
     return event
 
+@app.patch("/events/calculate-end-budget")
+def calculate_events_end_budget(
+    request_data: schema.EventBudgetBatchRequest,
+    db: Session = Depends(get_db)
+):
+    """Recalculate and update the end budget for many events in one request"""
+    event_ids = list(dict.fromkeys(request_data.event_ids))
+    results = _calculate_end_budgets(db, event_ids)
+
+    found_event_ids = {r["event_id"] for r in results}
+    errors = [
+        {"event_id": event_id, "error": "Event not found"}
+        for event_id in event_ids if event_id not in found_event_ids
+    ]
+
+    return {
+        "updated_count": len(results),
+        "results": results,
+        "errors": errors
+    }
+
 @app.patch("/events/{event_id}", response_model=schema.EventResponse)
 def update_event(
     event_id: int,
@@ -129,6 +246,7 @@ def update_event(
     
     db.commit()
     db.refresh(db_event)
+    reference_cache.invalidate("events")
     return db_event
 
 @app.delete("/events/{event_id}", response_model=dict)
@@ -156,6 +274,7 @@ def delete_event(
     try:
         db.delete(db_event)
         db.commit()
+        reference_cache.invalidate("events")
         
         return {
             "success": True, 
@@ -169,6 +288,16 @@ def delete_event(
             detail=f"An error occurred while deleting the event: {str(e)}"
         )
 
+def _event_products_query(event_id: int):
+    """Active products of an event, with their image counts"""
+    return select(models.Product).options(
+        undefer(models.Product.image_count),
+        undefer(models.Product.image_hash)
+    ).where(
+        models.Product.event_id == event_id,
+        models.Product.is_active == True
+    ).order_by(models.Product.product_id)
+
 @app.get("/events/{event_id}/products", response_model=List[schema.ProductResponse])
 def get_event_products(
     event_id: int,
@@ -177,11 +306,81 @@ def get_event_products(
     db: Session = Depends(get_db)
 ):
     """Get all products associated with an event"""
-    products = db.query(models.Product).filter(
-        models.Product.event_id == event_id,
+    return db.scalars(_event_products_query(event_id).offset(skip).limit(limit)).all()
+
+def _calculate_end_budgets(db: Session, event_ids: List[int]) -> List[dict]:
+    """
+    Calculate end budgets for the given events in a single aggregate query.
+    Sums instance base costs of active products and travel expenses per event
+    with correlated subqueries, keeping Decimal precision, then writes the
+    resulting end budgets back with one bulk UPDATE.
+    Expenses recorded before base-currency amounts existed (amount_base still
+    NULL until backfill_base_currency.py runs) are converted on the way and
+    stored; without any recorded rate their amount is counted unconverted.
+    """
+    if not event_ids:
+        return []
+
+    unconverted_expenses = defaultdict(Decimal)
+    pending_expenses = db.query(models.TravelExpense).filter(
+        models.TravelExpense.event_id.in_(event_ids),
+        models.TravelExpense.amount_base.is_(None)
+    ).all()
+    for expense in pending_expenses:
+        try:
+            apply_base_amounts(db, expense)
+        except MissingExchangeRateError:
+            logger.warning(f"No {expense.currency} exchange rate for travel expense {expense.expense_id}, counted unconverted")
+            unconverted_expenses[expense.event_id] += Decimal(expense.amount)
+    if pending_expenses:
+        db.flush()
+
+    products_subquery = db.query(
+        func.coalesce(func.sum(models.ProductInstance.base_cost), 0)
+    ).join(
+        models.Product, models.ProductInstance.product_id == models.Product.product_id
+    ).filter(
+        models.Product.event_id == models.Event.event_id,
         models.Product.is_active == True
-    ).offset(skip).limit(limit).all()
-    return products
+    ).correlate(models.Event).scalar_subquery()
+
+    expenses_subquery = db.query(
+        func.coalesce(func.sum(models.TravelExpense.amount_base), 0)
+    ).filter(
+        models.TravelExpense.event_id == models.Event.event_id
+    ).correlate(models.Event).scalar_subquery()
+
+    rows = db.query(
+        models.Event.event_id,
+        models.Event.initial_budget,
+        products_subquery.label("total_spent_on_products"),
+        expenses_subquery.label("total_travel_expenses")
+    ).filter(models.Event.event_id.in_(event_ids)).all()
+
+    results = []
+    for event_id, initial_budget, total_spent, total_travel_expenses in rows:
+        initial_budget = Decimal(initial_budget)
+        total_spent = Decimal(total_spent)
+        total_travel_expenses = Decimal(total_travel_expenses) + unconverted_expenses[event_id]
+        end_budget = initial_budget - total_spent - total_travel_expenses
+        results.append({
+            "event_id": event_id,
+            "initial_budget": initial_budget,
+            "total_spent_on_products": total_spent,
+            "total_travel_expenses": total_travel_expenses,
+            "end_budget": end_budget,
+            "calculation": f"${initial_budget:.2f} - ${total_spent:.2f} - ${total_travel_expenses:.2f} = ${end_budget:.2f}"
+        })
+
+    if results:
+        db.execute(
+            update(models.Event),
+            [{"event_id": r["event_id"], "end_budget": r["end_budget"]} for r in results]
+        )
+        db.commit()
+        reference_cache.invalidate("events")
+
+    return results
 
 @app.patch("/events/{event_id}/calculate-end-budget")
 def calculate_event_end_budget(
@@ -189,74 +388,23 @@ def calculate_event_end_budget(
     db: Session = Depends(get_db)
 ):
     """Calculate and update the end budget for an event based on products purchased"""
-    db_event = db.query(models.Event).filter(models.Event.event_id == event_id).first()
-    if not db_event:
+    results = _calculate_end_budgets(db, [event_id])
+    if not results:
         raise HTTPException(status_code=404, detail="Event not found")
-    
-    # Get all products from this event
-    products = db.query(models.Product).filter(
-        models.Product.event_id == event_id,
-        models.Product.is_active == True
-    ).all()
-    
-    print(f"Found {len(products)} products for event {event_id}")
-    
-    # Calculate total spent on products (sum of base costs from product instances)
-    total_spent = 0
-    for product in products:
-        print(f"Processing product {product.product_id}: {product.name}")
-        instances = db.query(models.ProductInstance).filter(
-            models.ProductInstance.product_id == product.product_id
-        ).all()
-        
-        if instances:
-            for instance in instances:
-                product_cost = float(instance.base_cost)
-                total_spent += product_cost
-                print(f"  - Instance found: base_cost=${instance.base_cost}, total=${product_cost}")
-        else:
-            print(f"  - No instances found for product {product.product_id}")
-    
-    print(f"Total spent on products: ${total_spent}")
-    
-    # Calculate total travel expenses
-    travel_expenses = db.query(models.TravelExpense).filter(
-        models.TravelExpense.event_id == event_id
-    ).all()
-    
-    total_travel_expenses = sum(float(expense.amount) for expense in travel_expenses)
-    print(f"Total travel expenses: ${total_travel_expenses}")
-    
-    # Calculate end budget: initial_budget - total_spent - total_travel_expenses
-    end_budget = float(db_event.initial_budget) - total_spent - total_travel_expenses
-    
-    # Update the event
-    db_event.end_budget = end_budget
-    db.commit()
-    db.refresh(db_event)
-    
-    # Create calculation string with travel expenses included
-    calculation_str = f"${float(db_event.initial_budget):.2f} - ${total_spent:.2f} - ${total_travel_expenses:.2f} = ${end_budget:.2f}"
-    
-    return {
-        "event_id": event_id,
-        "initial_budget": float(db_event.initial_budget),
-        "total_spent_on_products": total_spent,
-        "total_travel_expenses": total_travel_expenses,
-        "end_budget": end_budget,
-        "calculation": calculation_str
-    }
+    return results[0]
 
 # Travel Expense endpoints
 @app.post("/travel-expenses/", response_model=schema.TravelExpenseResponse)
-async def create_travel_expense(
+def create_travel_expense(
     event_id: int = Form(...),
     name: str = Form(...),
     description: Optional[str] = Form(None),
     amount: float = Form(...),
     expense_date: str = Form(...),
+    currency: str = Form("USD", pattern='^[A-Z]{3}$'),
     receipt: Optional[UploadFile] = File(None),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    storage: BlobStorage = Depends(get_blob_storage)
 ):
     """Create a new travel expense for an event"""
     try:
@@ -287,28 +435,17 @@ async def create_travel_expense(
             name=name,
             description=description,
             amount=amount,
+            currency=currency,
             expense_date=parsed_date
         )
+        _apply_base_amounts(db, db_expense)
         
         # Handle receipt if provided
         if receipt:
-            content_type = receipt.content_type
-            if content_type not in ["image/jpeg", "image/png"]:
-                raise HTTPException(
-                    status_code=400,
-                    detail="Only JPG and PNG images are allowed for receipts"
-                )
-            
-            try:
-                receipt_data = await receipt.read()
-                image_type = "jpg" if content_type == "image/jpeg" else "png"
-                db_expense.receipt_data = receipt_data
-                db_expense.receipt_type = image_type
-            except Exception as e:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Failed to process receipt: {str(e)}"
-                )
+            stored = _store_image_upload(storage, receipt, "Only JPG and PNG images are allowed for receipts")
+            db_expense.receipt_hash = stored.key
+            db_expense.receipt_size = stored.size
+            db_expense.receipt_type = stored.image_type
         
         db.add(db_expense)
         db.commit()
@@ -325,6 +462,12 @@ async def create_travel_expense(
             detail=f"An error occurred while creating the travel expense: {str(e)}"
         )
 
+def _event_travel_expenses_query(event_id: int):
+    """Travel expenses of an event"""
+    return select(models.TravelExpense).where(
+        models.TravelExpense.event_id == event_id
+    ).order_by(models.TravelExpense.expense_id)
+
 @app.get("/events/{event_id}/travel-expenses", response_model=List[schema.TravelExpenseResponse])
 def get_event_travel_expenses(
     event_id: int,
@@ -338,11 +481,7 @@ def get_event_travel_expenses(
     if not event:
         raise HTTPException(status_code=404, detail="Event not found")
     
-    expenses = db.query(models.TravelExpense).filter(
-        models.TravelExpense.event_id == event_id
-    ).offset(skip).limit(limit).all()
-    
-    return expenses
+    return db.scalars(_event_travel_expenses_query(event_id).offset(skip).limit(limit)).all()
 
 @app.get("/travel-expenses/{expense_id}", response_model=schema.TravelExpenseResponse)
 def get_travel_expense(
@@ -360,14 +499,16 @@ def get_travel_expense(
     return expense
 
 @app.patch("/travel-expenses/{expense_id}", response_model=schema.TravelExpenseResponse)
-async def update_travel_expense(
+def update_travel_expense(
     expense_id: int,
     name: Optional[str] = Form(None),
     description: Optional[str] = Form(None),
     amount: Optional[float] = Form(None),
     expense_date: Optional[str] = Form(None),
+    currency: Optional[str] = Form(None, pattern='^[A-Z]{3}$'),
     receipt: Optional[UploadFile] = File(None),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    storage: BlobStorage = Depends(get_blob_storage)
 ):
     """Update a travel expense"""
     db_expense = db.query(models.TravelExpense).filter(
@@ -399,26 +540,17 @@ async def update_travel_expense(
                     status_code=400,
                     detail="Invalid date format. Please use YYYY-MM-DD format."
                 )
+        if currency is not None:
+            db_expense.currency = currency
+        if amount is not None or expense_date is not None or currency is not None:
+            _apply_base_amounts(db, db_expense)
         
         # Handle receipt if provided
         if receipt:
-            content_type = receipt.content_type
-            if content_type not in ["image/jpeg", "image/png"]:
-                raise HTTPException(
-                    status_code=400,
-                    detail="Only JPG and PNG images are allowed for receipts"
-                )
-            
-            try:
-                receipt_data = await receipt.read()
-                image_type = "jpg" if content_type == "image/jpeg" else "png"
-                db_expense.receipt_data = receipt_data
-                db_expense.receipt_type = image_type
-            except Exception as e:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Failed to process receipt: {str(e)}"
-                )
+            stored = _store_image_upload(storage, receipt, "Only JPG and PNG images are allowed for receipts")
+            db_expense.receipt_hash = stored.key
+            db_expense.receipt_size = stored.size
+            db_expense.receipt_type = stored.image_type
         
         db.commit()
         db.refresh(db_expense)
@@ -463,27 +595,158 @@ def delete_travel_expense(
             detail=f"An error occurred while deleting the travel expense: {str(e)}"
         )
 
+def _http_date(value: datetime) -> str:
+    """Format a datetime as an HTTP date"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+def _is_not_modified(request: Request, etag: str, last_modified: Optional[datetime]) -> bool:
+    """
+    Evaluate If-None-Match and If-Modified-Since for a GET request.
+    If-None-Match takes precedence when both are present.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        candidates = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in candidates or any(tag.removeprefix("W/") == etag for tag in candidates)
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if last_modified.tzinfo is None:
+            last_modified = last_modified.replace(tzinfo=timezone.utc)
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+def _parse_byte_range(range_header: str, size: int) -> Optional[tuple]:
+    """
+    Parse a single "bytes=start-end" range into inclusive offsets.
+    Returns None for headers we do not handle (the full body is sent instead)
+    and raises ValueError when the range cannot be satisfied.
+    """
+    unit, _, ranges = range_header.partition("=")
+    ranges = ranges.strip()
+    if unit.strip() != "bytes" or not re.fullmatch(r"\d*-\d*", ranges) or ranges == "-":
+        return None
+    start_text, end_text = ranges.split("-")
+    if start_text == "":
+        suffix_length = int(end_text)
+        if suffix_length == 0:
+            raise ValueError("Empty suffix range")
+        start, end = max(size - suffix_length, 0), size - 1
+    else:
+        start = int(start_text)
+        end = int(end_text) if end_text else size - 1
+    end = min(end, size - 1)
+    if start > end:
+        raise ValueError("Unsatisfiable range")
+    return start, end
+
+def _iter_blob_range(storage: BlobStorage, key: str, start: int, end: int):
+    """Yield the bytes between two inclusive offsets of a blob"""
+    remaining = end - start + 1
+    with storage.open_range(key, start, end) as blob:
+        while remaining > 0:
+            chunk = blob.read(min(remaining, STORAGE_CHUNK_SIZE))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+def _blob_response(
+    request: Request,
+    storage: BlobStorage,
+    key: str,
+    media_type: str,
+    last_modified: Optional[datetime] = None,
+    immutable: bool = False,
+    headers: Optional[dict] = None
+):
+    """
+    Build a cacheable response that streams a blob from storage.
+    The content hash is used as a strong ETag, conditional requests are answered
+    with 304 and single byte ranges with 206. Blobs on local disk are sent with
+    FileResponse so the bytes never pass through Python.
+    """
+    etag = f'"{key}"'
+    headers = {
+        **(headers or {}),
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        # Content-addressed URLs never change, everything else must be revalidated
+        "Cache-Control": "public, max-age=31536000, immutable" if immutable else "no-cache",
+    }
+    if last_modified is not None:
+        headers["Last-Modified"] = _http_date(last_modified)
+
+    if _is_not_modified(request, etag, last_modified):
+        headers.pop("Content-Disposition", None)
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or if_range == etag):
+        size = storage.size(key)
+        try:
+            byte_range = _parse_byte_range(range_header, size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+        if byte_range is not None:
+            start, end = byte_range
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            headers["Content-Length"] = str(end - start + 1)
+            return StreamingResponse(
+                _iter_blob_range(storage, key, start, end),
+                status_code=206,
+                media_type=media_type,
+                headers=headers
+            )
+
+    path = storage.local_path(key)
+    if path:
+        return FileResponse(path, media_type=media_type, headers=headers)
+    return StreamingResponse(storage.iter_chunks(key), media_type=media_type, headers=headers)
+
 @app.get("/travel-expenses/{expense_id}/receipt")
-async def get_travel_expense_receipt(
+def get_travel_expense_receipt(
     expense_id: int,
-    db: Session = Depends(get_db)
+    request: Request,
+    v: Optional[str] = None,
+    db: Session = Depends(get_db),
+    storage: BlobStorage = Depends(get_blob_storage)
 ):
-    """Get the receipt image for a travel expense"""
-    expense = db.query(models.TravelExpense).filter(
+    """
+    Get the receipt image for a travel expense.
+    Passing the receipt hash (`receipt_hash` of the expense responses) as `v` makes the
+    URL content-addressed and cacheable forever.
+    """
+    expense = db.query(
+        models.TravelExpense.receipt_hash,
+        models.TravelExpense.receipt_type,
+        models.TravelExpense.updated_at
+    ).filter(
         models.TravelExpense.expense_id == expense_id
     ).first()
     
     if not expense:
         raise HTTPException(status_code=404, detail="Travel expense not found")
     
-    if not expense.receipt_data:
+    if not expense.receipt_hash or not storage.exists(expense.receipt_hash):
         raise HTTPException(status_code=404, detail="No receipt found for this expense")
     
     content_type = "image/jpeg" if expense.receipt_type == "jpg" else "image/png"
     
-    return Response(
-        content=expense.receipt_data,
-        media_type=content_type,
+    return _blob_response(
+        request,
+        storage,
+        expense.receipt_hash,
+        content_type,
+        last_modified=expense.updated_at,
+        immutable=v == expense.receipt_hash,
         headers={"Content-Disposition": f"inline; filename=receipt_{expense_id}.{expense.receipt_type}"}
     )
 
@@ -549,6 +812,7 @@ def create_category(
         db.add(db_category)
         db.commit()
         db.refresh(db_category)
+        reference_cache.invalidate("categories")
         return db_category
     except IntegrityError as e:
         db.rollback()
@@ -558,14 +822,31 @@ def create_category(
         )
 
 @app.get("/categories/", response_model=List[schema.CategoryResponse])
-def list_categories(
+async def list_categories(
+    request: Request,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """List all product categories"""
-    categories = db.query(models.ProductCategory).offset(skip).limit(limit).all()
-    return categories
+    cache_key = f"{skip}:{limit}"
+    body = reference_cache.get("categories", cache_key)
+    if body is None:
+        result = await db.execute(
+            select(models.ProductCategory).order_by(models.ProductCategory.category_id).offset(skip).limit(limit)
+        )
+        body = _encode_reference_list(result.scalars().all(), schema.CategoryResponse)
+        reference_cache.set("categories", cache_key, body)
+    return _reference_response(request, body)
+
+def _category_names(db: Session) -> dict:
+    """Names of all categories by id, served from the reference data cache"""
+    body = reference_cache.get("categories", "names")
+    if body is None:
+        names = dict(db.query(models.ProductCategory.category_id, models.ProductCategory.category_name).all())
+        body = json.dumps(names).encode()
+        reference_cache.set("categories", "names", body)
+    return {int(category_id): name for category_id, name in json.loads(body).items()}
 
 @app.delete("/categories/{category_id}", response_model=dict)
 def delete_category(
@@ -598,6 +879,7 @@ def delete_category(
         # Delete the category
         db.delete(db_category)
         db.commit()
+        reference_cache.invalidate("categories")
         
         return {
             "success": True, 
@@ -620,7 +902,8 @@ VALID_CONDITIONS = [
 ]
 
 @app.post("/products/", response_model=schema.ProductResponse)
-async def create_product(
+def create_product(
+    background_tasks: BackgroundTasks,
     name: str = Form(...),
     sku = "",
     category_id: int = Form(...),
@@ -632,7 +915,8 @@ async def create_product(
     event_id: Optional[int] = Form(None),
     base_costs: List[float] = Form(...),
     image: Optional[UploadFile] = File(None),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    storage: BlobStorage = Depends(get_blob_storage)
 ):
     """Create a new product with all fields and optional image"""
     try:
@@ -662,39 +946,29 @@ async def create_product(
                 status_code=400,
                 detail=f"Invalid date format: {str(e)}. Please use YYYY-MM-DD format."
             )
-    #First, we fetch the category from the database using the provided category_id
-        category = db.query(models.ProductCategory).filter(
-            models.ProductCategory.category_id == category_id
-        ).first()
+    #First, we look the category up in the cached id -> name map
+        category_name = _category_names(db).get(category_id)
+        if category_name is None:
+            # Not cached yet (e.g. created by another worker moments ago)
+            category_name = db.query(models.ProductCategory.category_name).filter(
+                models.ProductCategory.category_id == category_id
+            ).scalar()
         
         # We check if the category exists - if not, we return a 404 error
-        if not category:
+        if category_name is None:
             raise HTTPException(status_code=404, detail="Category not found")
             
-        # Here's where the SKU magic happens:
-        # 1. Take the first two letters of the category name and make them uppercase
-        category_prefix = category.category_name[:2].upper()
-        
-        # 2. Get current timestamp in format: YYMMDDHHMM 
-        # (Year, Month, Day, Hour, Minute)
-        timestamp = datetime.now().strftime('%y%m%d%H%M')
-        
-        # 3. Combine the category prefix with timestamp to create the SKU
-        sku = f"{category_prefix}{timestamp}"
+        # SKU: category prefix + YYMMDDHHMM + the next number of the prefix's
+        # counter, unique even for products created concurrently
+        sku = allocate_skus(db, sku_prefix(category_name), 1)[0]
         # Validate the condition value explicitly
         if condition not in VALID_CONDITIONS:
             raise HTTPException(
                 status_code=400,
                 detail=f"Invalid condition. Must be one of: {', '.join(VALID_CONDITIONS)}"
             )
-        # Validate image type if provided
-        if image:
-            content_type = image.content_type
-            if content_type not in ["image/jpeg", "image/png"]:
-                raise HTTPException(
-                    status_code=400,
-                    detail="Only JPG and PNG images are allowed"
-                )
+        # Validate and store the image, if provided, before anything is written
+        stored_image = _store_image_upload(storage, image, "Only JPG and PNG images are allowed") if image else None
         
         # Create product with all fields
         db_product = models.Product(
@@ -720,35 +994,20 @@ async def create_product(
             )
             db.add(db_instance)
 
-        # Handle image if provided
-        if image:
-            try:
-                # Read image data
-                image_data = await image.read()
-                
-                # Get file extension from content type
-                image_type = "jpg" if content_type == "image/jpeg" else "png"
-                
-                # Create image record
-                db_image = models.ProductImage(
-                    product_id=db_product.product_id,
-                    image_data=image_data,
-                    image_type=image_type,
-                    is_primary=True
-                )
-                db.add(db_image)
-                db.commit()
-                
-            except Exception as img_error:
-                logger.error(f"Error saving image: {str(img_error)}")
-                # If image upload fails, delete the product
-                db.delete(db_product)
-                db.commit()
-                raise HTTPException(
-                    status_code=400,
-                    detail="Failed to save product image"
-                )
-            
+        if stored_image:
+            db.add(models.ProductImage(
+                product_id=db_product.product_id,
+                image_hash=stored_image.key,
+                image_size=stored_image.size,
+                image_type=stored_image.image_type,
+                is_primary=True
+            ))
+            # Render thumbnails after the response has been sent
+            background_tasks.add_task(
+                generate_default_variants, storage, stored_image.key,
+                "jpeg" if stored_image.image_type == "jpg" else "png"
+            )
+
         db.commit()
         db.refresh(db_product)
         return db_product
@@ -764,102 +1023,483 @@ async def create_product(
             detail="An error occurred while creating the product"
         )
 
-@app.get("/products/", response_model=List[schema.ProductResponse])
-def get_products(
-    skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db),
+@app.post("/products/import", response_model=dict)
+def import_products(
+    file: UploadFile = File(...),
+    import_format: Optional[str] = Query(None, alias="format", description="csv or jsonl; detected from the file name when omitted"),
+    batch_size: int = Query(DEFAULT_IMPORT_BATCH_SIZE, ge=1, le=10000),
+    db: Session = Depends(get_db)
+):
+    """
+    Bulk import products and their instances from a CSV or JSONL file.
+
+    Columns/keys: name, condition, purchase_date, obtained_method, base_costs
+    (one cost per instance, ';' separated in CSV), category_id or category (name),
+    and optionally sku, description, location and event_id.
+    Rows are validated while the file is read and inserted in batches; invalid
+    rows are skipped and reported with their row number.
+    """
+    import_format = import_format or detect_import_format(file.filename, file.content_type)
+    if import_format not in IMPORT_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported import format. Use one of: {', '.join(IMPORT_FORMATS)}"
+        )
+
+    try:
+        importer = ProductImporter(db, batch_size=batch_size)
+        return importer.run(iter_import_rows(file.file, import_format))
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Import file must be UTF-8 encoded")
+    except csv.Error as e:
+        raise HTTPException(status_code=400, detail=f"Invalid CSV file: {str(e)}")
+
+# Columns the product listing can sort by; the instance aggregates come from _product_instance_stats
+PRODUCT_LIST_SORT_FIELDS = [
+    "product_id",
+    "name",
+    "sku",
+    "created_at",
+    "available_count",
+    "sold_count",
+    "min_base_cost",
+    "avg_base_cost",
+    "max_base_cost",
+]
+
+def _product_instance_stats():
+    """Instance counts and base_cost range of every product, one row per product"""
+    instance = models.ProductInstance
+    return select(
+        instance.product_id,
+        func.sum(case((instance.status == 'available', 1), else_=0)).label("available_count"),
+        func.sum(case((instance.status == 'sold', 1), else_=0)).label("sold_count"),
+        func.min(instance.base_cost).label("min_base_cost"),
+        func.avg(instance.base_cost).label("avg_base_cost"),
+        func.max(instance.base_cost).label("max_base_cost")
+    ).group_by(instance.product_id).subquery("instance_stats")
+
+# Instance aggregates added to every product of the listing, in select order
+PRODUCT_LIST_AGGREGATES = ["available_count", "sold_count", "min_base_cost", "avg_base_cost", "max_base_cost"]
+
+def _product_list_query(
+    category_id: Optional[int] = None,
+    location: Optional[str] = None,
+    sort_by: str = "product_id",
+    order: str = "asc"
+):
+    """Products with their PRODUCT_LIST_AGGREGATES, filtered and sorted (sort_by must be validated)"""
+    stats = _product_instance_stats()
+    aggregates = {
+        "available_count": func.coalesce(stats.c.available_count, 0),
+        "sold_count": func.coalesce(stats.c.sold_count, 0),
+        "min_base_cost": stats.c.min_base_cost,
+        "avg_base_cost": stats.c.avg_base_cost,
+        "max_base_cost": stats.c.max_base_cost,
+    }
+    query = select(
+        models.Product,
+        *[aggregates[name].label(name) for name in PRODUCT_LIST_AGGREGATES]
+    ).options(
+        undefer(models.Product.image_count),
+        undefer(models.Product.image_hash)
+    ).outerjoin(stats, stats.c.product_id == models.Product.product_id)
+
+    if category_id:
+        query = query.where(models.Product.category_id == category_id)
+    if location:
+        query = query.where(models.Product.location == location)
+
+    sort_column = aggregates[sort_by] if sort_by in aggregates else getattr(models.Product, sort_by)
+    sort_column = sort_column.desc() if order == "desc" else sort_column.asc()
+    # Products without instances have no base costs; keep them last either way
+    if sort_by.endswith("_base_cost"):
+        sort_column = sort_column.nulls_last()
+    return query.order_by(sort_column, models.Product.product_id)
+
+@app.get("/products/", response_model=List[schema.ProductListResponse])
+async def get_products(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_async_db),
     category_id: Optional[int] = None,
-    location: Optional[str] = None
+    location: Optional[str] = None,
+    sort_by: str = "product_id",
+    order: str = "asc"
 ):
-    """Get all products with optional filtering"""
+    """
+    Get a page of products with optional filtering.
+    Each product carries its available and sold instance counts and the
+    min/avg/max base cost of its instances, aggregated in a single GROUP BY
+    and sortable like the product columns.
+    """
+    if sort_by not in PRODUCT_LIST_SORT_FIELDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid sort_by. Must be one of: {', '.join(PRODUCT_LIST_SORT_FIELDS)}"
+        )
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="Invalid order. Must be 'asc' or 'desc'")
+
+    query = _product_list_query(category_id, location, sort_by, order).offset(skip).limit(limit)
     try:
-        # Start with a query that includes a join with inventory
-        query = db.query(models.Product).outerjoin(models.ProductInstance)
+        result = await db.execute(query)
+    except Exception as e:
+        logger.error(f"Error listing products: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
 
-        # Apply filters if provided
-        if category_id:
-            query = query.filter(models.Product.category_id == category_id)
-        if location:
-            query = query.filter(models.Product.location == location)
+    response_products = []
+    for product, *values in result.all():
+        product_dict = product.__dict__
+        product_dict.update(zip(PRODUCT_LIST_AGGREGATES, values))
+        response_products.append(product_dict)
+    return response_products
 
-        # Get all products
-        products = query.all()
+@app.get("/search/products", response_model=dict)
+def search_products_endpoint(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db)
+):
+    """
+    Full-text and fuzzy product search over name, SKU and description.
+    Accents and case are ignored and near misses ("pikachuu", partial set codes)
+    still match. Results are ranked, paginated, and carry name_highlight and
+    description_highlight with the matched words wrapped in <mark> tags.
+    """
+    try:
+        results = search_products(db, q.strip(), limit + 1, offset)
+    except Exception as e:
+        logger.error(f"Error searching products: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error searching products: {str(e)}")
+    return {
+        "query": q,
+        "results": results[:limit],
+        "limit": limit,
+        "offset": offset,
+        "has_more": len(results) > limit
+    }
 
-        return products
+# Inventory statistics change slowly, so the dashboard can be served from a short-lived cache
+inventory_stats_cache = TTLCache(ttl=float(os.getenv("STATS_CACHE_TTL", "30")))
 
+# Age buckets of /stats/inventory: (bucket name, maximum age in whole days)
+INVENTORY_AGE_BUCKETS = [
+    ("less_than_30_days", 30),
+    ("less_than_90_days", 90),
+    ("less_than_180_days", 180),
+]
+INVENTORY_OLDEST_AGE_BUCKET = "more_than_180_days"
+
+def _compute_inventory_stats(db: Session) -> dict:
+    """Count products by category, location and age with a single grouped query"""
+    now = datetime.now(timezone.utc)
+    # A product is N whole days old until N + 1 days have passed
+    age_bucket = case(
+        *[
+            (models.Product.created_at > now - timedelta(days=max_days + 1), bucket)
+            for bucket, max_days in INVENTORY_AGE_BUCKETS
+        ],
+        else_=INVENTORY_OLDEST_AGE_BUCKET
+    )
+    location = func.coalesce(models.Product.location, "Colombia")
+    category_name = func.coalesce(models.ProductCategory.category_name, "Uncategorized")
+
+    rows = db.query(
+        category_name,
+        location,
+        age_bucket,
+        func.count(models.Product.product_id)
+    ).outerjoin(
+        models.ProductCategory, models.ProductCategory.category_id == models.Product.category_id
+    ).group_by(category_name, location, age_bucket).all()
+
+    stats = {
+        "total": 0,
+        "by_category": {},
+        "by_location": {"Colombia": 0, "USA": 0},
+        "by_age": dict.fromkeys([bucket for bucket, _ in INVENTORY_AGE_BUCKETS] + [INVENTORY_OLDEST_AGE_BUCKET], 0),
+        "generated_at": now.isoformat(),
+    }
+    for category, product_location, bucket, count in rows:
+        stats["total"] += count
+        stats["by_category"][category] = stats["by_category"].get(category, 0) + count
+        stats["by_location"][product_location] = stats["by_location"].get(product_location, 0) + count
+        stats["by_age"][bucket] += count
+    return stats
+
+@app.get("/stats/inventory", response_model=dict)
+def get_inventory_stats(db: Session = Depends(get_db)):
+    """
+    Product counts by category, location and age for the statistics dashboard.
+    Results are cached for STATS_CACHE_TTL seconds (30 by default).
+    """
+    try:
+        stats = inventory_stats_cache.get_or_set("inventory", lambda: _compute_inventory_stats(db))
+        return JSONResponse(
+            content=stats,
+            headers={"Cache-Control": f"private, max-age={int(inventory_stats_cache.ttl)}"}
+        )
     except Exception as e:
-        print(f"Error in get_products: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        logger.error(f"Error computing inventory stats: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error computing inventory stats: {str(e)}")
 
 # Make sure this specific route comes BEFORE the general product_id route
 @app.get("/products-with-rentability/", response_model=List[schema.ProductResponse])
-def get_products_with_rentability(db: Session = Depends(get_db)):
-    """Get all products with their rentability metrics"""
-    products = db.query(models.Product).all()
-    
+def get_products_with_rentability(
+    skip: int = 0,
+    limit: int = 100,
+    sort_by: str = "rentability_percentage",
+    order: str = "desc",
+    has_sales: bool = False,
+    db: Session = Depends(get_db)
+):
+    """
+    Get products with their rentability metrics.
+    Metrics are read from the precomputed product_rentability table, which can be
+    sorted by any metric and paginated; products without a row yet are computed first.
+    """
+    if sort_by not in RENTABILITY_SORT_FIELDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid sort_by. Must be one of: {', '.join(RENTABILITY_SORT_FIELDS)}"
+        )
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="Invalid order. Must be 'asc' or 'desc'")
+
+    if refresh_missing_rentability(db):
+        db.commit()
+
+    query = db.query(models.Product, models.ProductRentability).options(
+        undefer(models.Product.image_count),
+        undefer(models.Product.image_hash)
+    ).join(
+        models.ProductRentability,
+        models.ProductRentability.product_id == models.Product.product_id
+    )
+    if has_sales:
+        query = query.filter(models.ProductRentability.sales_count > 0)
+
+    sort_column = getattr(models.ProductRentability, sort_by)
+    query = query.order_by(
+        sort_column.desc() if order == "desc" else sort_column.asc(),
+        models.Product.product_id
+    )
+
     response_products = []
-    for product in products:
+    for product, rentability in query.offset(skip).limit(limit).all():
         product_dict = product.__dict__
-        rentability_metrics = product.calculate_rentability(db)
-        product_dict.update(rentability_metrics)
+        product_dict.update({field: getattr(rentability, field) for field in RENTABILITY_SORT_FIELDS})
         response_products.append(product_dict)
-    
+
     return response_products
 
+@app.post("/products-with-rentability/refresh", response_model=dict)
+def refresh_products_rentability(db: Session = Depends(get_db)):
+    """Recompute the stored rentability metrics of every product"""
+    try:
+        refreshed_count = refresh_product_rentability(db)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error refreshing product rentability: {str(e)}")
+        raise HTTPException(status_code=500, detail="An error occurred while refreshing rentability.")
+
+    return {
+        "message": f"Rentability refreshed for {refreshed_count} products.",
+        "refreshed_count": refreshed_count
+    }
+
 # This more general route should come AFTER the specific route
 @app.get("/products/{product_id}", response_model=schema.ProductResponse)
-def get_product(
+async def get_product(
     product_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get a specific product by ID"""
-    product = db.query(models.Product).filter(
-        models.Product.product_id == product_id
-    ).first()
+    product = await db.get(
+        models.Product,
+        product_id,
+        options=[undefer(models.Product.image_count), undefer(models.Product.image_hash)]
+    )
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     return product
 
-@app.patch("/products/bulk-update-location", response_model=dict)
-def bulk_update_product_location(
-    request_data: schema.ProductBulkUpdateLocationRequest,
+def _product_instances_query(product_id: int, status: Optional[str] = None, cursor: Optional[int] = None):
+    """Instances of one product in instance_id order, after the keyset cursor"""
+    query = select(models.ProductInstance).where(models.ProductInstance.product_id == product_id)
+    if status:
+        query = query.where(models.ProductInstance.status == status)
+    if cursor is not None:
+        query = query.where(models.ProductInstance.instance_id > cursor)
+    return query.order_by(models.ProductInstance.instance_id)
+
+@app.get("/products/{product_id}/instances", response_model=List[schema.ProductInstanceResponse])
+async def get_product_instances(
+    product_id: int,
+    response: Response,
+    cursor: Optional[int] = Query(None, ge=0, description="Return instances with instance_id greater than this value"),
+    limit: int = Query(100, ge=1, le=1000),
+    status: Optional[str] = Query(None, pattern='^(available|sold|reserved)$'),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Get the instances of one product, ordered by instance_id and paginated
+    with a keyset cursor like /instances/ (see the X-Next-Cursor header).
+    Served by the (product_id, status) index.
+    """
+    if await db.get(models.Product, product_id) is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+
+    # Fetch one extra row to find out whether there is a next page
+    query = _product_instances_query(product_id, status, cursor).limit(limit + 1)
+    instances = (await db.execute(query)).scalars().all()
+    if len(instances) > limit:
+        instances = instances[:limit]
+        response.headers["X-Next-Cursor"] = str(instances[-1].instance_id)
+    return instances
+
+@app.post("/products/{product_id}/clone", response_model=schema.ProductResponse)
+def clone_product(
+    product_id: int,
+    clone: schema.ProductCloneRequest,
     db: Session = Depends(get_db)
 ):
-    """Bulk update location for a list of products."""
-    logger.info(f"Received bulk_update_product_location request_data: {request_data}") # <-- ADD THIS LINE
-    updated_count = 0
-    errors = []
+    """
+    Duplicate a product in one transaction: the copy gets a new SKU, the same
+    details, a reference to each of the original's images (the blobs are
+    shared, not copied) and one available instance per entry of base_costs.
+    """
+    source = db.get(models.Product, product_id)
+    if not source:
+        raise HTTPException(status_code=404, detail="Product not found")
 
-    products_to_update = db.query(models.Product).filter(
-        models.Product.product_id.in_(request_data.product_ids)
-    ).all()
+    try:
+        category_name = _category_names(db).get(source.category_id) if source.category_id else None
+        prefix = sku_prefix(category_name) if category_name else source.sku[:2].upper()
+        db_product = models.Product(
+            name=clone.name or source.name,
+            sku=allocate_skus(db, prefix, 1)[0],
+            category_id=source.category_id,
+            event_id=source.event_id,
+            description=source.description,
+            condition=source.condition,
+            purchase_date=source.purchase_date,
+            location=source.location,
+            obtained_method=source.obtained_method
+        )
+        db.add(db_product)
+        db.flush()
+
+        if clone.copy_images:
+            db.execute(insert(models.ProductImage).from_select(
+                ["product_id", "image_hash", "image_size", "image_type", "is_primary"],
+                select(
+                    literal(db_product.product_id),
+                    models.ProductImage.image_hash,
+                    models.ProductImage.image_size,
+                    models.ProductImage.image_type,
+                    models.ProductImage.is_primary
+                ).where(models.ProductImage.product_id == product_id).order_by(models.ProductImage.image_id)
+            ))
+
+        if clone.base_costs:
+            db.execute(insert(models.ProductInstance), [
+                {
+                    "product_id": db_product.product_id,
+                    "base_cost": base_cost,
+                    "purchase_date": source.purchase_date,
+                    "location": source.location,
+                    "condition": source.condition
+                }
+                for base_cost in clone.base_costs
+            ])
+
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error cloning product {product_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"An error occurred while cloning the product: {str(e)}")
 
-    found_product_ids = {p.product_id for p in products_to_update}
+    db.refresh(db_product)
+    return db_product
 
-    for product_id in request_data.product_ids:
-        if product_id not in found_product_ids:
-            errors.append({"product_id": product_id, "error": "Product not found"})
+def _id_in(db: Session, column, ids: List[int]):
+    """`column = ANY(:ids)` on PostgreSQL (one array parameter however many ids), IN elsewhere"""
+    if db.bind.dialect.name == "postgresql":
+        return column == any_(cast(ids, ARRAY(Integer)))
+    return column.in_(ids)
 
-    for product in products_to_update:
-        product.location = request_data.new_location
-        updated_count += 1
+def _bulk_update_location(db: Session, model, id_column, criteria, new_location: str) -> List[int]:
+    """Set the location of every matching row with one UPDATE ... RETURNING, returning the updated ids"""
+    try:
+        result = db.execute(
+            update(model)
+            .where(*criteria)
+            .values(location=new_location)
+            .returning(id_column)
+            .execution_options(synchronize_session=False)
+        )
+        updated_ids = [row_id for (row_id,) in result]
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error during bulk update commit: {str(e)}")
+        raise HTTPException(status_code=500, detail="An error occurred during the update.")
+    return updated_ids
 
-    if updated_count > 0:
-        try:
-            db.commit()
-        except Exception as e:
-            db.rollback()
-            # Log the exception e
-            logger.error(f"Error during bulk update commit: {str(e)}")
-            # Return a more generic error to the client, or specific if appropriate
-            raise HTTPException(status_code=500, detail="An error occurred during the update.")
+def _move_location(db: Session, model, criteria, new_location: str) -> int:
+    """
+    Set the location of every matching row with one UPDATE, returning only how
+    many rows changed: filter-based moves can touch tens of thousands of rows
+    whose ids the caller never needs.
+    """
+    try:
+        result = db.execute(
+            update(model)
+            .where(*criteria)
+            .values(location=new_location)
+            .execution_options(synchronize_session=False)
+        )
+        updated_count = result.rowcount
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error during bulk update commit: {str(e)}")
+        raise HTTPException(status_code=500, detail="An error occurred during the update.")
+    return updated_count
+
+@app.patch("/products/bulk-update-location", response_model=dict)
+def bulk_update_product_location(
+    request_data: schema.ProductBulkUpdateLocationRequest,
+    db: Session = Depends(get_db)
+):
+    """Bulk update location for a list of products."""
+    logger.info(f"Received bulk_update_product_location request_data: {request_data}")
+    updated_ids = set()
+    if request_data.product_ids:
+        updated_ids = set(_bulk_update_location(
+            db,
+            models.Product,
+            models.Product.product_id,
+            [_id_in(db, models.Product.product_id, request_data.product_ids)],
+            request_data.new_location
+        ))
+
+    errors = [
+        {"product_id": product_id, "error": "Product not found"}
+        for product_id in request_data.product_ids if product_id not in updated_ids
+    ]
+    updated_count = len(updated_ids)
 
     return {
         "message": f"Bulk location update attempted. {updated_count} products updated.",
         "updated_count": updated_count,
         "errors": errors
     }
+
 @app.patch("/products/{product_id}", response_model=schema.ProductResponse)
 def update_product(
     product_id: int,
@@ -887,45 +1527,81 @@ def update_product(
 
 
 
+def _primary_image_query(product_id: int):
+    """Blob key and type of a product's primary image (or its first image when none is primary)"""
+    return select(
+        models.ProductImage.image_hash,
+        models.ProductImage.image_type,
+        models.ProductImage.created_at
+    ).where(
+        models.ProductImage.product_id == product_id
+    ).order_by(
+        models.ProductImage.is_primary.desc().nulls_last(),
+        models.ProductImage.image_id
+    ).limit(1)
+
 @app.get("/products/{product_id}/image")
-async def get_product_image(
+def get_product_image(
     product_id: int,
-    db: Session = Depends(get_db)
+    request: Request,
+    v: Optional[str] = None,
+    size: Optional[str] = Query(None, description=f"Resized variant: {', '.join(IMAGE_VARIANT_SIZES)}"),
+    image_format: Optional[str] = Query(None, alias="format", description=f"Variant format: {', '.join(IMAGE_VARIANT_FORMATS)}"),
+    db: Session = Depends(get_db),
+    storage: BlobStorage = Depends(get_blob_storage)
 ):
-    """Get the primary image for a product"""
-    try:
-        product_image = db.query(models.ProductImage).filter(
-            models.ProductImage.product_id == product_id,
-            models.ProductImage.is_primary == True
-        ).first()
-        
-        if not product_image:
-            product_image = db.query(models.ProductImage).filter(
-                models.ProductImage.product_id == product_id
-            ).first()
-        
-        if not product_image or not product_image.image_data:
+    """
+    Get the primary image for a product, falling back to any of its images.
+    Passing the image hash (`image_hash` of the product responses) as `v` makes the
+    URL content-addressed and cacheable forever.
+    With `size` (and optionally `format`) a resized rendition is served instead; it is
+    generated on first request and stored next to the original.
+    """
+    if size is not None and size not in IMAGE_VARIANT_SIZES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid size. Must be one of: {', '.join(IMAGE_VARIANT_SIZES)}"
+        )
+    if image_format is not None:
+        if image_format not in IMAGE_VARIANT_FORMATS:
             raise HTTPException(
-                status_code=404, 
-                detail="No valid image found for this product"
+                status_code=400,
+                detail=f"Invalid format. Must be one of: {', '.join(IMAGE_VARIANT_FORMATS)}"
             )
+        if size is None:
+            raise HTTPException(status_code=400, detail="format can only be used together with size")
 
-        image_stream = BytesIO(product_image.image_data)
-        image_stream.seek(0)
-        
-        content_type = "image/jpeg" if product_image.image_type.lower() in ["jpg", "jpeg"] else "image/png"
-        
-        return StreamingResponse(
-            image_stream,
-            media_type=content_type
-        )
-        
-    except Exception as e:
-        logger.error(f"Error serving image for product {product_id}: {str(e)}")
+    product_image = db.execute(_primary_image_query(product_id)).first()
+    
+    if not product_image or not storage.exists(product_image.image_hash):
         raise HTTPException(
-            status_code=500,
-            detail=str(e)
+            status_code=404, 
+            detail="No valid image found for this product"
         )
+    
+    source_format = "jpeg" if product_image.image_type.lower() in ["jpg", "jpeg"] else "png"
+    blob_key = product_image.image_hash
+    content_type = IMAGE_VARIANT_FORMATS[source_format]
+
+    if size is not None:
+        variant_format = image_format or source_format
+        try:
+            variant_hash = get_or_create_variant(storage, product_image.image_hash, size, variant_format)
+        except Exception as e:
+            logger.error(f"Error generating {size} variant for product {product_id}: {str(e)}")
+            raise HTTPException(status_code=500, detail="Failed to generate image variant")
+        if variant_hash is not None:
+            blob_key = variant_hash
+            content_type = IMAGE_VARIANT_FORMATS[variant_format]
+    
+    return _blob_response(
+        request,
+        storage,
+        blob_key,
+        content_type,
+        last_modified=product_image.created_at,
+        immutable=v == product_image.image_hash
+    )
 
 @app.delete("/products/{product_id}", response_model=dict)
 def delete_product(
@@ -942,6 +1618,11 @@ def delete_product(
     
     try:
         product_name = db_product.name
+        # Its sales are removed by the cascade, so take them out of the rollup first
+        sale_ids = [
+            sale_id for (sale_id,) in db.query(models.Sale.sale_id).filter(models.Sale.product_id == product_id).all()
+        ]
+        remove_sales_from_rollup(db, sale_ids)
         db.delete(db_product)
         db.commit()
         return {
@@ -969,6 +1650,7 @@ def create_supplier(
         db.add(db_supplier)
         db.commit()
         db.refresh(db_supplier)
+        reference_cache.invalidate("suppliers")
         return db_supplier
     except IntegrityError as e:
         db.rollback()
@@ -979,6 +1661,7 @@ def create_supplier(
 
 @app.get("/suppliers/", response_model=List[schema.SupplierResponse])
 def list_suppliers(
+    request: Request,
     skip: int = 0,
     limit: int = 100,
     debtor_type: Optional[str] = None,
@@ -986,15 +1669,20 @@ def list_suppliers(
     db: Session = Depends(get_db)
 ):
     """List suppliers with optional filtering"""
-    query = db.query(models.Supplier)
-    
-    if debtor_type:
-        query = query.filter(models.Supplier.debtor_type == debtor_type)
-    if is_active is not None:
-        query = query.filter(models.Supplier.is_active == is_active)
-    
-    suppliers = query.offset(skip).limit(limit).all()
-    return suppliers
+    cache_key = f"{skip}:{limit}:{debtor_type}:{is_active}"
+    body = reference_cache.get("suppliers", cache_key)
+    if body is None:
+        query = db.query(models.Supplier)
+        
+        if debtor_type:
+            query = query.filter(models.Supplier.debtor_type == debtor_type)
+        if is_active is not None:
+            query = query.filter(models.Supplier.is_active == is_active)
+        
+        suppliers = query.offset(skip).limit(limit).all()
+        body = _encode_reference_list(suppliers, schema.SupplierResponse)
+        reference_cache.set("suppliers", cache_key, body)
+    return _reference_response(request, body)
 
 @app.get("/suppliers/by-category/{category_id}", response_model=List[schema.SupplierResponse])
 def get_suppliers_by_category(
@@ -1042,6 +1730,7 @@ def update_supplier(
     try:
         db.commit()
         db.refresh(db_supplier)
+        reference_cache.invalidate("suppliers")
         return db_supplier
     except IntegrityError:
         db.rollback()
@@ -1070,6 +1759,7 @@ def delete_supplier(
             # If supplier has associated products, just mark as inactive
             db_supplier.is_active = False
             db.commit()
+            reference_cache.invalidate("suppliers")
             return {
                 "success": True,
                 "message": f"Supplier '{db_supplier.name}' has been deactivated due to existing product associations",
@@ -1080,6 +1770,7 @@ def delete_supplier(
             # If no associated products, we can safely delete the supplier
             db.delete(db_supplier)
             db.commit()
+            reference_cache.invalidate("suppliers")
             return {
                 "success": True,
                 "message": f"Supplier '{db_supplier.name}' has been deleted",
@@ -1129,108 +1820,8 @@ def create_profit_and_loss_statement(
     year_int, month_int, start_date_dt, end_date_dt = _parse_month_string_to_dates(pnl_input.month)
     statement_month_date = date(year_int, month_int, 1)
 
-    # Initialize Decimal variables for calculations
-    db_gross_sales = Decimal("0.0")
-    db_cost_of_sales = Decimal("0.0")
-    db_shipping_expense = Decimal("0.0")
-
-    # Step 2 & 3: Fetch Sales Data & Product Costs
-    sales_in_month = db.query(
-        models.Sale,
-        models.PricePoint.base_cost,
-        models.PricePoint.shipment_cost
-    ).join(models.Product, models.Sale.product_id == models.Product.product_id)\
-    .outerjoin(models.PricePoint, models.Product.product_id == models.PricePoint.product_id)\
-    .filter(models.Sale.sale_date >= start_date_dt, models.Sale.sale_date <= end_date_dt)\
-    .all()
-
-    for sale_record, base_cost, shipment_cost in sales_in_month:
-        db_gross_sales += sale_record.sale_price if sale_record.sale_price is not None else Decimal("0.0")
-        db_cost_of_sales += base_cost if base_cost is not None else Decimal("0.0")
-        db_shipping_expense += shipment_cost if shipment_cost is not None else Decimal("0.0")
-
-    # Step 4: Calculations (Part 1 - Sales-based)
-    db_sales_discounts = Decimal("0.0") # As per requirement
-    net_sales = db_gross_sales - db_sales_discounts
-    db_gross_profit = net_sales - (db_cost_of_sales + db_shipping_expense)
-    
-    db_payroll_payments = Decimal("0.0") # As per requirement
-    operating_expenses = db_payroll_payments # Assuming only payroll for now
-    db_operating_income = db_gross_profit - operating_expenses
-    
-    db_tax_collection = Decimal("0.0") # As per requirement
-    db_reserve_collection = Decimal("0.0") # As per requirement
-    # Net income calculation adjusted as per typical accounting (reserve_collection not usually subtracted here unless it's an expense)
-    db_net_income = db_operating_income - db_tax_collection 
-    
-    db_costs_and_expenses = db_cost_of_sales + db_shipping_expense + db_payroll_payments
-    db_income = net_sales # Total income before COGS and other expenses
-
-    # Step 5: Fetch Purchase Data for the Month
-    db_purchases_colombia = db.query(func.sum(models.PricePoint.base_cost))\
-        .join(models.Product, models.PricePoint.product_id == models.Product.product_id)\
-        .filter(
-            models.Product.location == 'Colombia',
-            models.Product.purchase_date >= start_date_dt,
-            models.Product.purchase_date <= end_date_dt
-        ).scalar() or Decimal("0.0")
-
-    db_purchases_usa = db.query(func.sum(models.PricePoint.base_cost))\
-        .join(models.Product, models.PricePoint.product_id == models.Product.product_id)\
-        .filter(
-            models.Product.location == 'USA',
-            models.Product.purchase_date >= start_date_dt,
-            models.Product.purchase_date <= end_date_dt
-        ).scalar() or Decimal("0.0")
-
-    # Step 6: Inventory Valuation
-    previous_month_for_query = (start_date_dt.replace(day=1) - timedelta(days=1)).replace(day=1)
-    previous_pnl = db.query(models.ProfitAndLoss).filter(models.ProfitAndLoss.month == previous_month_for_query).first()
-    
-    # Calculate beginning inventory value from actual inventory
-    db_beginning_inventory_value = db.query(func.sum(models.PricePoint.base_cost))\
-        .join(models.Product, models.PricePoint.product_id == models.Product.product_id)\
-        .join(models.Inventory, models.Product.product_id == models.Inventory.product_id)\
-        .filter(
-            models.Inventory.quantity > 0,
-            models.Product.purchase_date < start_date_dt
-        ).scalar() or Decimal("0.0")
-    
-    # Calculate ending inventory value
-    db_ending_inventory_value = db_beginning_inventory_value + db_purchases_colombia + db_purchases_usa - db_cost_of_sales
-
-    # If ending inventory is negative, adjust cost of sales to prevent negative inventory
-    if db_ending_inventory_value < 0:
-        # Adjust cost of sales to prevent negative inventory
-        db_cost_of_sales = db_beginning_inventory_value + db_purchases_colombia + db_purchases_usa
-        db_ending_inventory_value = Decimal("0.0")
-
-    # Step 7: Save to Database (Create or Update)
-    existing_pnl = db.query(models.ProfitAndLoss).filter(models.ProfitAndLoss.month == statement_month_date).first()
-
-    if existing_pnl:
-        pnl_to_save = existing_pnl
-    else:
-        pnl_to_save = models.ProfitAndLoss(month=statement_month_date)
-        db.add(pnl_to_save) # Add to session if new
-
-    pnl_to_save.gross_sales = db_gross_sales
-    pnl_to_save.sales_discounts = db_sales_discounts
-    pnl_to_save.shipping_expense = db_shipping_expense # shipping_income was removed
-    pnl_to_save.gross_profit = db_gross_profit
-    pnl_to_save.beginning_inventory_value = db_beginning_inventory_value
-    pnl_to_save.purchases_colombia = db_purchases_colombia
-    pnl_to_save.purchases_usa = db_purchases_usa
-    pnl_to_save.ending_inventory_value = db_ending_inventory_value
-    pnl_to_save.cost_of_sales = db_cost_of_sales
-    pnl_to_save.payroll_payments = db_payroll_payments
-    # net_income_without_operations was removed
-    pnl_to_save.costs_and_expenses = db_costs_and_expenses
-    pnl_to_save.income = db_income
-    pnl_to_save.operating_income = db_operating_income
-    pnl_to_save.tax_collection = db_tax_collection
-    pnl_to_save.reserve_collection = db_reserve_collection
-    pnl_to_save.net_income = db_net_income
+    statements = compute_profit_and_loss(db, statement_month_date, statement_month_date)
+    pnl_to_save = save_profit_and_loss(db, statements)[0]
     
     try:
         db.commit()
@@ -1244,6 +1835,46 @@ def create_profit_and_loss_statement(
         logger.error(f"Unexpected error during P&L save for month {pnl_input.month}: {str(e)}")
         raise HTTPException(status_code=500, detail="An unexpected error occurred.")
 
+# Upper bound on the number of months a single backfill may cover
+MAX_PNL_BACKFILL_MONTHS = 120
+
+@app.post("/profit-and-loss/backfill", response_model=List[schema.ProfitAndLossResponse], status_code=201)
+def backfill_profit_and_loss_statements(
+    from_month: str = Query(..., alias="from", description="First month, YYYY-MM"),
+    to_month: str = Query(..., alias="to", description="Last month, YYYY-MM"),
+    db: Session = Depends(get_db)
+):
+    """
+    Create or update the Profit and Loss statements of every month in a range.
+    All months are computed from one aggregate query and saved in one transaction.
+    """
+    first_year, first_month, _, _ = _parse_month_string_to_dates(from_month)
+    last_year, last_month, _, _ = _parse_month_string_to_dates(to_month)
+    first_month_date = date(first_year, first_month, 1)
+    last_month_date = date(last_year, last_month, 1)
+
+    if first_month_date > last_month_date:
+        raise HTTPException(status_code=400, detail="'from' month must not be after 'to' month")
+    if len(month_starts(first_month_date, last_month_date)) > MAX_PNL_BACKFILL_MONTHS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"A backfill can cover at most {MAX_PNL_BACKFILL_MONTHS} months"
+        )
+
+    statements = compute_profit_and_loss(db, first_month_date, last_month_date)
+    saved = save_profit_and_loss(db, statements)
+
+    try:
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Unexpected error during P&L backfill {from_month} to {to_month}: {str(e)}")
+        raise HTTPException(status_code=500, detail="An unexpected error occurred.")
+
+    for pnl in saved:
+        db.refresh(pnl)
+    return saved
+
 
 @app.get("/profit-and-loss/", response_model=List[schema.ProfitAndLossResponse])
 def list_profit_and_loss_statements(
@@ -1295,8 +1926,12 @@ def create_price_point(
         price_point_data = price_point.dict(exclude_unset=True)
         if price_point_data.get('effective_from') is None:
             price_point_data.pop('effective_from', None)
-        db_price_point = models.PricePoint(**price_point.dict())
+        db_price_point = models.PricePoint(**price_point_data)
+        # Price points without effective_from start now
+        _apply_base_amounts(db, db_price_point)
         db.add(db_price_point)
+        db.flush()
+        refresh_product_rentability(db, [db_price_point.product_id])
         db.commit()
         db.refresh(db_price_point)
         return db_price_point
@@ -1400,91 +2035,157 @@ def get_inventory_transactions(
 
 
 
-# Logic methods, for analysis, financial metrics etc...
+# Exchange rates are served from ExchangeRateService, which refreshes them from
+# exchangerate-api in the background instead of calling it on every request
+EXCHANGE_RATES_MAX_AGE_HEADER = 300
 
+def _currency_code(value: str) -> str:
+    """Upper-cased currency code, answering 400 unless it is three letters"""
+    code = value.upper()
+    if not CURRENCY_CODE.match(code):
+        raise HTTPException(status_code=400, detail="Invalid currency code. Use a three-letter ISO 4217 code")
+    return code
 
-def update_financial_metrics(db: Session, sale: schema.SaleCreate):
-    """Update financial metrics based on sale"""
-    # Get the date parts for grouping
-    sale_date = sale.sale_date
-    year = sale_date.year
-    month = sale_date.month
-    
-    # Get or create metric for this month
-    metric = db.query(models.FinancialMetric).filter(
-        extract('year', models.FinancialMetric.record_date) == year,
-        extract('month', models.FinancialMetric.record_date) == month
-    ).first()
-    
-    if not metric:
-        metric = models.FinancialMetric(
-            record_date=date(year, month, 1),
-            dollar_average=0,
-            efficiency_over_costs=0,
-            efficiency_over_goal=0,
-            estimated_revenue=0,
-            actual_revenue=0,
-            total_net_income=0,
-            tax_rate=0.19,  # Example tax rate
-            reserve_rate=0.10,  # Example reserve rate
-            profit_margin=0
-        )
-        db.add(metric)
-    
-    # Update metrics
-    metric.actual_revenue += float(sale.sale_price)
-    
-    # Get product cost from latest price point
-    latest_price_point = db.query(models.PricePoint).filter(
-        models.PricePoint.product_id == sale.product_id
-    ).order_by(models.PricePoint.effective_from.desc()).first()
-    
-    if latest_price_point:
-        cost = float(latest_price_point.base_cost)
-        revenue = float(sale.sale_price)
-        
-        # Update efficiency metrics
-        if cost > 0:
-            metric.efficiency_over_costs = ((revenue - cost) / cost) * 100
-        
-        # Update profit margin
-        total_sales = metric.actual_revenue
-        total_costs = cost  # This should actually sum all costs for the period
-        if total_sales > 0:
-            metric.profit_margin = ((total_sales - total_costs) / total_sales) * 100
-            
-        # Update net income
-        tax_amount = revenue * metric.tax_rate
-        reserve_amount = revenue * metric.reserve_rate
-        metric.total_net_income = revenue - cost - tax_amount - reserve_amount
-        
-    db.commit()
-
-# api calles exchange rate api 
 @app.get("/exchange-rates/")
-async def get_exchange_rates(base_currency: str = "USD"):
+async def get_exchange_rates(
+    base_currency: str = "USD",
+    rates_service: ExchangeRateService = Depends(get_exchange_rate_service)
+):
     """Get current exchange rates with USD as the base currency"""
+    base_currency = _currency_code(base_currency)
+    snapshot = await rates_service.get_rates(base_currency)
+    if snapshot is None:
+        # Provider unreachable and nothing stored yet: fall back to approximate values
+        return {"base_currency": base_currency, "rates": FALLBACK_RATES, "stale": True}
+
+    return JSONResponse(
+        content={
+            "base_currency": snapshot.base_currency,
+            "rates": snapshot.rates,
+            "effective_at": snapshot.effective_at.isoformat(),
+            "fetched_at": snapshot.fetched_at.isoformat(),
+            "stale": snapshot.age() >= rates_service.max_age,
+        },
+        headers={"Cache-Control": f"private, max-age={EXCHANGE_RATES_MAX_AGE_HEADER}"}
+    )
+
+@app.get("/exchange-rates/history", response_model=dict)
+def get_historical_exchange_rate(
+    currency: str,
+    at: datetime,
+    base_currency: str = "USD",
+    db: Session = Depends(get_db)
+):
+    """Rate of a currency that was in effect at a point in time"""
+    currency = _currency_code(currency)
+    base_currency = _currency_code(base_currency)
+    if at.tzinfo is None:
+        at = at.replace(tzinfo=timezone.utc)
+    rate = rate_at(db, currency, at, base_currency)
+    if rate is None:
+        raise HTTPException(status_code=404, detail="No exchange rate recorded before that time")
+    return {
+        "base_currency": base_currency,
+        "currency": currency,
+        "at": at,
+        "rate": rate
+    }
+
+@app.post("/instances/sell-batch", response_model=List[schema.SaleResponse])
+def sell_instances_batch(
+    batch: schema.InstanceSellBatchRequest,
+    db: Session = Depends(get_db)
+):
+    """
+    Sell several instances in one transaction, all or nothing.
+
+    The requested instances are locked with one SELECT ... FOR UPDATE SKIP LOCKED,
+    so an instance being sold by another request counts as unavailable instead
+    of blocking. Sales are inserted with one executemany and the statuses are
+    flipped with a single guarded UPDATE. If any instance is missing or not
+    available, nothing is sold.
+    """
+    prices = {item.instance_id: item.sale_price for item in batch.items}
+    if len(prices) != len(batch.items):
+        raise HTTPException(status_code=400, detail="Each instance can only appear once in a batch")
+    instance_ids = list(prices)
     try:
-        # Use an exchange rate API or service
-        # For this example, we're using exchangerate-api.com
-        api_key = os.getenv("EXCHANGE_RATE_API_KEY")
-        url = f"https://v6.exchangerate-api.com/v6/{api_key}/latest/{base_currency}"
-        
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url)
-            if response.status_code != 200:
-                raise HTTPException(status_code=response.status_code, detail="Failed to fetch exchange rates")
-            
-            data = response.json()
-            
-            if data.get("result") == "success":
-                return {"rates": data.get("conversion_rates", {})}
-            else:
-                raise HTTPException(status_code=500, detail="Failed to fetch exchange rates")
-    except Exception as e:
-        logger.error(f"Error fetching exchange rates: {str(e)}")
-        # Fallback to approximate values
-        return {"rates": {"COP": 4000, "EUR": 0.92, "GBP": 0.78}}
+        fx_rate = exchange_rate(db, batch.currency, batch.sale_date)
+    except MissingExchangeRateError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        existing_ids = {
+            instance_id for (instance_id,) in db.query(models.ProductInstance.instance_id).filter(
+                models.ProductInstance.instance_id.in_(instance_ids)
+            ).all()
+        }
+        missing_ids = sorted(set(instance_ids) - existing_ids)
+        if missing_ids:
+            raise HTTPException(
+                status_code=404,
+                detail={"message": "Product instances not found", "instance_ids": missing_ids}
+            )
+
+        locked = db.query(
+            models.ProductInstance.instance_id, models.ProductInstance.product_id
+        ).filter(
+            models.ProductInstance.instance_id.in_(instance_ids),
+            models.ProductInstance.status == 'available'
+        ).with_for_update(skip_locked=True).all()
+        product_ids = {instance_id: product_id for instance_id, product_id in locked}
+
+        unavailable_ids = sorted(set(instance_ids) - set(product_ids))
+        if unavailable_ids:
+            raise HTTPException(
+                status_code=409,
+                detail={"message": "Product instances are not available for sale", "instance_ids": unavailable_ids}
+            )
+
+        # The status guard keeps the update safe on databases without row locks
+        result = db.execute(
+            update(models.ProductInstance)
+            .where(
+                models.ProductInstance.instance_id.in_(instance_ids),
+                models.ProductInstance.status == 'available'
+            )
+            .values(status='sold')
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount != len(instance_ids):
+            raise HTTPException(
+                status_code=409,
+                detail={"message": "Product instances were sold by another request", "instance_ids": instance_ids}
+            )
+
+        sale_ids = db.execute(
+            insert(models.Sale).returning(models.Sale.sale_id),
+            [
+                {
+                    "product_id": product_ids[instance_id],
+                    "sale_price": prices[instance_id],
+                    "currency": batch.currency,
+                    "fx_rate": fx_rate,
+                    "sale_price_base": to_base(prices[instance_id], fx_rate),
+                    "sale_date": batch.sale_date,
+                    "payment_method": batch.payment_method,
+                    "notes": batch.notes,
+                }
+                for instance_id in instance_ids
+            ]
+        ).scalars().all()
+
+        refresh_product_rentability(db, sorted(set(product_ids.values())))
+        add_sales_to_rollup(db, sale_ids)
+        db.commit()
+    except HTTPException:
+        db.rollback()
+        raise
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Invalid sale data")
+
+    return db.query(models.Sale).filter(models.Sale.sale_id.in_(sale_ids)).order_by(models.Sale.sale_id).all()
 
 @app.post("/instances/{instance_id}/sell", response_model=schema.SaleResponse)
 def sell_product(
@@ -1494,14 +2195,16 @@ def sell_product(
 ):
     """
     Process a product sale:
-    1. Create sale record
-    2. Update inventory
-    3. Create inventory transaction
-    4. Update financial metrics
+    1. Lock the instance and check it is still available
+    2. Create sale record
+    3. Mark the instance as sold
+    4. Refresh the product's rentability and the sales rollup
     """
     try:
-        # Get product and inventory
-        instance = db.query(models.ProductInstance).filter(models.ProductInstance.instance_id == instance_id).first()
+        # Get product and inventory, locking the instance so it cannot be sold twice
+        instance = db.query(models.ProductInstance).filter(
+            models.ProductInstance.instance_id == instance_id
+        ).with_for_update().first()
         if not instance:
             raise HTTPException(status_code=404, detail="Product instance not found")
         
@@ -1512,21 +2215,22 @@ def sell_product(
         db_sale = models.Sale(
             product_id=instance.product_id,
             sale_price=sale.sale_price,
+            currency=sale.currency,
             sale_date=sale.sale_date,
             payment_method=sale.payment_method,
             notes=sale.notes
         )
+        _apply_base_amounts(db, db_sale)
         db.add(db_sale)
         db.flush()
         
         # Update instance status
         instance.status = 'sold'
 
-        # Check if update_financial_metrics function exists and update it if needed
-        # If you have this function, make sure it uses product_id from the path parameter
-        # For example:
-        # update_financial_metrics(db, product_id, sale)
-        
+        # Keep the precomputed rentability and the sales rollup in sync
+        refresh_product_rentability(db, [instance.product_id])
+        add_sales_to_rollup(db, [db_sale.sale_id])
+
         db.commit()
         db.refresh(db_sale)
         return db_sale
@@ -1536,15 +2240,33 @@ def sell_product(
 
 
 # Sales history endpoints
+def _sales_history_query(
+    product_id: Optional[int] = None,
+    payment_method: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+):
+    """Sales matching the filters, most recent first; `end` is exclusive"""
+    query = select(models.Sale).join(models.Product)
+    if product_id:
+        query = query.where(models.Sale.product_id == product_id)
+    if payment_method:
+        query = query.where(models.Sale.payment_method == payment_method)
+    if start:
+        query = query.where(models.Sale.sale_date >= start)
+    if end:
+        query = query.where(models.Sale.sale_date < end)
+    return query.order_by(models.Sale.sale_date.desc())
+
 @app.get("/sales/", response_model=List[schema.SaleResponse])
-def get_sales_history(
+async def get_sales_history(
     skip: int = 0,
     limit: int = 100,
     product_id: Optional[int] = None,
     payment_method: Optional[str] = None,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get sales history with optional filtering
@@ -1558,20 +2280,10 @@ def get_sales_history(
     - end_date: Filter sales before this date (format: YYYY-MM-DD)
     """
     try:
-        # Start with a base query
-        query = db.query(models.Sale).join(models.Product)
-        
-        # Apply filters if provided
-        if product_id:
-            query = query.filter(models.Sale.product_id == product_id)
-        
-        if payment_method:
-            query = query.filter(models.Sale.payment_method == payment_method)
-        
+        start_datetime = end_datetime = None
         if start_date:
             try:
-                start_date_obj = datetime.strptime(start_date, "%Y-%m-%d")
-                query = query.filter(models.Sale.sale_date >= start_date_obj)
+                start_datetime = datetime.strptime(start_date, "%Y-%m-%d")
             except ValueError:
                 raise HTTPException(
                     status_code=400,
@@ -1580,21 +2292,19 @@ def get_sales_history(
         
         if end_date:
             try:
-                end_date_obj = datetime.strptime(end_date, "%Y-%m-%d")
                 # Add one day to include the end date fully
-                end_date_obj = end_date_obj + timedelta(days=1)
-                query = query.filter(models.Sale.sale_date < end_date_obj)
+                end_datetime = datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1)
             except ValueError:
                 raise HTTPException(
                     status_code=400,
                     detail="Invalid end_date format. Use YYYY-MM-DD"
                 )
         
-        # Order by most recent sales first
-        query = query.order_by(models.Sale.sale_date.desc())
+        query = _sales_history_query(product_id, payment_method, start_datetime, end_datetime)
         
         # Apply pagination
-        sales = query.offset(skip).limit(limit).all()
+        result = await db.execute(query.offset(skip).limit(limit))
+        sales = result.scalars().all()
         
         return sales
     
@@ -1604,6 +2314,68 @@ def get_sales_history(
             detail=f"An error occurred while retrieving sales history: {str(e)}"
         )
 
+@app.get("/sales/rollup", response_model=List[dict])
+def get_sales_rollup(
+    period: str = "day",
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    group_by: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Sales totals per day or month read from the sales rollup.
+
+    Parameters:
+    - period: "day" or "month"
+    - start_date / end_date: inclusive bounds on the period start (format: YYYY-MM-DD)
+    - group_by: optional breakdown, one of payment_method, category or location
+    """
+    if period not in ROLLUP_PERIODS:
+        raise HTTPException(status_code=400, detail=f"period must be one of: {', '.join(ROLLUP_PERIODS)}")
+    if group_by is not None and group_by not in ROLLUP_GROUPS:
+        raise HTTPException(status_code=400, detail=f"group_by must be one of: {', '.join(ROLLUP_GROUPS)}")
+
+    rollup = models.SalesRollup
+    columns = [rollup.period_start]
+    if group_by:
+        columns.append(ROLLUP_GROUPS[group_by].label(group_by))
+
+    query = db.query(
+        *columns,
+        func.sum(rollup.sales_count).label("sales_count"),
+        func.sum(rollup.revenue).label("revenue"),
+        func.sum(rollup.cost).label("cost"),
+        func.sum(rollup.shipping).label("shipping")
+    ).filter(rollup.period == period)
+    if start_date:
+        query = query.filter(rollup.period_start >= start_date)
+    if end_date:
+        query = query.filter(rollup.period_start <= end_date)
+
+    rows = query.group_by(*columns).order_by(*columns).all()
+    return [
+        {
+            **row._asdict(),
+            "sales_count": int(row.sales_count),
+            "revenue": float(row.revenue),
+            "cost": float(row.cost),
+            "shipping": float(row.shipping),
+        }
+        for row in rows
+    ]
+
+@app.post("/sales/rollup/rebuild", response_model=dict)
+def rebuild_rollup(db: Session = Depends(get_db)):
+    """Recompute the sales rollup from the full sales history"""
+    try:
+        rows = rebuild_sales_rollup(db)
+        db.commit()
+        return {"message": "Sales rollup rebuilt", "rows": rows}
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error rebuilding sales rollup: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error rebuilding sales rollup: {str(e)}")
+
 @app.get("/sales/{sale_id}", response_model=schema.SaleDetailResponse)
 def get_sale_details(
     sale_id: int,
@@ -1617,32 +2389,281 @@ def get_sale_details(
     
     return sale
 
+@app.delete("/sales/{sale_id}", response_model=dict)
+def delete_sale(
+    sale_id: int,
+    db: Session = Depends(get_db)
+):
+    """
+    Delete a sale record, keeping the product rentability and the sales rollup in sync.
+    The instance that was sold is not changed.
+    """
+    sale = db.query(models.Sale).filter(models.Sale.sale_id == sale_id).first()
+    if not sale:
+        raise HTTPException(status_code=404, detail="Sale not found")
+
+    try:
+        product_id = sale.product_id
+        remove_sales_from_rollup(db, [sale_id])
+        db.delete(sale)
+        db.flush()
+        refresh_product_rentability(db, [product_id])
+        db.commit()
+        return {"message": "Sale deleted successfully", "sale_id": sale_id}
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error deleting sale: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error deleting sale: {str(e)}")
+
+# Columns that can be requested through the `fields` projection of /instances/.
+# Product columns are addressed with a "product." prefix, e.g. fields=instance_id,product.name
+INSTANCE_PROJECTION_FIELDS = {
+    "instance_id": models.ProductInstance.instance_id,
+    "product_id": models.ProductInstance.product_id,
+    "base_cost": models.ProductInstance.base_cost,
+    "status": models.ProductInstance.status,
+    "purchase_date": models.ProductInstance.purchase_date,
+    "location": models.ProductInstance.location,
+    "condition": models.ProductInstance.condition,
+    "created_at": models.ProductInstance.created_at,
+    "updated_at": models.ProductInstance.updated_at,
+    "product.product_id": models.Product.product_id,
+    "product.sku": models.Product.sku,
+    "product.name": models.Product.name,
+    "product.description": models.Product.description,
+    "product.category_id": models.Product.category_id,
+    "product.event_id": models.Product.event_id,
+    "product.condition": models.Product.condition,
+    "product.is_active": models.Product.is_active,
+    "product.purchase_date": models.Product.purchase_date,
+    "product.obtained_method": models.Product.obtained_method,
+    "product.created_at": models.Product.created_at,
+    "product.updated_at": models.Product.updated_at,
+    "product.image_hash": models.Product.image_hash,
+}
+
+class _ExplainJSON(Executable, ClauseElement):
+    """EXPLAIN (FORMAT JSON) of a statement, compiled with its bound parameters"""
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+@compiles(_ExplainJSON, "postgresql")
+def _compile_explain_json(element, compiler, **kw):
+    return f"EXPLAIN (FORMAT JSON) {compiler.process(element.statement, **kw)}"
+
+async def _estimate_query_count(db: AsyncSession, statement) -> int:
+    """
+    Estimate the number of rows a select statement returns.
+    On PostgreSQL the planner estimate is read from EXPLAIN, which avoids a full
+    COUNT(*) scan on large tables; other databases fall back to an exact count.
+    Filter values are sent as bound parameters, never inlined into the SQL.
+    """
+    statement = statement.order_by(None)
+    if db.bind.dialect.name != "postgresql":
+        result = await db.execute(select(func.count()).select_from(statement.subquery()))
+        return result.scalar_one()
+
+    plan = (await db.execute(_ExplainJSON(statement))).scalar()
+    # asyncpg returns json columns as text
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+def _instances_query(
+    projection: Optional[List[str]] = None,
+    name: Optional[str] = None,
+    category_id: Optional[int] = None,
+    location: Optional[str] = None,
+    status: Optional[str] = None,
+    condition: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None
+):
+    """Instances joined to their product and filtered; only the `projection` columns when given"""
+    if projection:
+        query = select(*[INSTANCE_PROJECTION_FIELDS[field] for field in projection])
+    else:
+        query = select(models.ProductInstance).options(
+            contains_eager(models.ProductInstance.product).load_only(
+                models.Product.product_id,
+                models.Product.sku,
+                models.Product.category_id,
+                models.Product.event_id,
+                models.Product.name,
+                models.Product.description,
+                models.Product.location,
+                models.Product.condition,
+                models.Product.is_active,
+                models.Product.purchase_date,
+                models.Product.obtained_method,
+                models.Product.created_at,
+                models.Product.updated_at,
+                models.Product.image_count,
+                models.Product.image_hash
+            )
+        )
+
+    query = query.join(
+        models.Product, models.ProductInstance.product_id == models.Product.product_id
+    )
+
+    # Apply filters if provided
+    if name:
+        query = query.where(models.Product.name.ilike(f"%{name}%"))
+    if category_id:
+        query = query.where(models.Product.category_id == category_id)
+    if location:
+        query = query.where(models.ProductInstance.location == location)
+    if status:
+        query = query.where(models.ProductInstance.status == status)
+    if condition:
+        query = query.where(models.ProductInstance.condition == condition)
+    if start_date:
+        query = query.where(models.ProductInstance.purchase_date >= start_date)
+    if end_date:
+        query = query.where(models.ProductInstance.purchase_date <= end_date)
+
+    return query
+
 @app.get("/instances/", response_model=List[schema.ProductInstanceWithProductResponse])
-def get_instances(db: Session = Depends(get_db)):
-    """Get all product instances with product details"""
-    instances = db.query(models.ProductInstance).options(
-        joinedload(models.ProductInstance.product).load_only(
-            models.Product.product_id,
-            models.Product.sku,
-            models.Product.category_id,
-            models.Product.event_id,
-            models.Product.name,
-            models.Product.description,
-            models.Product.condition,
-            models.Product.is_active,
-            models.Product.purchase_date,
-            models.Product.obtained_method,
-            models.Product.created_at,
-            models.Product.updated_at
-            # Note: Excluding Product.location to avoid conflict
+async def get_instances(
+    response: Response,
+    cursor: Optional[int] = Query(None, ge=0, description="Return instances with instance_id greater than this value"),
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Page size; omit to return all matching instances"),
+    name: Optional[str] = None,
+    category_id: Optional[int] = None,
+    location: Optional[str] = None,
+    status: Optional[str] = None,
+    condition: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    fields: Optional[str] = Query(None, description="Comma separated list of fields to return"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Get product instances with product details.
+
+    Results are ordered by instance_id and paginated with a keyset cursor: pass the
+    X-Next-Cursor header of a page as `cursor` to fetch the next one. Filters are
+    applied in the database and `fields` limits the response to the given columns.
+    The X-Total-Count header of the first page (no cursor) carries an estimate
+    of the total matching rows; later pages skip it.
+    """
+    projection = None
+    if fields:
+        projection = [field.strip() for field in fields.split(",") if field.strip()]
+        unknown_fields = [field for field in projection if field not in INSTANCE_PROJECTION_FIELDS]
+        if unknown_fields:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown fields: {', '.join(unknown_fields)}"
+            )
+        if "instance_id" not in projection:
+            projection.insert(0, "instance_id")
+
+    query = _instances_query(projection, name, category_id, location, status, condition, start_date, end_date)
+
+    headers = {}
+    if cursor is None:
+        headers["X-Total-Count"] = str(await _estimate_query_count(db, query))
+    else:
+        query = query.where(models.ProductInstance.instance_id > cursor)
+    query = query.order_by(models.ProductInstance.instance_id)
+
+    if limit is not None:
+        # Fetch one extra row to find out whether there is a next page
+        query = query.limit(limit + 1)
+
+    result = await db.execute(query)
+    rows = result.scalars().all() if projection is None else result.all()
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        headers["X-Next-Cursor"] = str(rows[-1].instance_id)
+
+    if projection is None:
+        response.headers.update(headers)
+        return rows
+
+    items = []
+    for row in rows:
+        item = {}
+        for field, value in zip(projection, row):
+            if field.startswith("product."):
+                item.setdefault("product", {})[field[len("product."):]] = value
+            else:
+                item[field] = value
+        items.append(item)
+    return JSONResponse(
+        content=jsonable_encoder(items, custom_encoder={Decimal: str}),
+        headers=headers
+    )
+
+# Export endpoints
+def _accepts_gzip(accept_encoding: str) -> bool:
+    """
+    Whether an Accept-Encoding header allows gzip: a gzip entry decides on its
+    own, otherwise a "*" entry does, and a q-value of 0 means "not acceptable"
+    """
+    qvalues = {}
+    for entry in accept_encoding.lower().split(","):
+        coding, _, params = entry.partition(";")
+        coding = coding.strip()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qvalues[coding] = q
+    q = qvalues.get("gzip", qvalues.get("*", 0.0))
+    return q > 0
+
+@app.get("/export/{dataset}")
+def export_dataset(
+    dataset: str,
+    request: Request,
+    export_format: str = Query("csv", alias="format", description="csv or ndjson"),
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    session_factory=Depends(get_session_factory)
+):
+    """
+    Stream a whole dataset (instances, sales, products or pnl) as CSV or NDJSON.
+
+    Rows are read with a server-side cursor and written out as they arrive, so
+    exports of any size use constant memory. start_date/end_date limit the rows
+    by purchase date (instances, products), sale date or P&L month. The response
+    is gzip-compressed when the client sends Accept-Encoding: gzip.
+    """
+    if dataset not in EXPORT_DATASETS:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Unknown dataset. Use one of: {', '.join(EXPORT_DATASETS)}"
+        )
+    if export_format not in EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported export format. Use one of: {', '.join(EXPORT_FORMATS)}"
+        )
+
+    use_gzip = _accepts_gzip(request.headers.get("accept-encoding", ""))
+    filename = f"{dataset}-{date.today().isoformat()}.{export_format}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"', "Vary": "Accept-Encoding"}
+    if use_gzip:
+        headers["Content-Encoding"] = "gzip"
+
+    statement = build_export_statement(dataset, start_date, end_date)
+    return StreamingResponse(
+        stream_export(session_factory, statement, export_format, gzip=use_gzip),
+        media_type=EXPORT_FORMATS[export_format],
+        headers=headers
     )
-    ).all()
-    
-    # Debug: Check if product data is loaded
-    if instances:
-        print(f"First instance product: {instances[0].product}")
-    
-    return instances
 
 @app.post("/migrate-products-to-instances/", response_model=dict)
 def migrate_products_to_instances(db: Session = Depends(get_db)):
@@ -1756,30 +2777,21 @@ def bulk_update_instance_location(
 ):
     """Bulk update location for a list of instances."""
     logger.info(f"Received bulk_update_instance_location request_data: {request_data}")
-    updated_count = 0
-    errors = []
-
-    instances_to_update = db.query(models.ProductInstance).filter(
-        models.ProductInstance.instance_id.in_(request_data.instance_ids)
-    ).all()
-
-    found_instance_ids = {i.instance_id for i in instances_to_update}
-
-    for instance_id in request_data.instance_ids:
-        if instance_id not in found_instance_ids:
-            errors.append({"instance_id": instance_id, "error": "Instance not found"})
-
-    for instance in instances_to_update:
-        instance.location = request_data.new_location
-        updated_count += 1
-
-    if updated_count > 0:
-        try:
-            db.commit()
-        except Exception as e:
-            db.rollback()
-            logger.error(f"Error during bulk update commit: {str(e)}")
-            raise HTTPException(status_code=500, detail="An error occurred during the update.")
+    updated_ids = set()
+    if request_data.instance_ids:
+        updated_ids = set(_bulk_update_location(
+            db,
+            models.ProductInstance,
+            models.ProductInstance.instance_id,
+            [_id_in(db, models.ProductInstance.instance_id, request_data.instance_ids)],
+            request_data.new_location
+        ))
+
+    errors = [
+        {"instance_id": instance_id, "error": "Instance not found"}
+        for instance_id in request_data.instance_ids if instance_id not in updated_ids
+    ]
+    updated_count = len(updated_ids)
 
     return {
         "message": f"Bulk location update attempted. {updated_count} instances updated.",
@@ -1787,6 +2799,32 @@ def bulk_update_instance_location(
         "errors": errors
     }
 
+@app.patch("/instances/move-location", response_model=dict)
+def move_instances_location(
+    request_data: schema.InstanceLocationMoveRequest,
+    db: Session = Depends(get_db)
+):
+    """
+    Move every instance matching a filter to a new location in one statement,
+    e.g. all available instances of a category from one warehouse to another.
+    """
+    criteria = [models.ProductInstance.location == request_data.from_location]
+    if request_data.status:
+        criteria.append(models.ProductInstance.status == request_data.status)
+    if request_data.product_id is not None:
+        criteria.append(models.ProductInstance.product_id == request_data.product_id)
+    if request_data.category_id is not None:
+        criteria.append(models.ProductInstance.product_id.in_(
+            select(models.Product.product_id).where(models.Product.category_id == request_data.category_id)
+        ))
+
+    updated_count = _move_location(db, models.ProductInstance, criteria, request_data.new_location)
+
+    return {
+        "message": f"Moved {updated_count} instances from {request_data.from_location} to {request_data.new_location}.",
+        "updated_count": updated_count
+    }
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--reset-db", action="store_true", help="Reset the database")
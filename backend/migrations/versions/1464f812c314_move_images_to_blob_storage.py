@@ -0,0 +1,105 @@
+"""move product images and receipts to blob storage
+
+Revision ID: 1464f812c314
+Revises: a6a14b5b205e
+Create Date: 2026-10-17 10:03:55.402117
+
+The image_data and receipt_data columns are kept (now nullable) so nothing is
+lost if the copied blobs turn out to be unreadable; drop them in a follow-up
+migration once every image and receipt has been checked in blob storage.
+
+"""
+import os
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from storage import create_blob_storage
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1464f812c314'
+down_revision: Union[str, None] = 'a6a14b5b205e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _durable_blob_storage():
+    """
+    The configured blob storage, refusing the local backend: on Heroku and in
+    Docker containers the local disk is discarded on the next deploy, taking
+    every copied image with it. Set BLOB_STORAGE_ALLOW_LOCAL_MIGRATION=true to
+    migrate onto a local disk that is known to persist (development machines).
+    """
+    backend = os.getenv("BLOB_STORAGE_BACKEND", "local")
+    allow_local = os.getenv("BLOB_STORAGE_ALLOW_LOCAL_MIGRATION", "false").lower() == "true"
+    if backend != "s3" and not allow_local:
+        raise RuntimeError(
+            "Moving images to blob storage needs a durable backend: set BLOB_STORAGE_BACKEND=s3 "
+            "(or BLOB_STORAGE_ALLOW_LOCAL_MIGRATION=true if the local disk persists)"
+        )
+    return create_blob_storage(backend)
+
+
+def _move_to_storage(connection, storage, table, id_column, data_column, hash_column, size_column):
+    """Copy every non-empty BYTEA value into blob storage, one row at a time"""
+    row_ids = connection.execute(sa.text(
+        f"SELECT {id_column} FROM {table} WHERE {data_column} IS NOT NULL ORDER BY {id_column}"
+    )).scalars().all()
+    for row_id in row_ids:
+        data = connection.execute(sa.text(
+            f"SELECT {data_column} FROM {table} WHERE {id_column} = :row_id"
+        ), {"row_id": row_id}).scalar()
+        key = storage.put(bytes(data))
+        connection.execute(sa.text(
+            f"UPDATE {table} SET {hash_column} = :key, {size_column} = :size WHERE {id_column} = :row_id"
+        ), {"key": key, "size": len(data), "row_id": row_id})
+
+
+def _restore_from_storage(connection, storage, table, id_column, data_column, hash_column):
+    """Copy blobs stored after the upgrade back into the BYTEA column, one row at a time"""
+    rows = connection.execute(sa.text(
+        f"SELECT {id_column}, {hash_column} FROM {table} "
+        f"WHERE {hash_column} IS NOT NULL AND {data_column} IS NULL ORDER BY {id_column}"
+    )).all()
+    for row_id, key in rows:
+        with storage.open(key) as blob:
+            data = blob.read()
+        connection.execute(sa.text(
+            f"UPDATE {table} SET {data_column} = :data WHERE {id_column} = :row_id"
+        ), {"data": data, "row_id": row_id})
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    storage = _durable_blob_storage()
+    connection = op.get_bind()
+
+    op.add_column('product_images', sa.Column('image_hash', sa.String(length=64), nullable=True))
+    op.add_column('product_images', sa.Column('image_size', sa.Integer(), nullable=True))
+    op.add_column('travel_expenses', sa.Column('receipt_hash', sa.String(length=64), nullable=True))
+    op.add_column('travel_expenses', sa.Column('receipt_size', sa.Integer(), nullable=True))
+
+    _move_to_storage(connection, storage, 'product_images', 'image_id', 'image_data', 'image_hash', 'image_size')
+    _move_to_storage(connection, storage, 'travel_expenses', 'expense_id', 'receipt_data', 'receipt_hash', 'receipt_size')
+
+    # image_data was NOT NULL, so every image now has a hash. New uploads only
+    # go to blob storage, so the legacy column has to accept NULL.
+    op.alter_column('product_images', 'image_hash', existing_type=sa.String(length=64), nullable=False)
+    op.alter_column('product_images', 'image_data', existing_type=sa.LargeBinary(), nullable=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    storage = create_blob_storage()
+    connection = op.get_bind()
+
+    _restore_from_storage(connection, storage, 'product_images', 'image_id', 'image_data', 'image_hash')
+    _restore_from_storage(connection, storage, 'travel_expenses', 'expense_id', 'receipt_data', 'receipt_hash')
+
+    op.alter_column('product_images', 'image_data', existing_type=sa.LargeBinary(), nullable=False)
+    op.drop_column('travel_expenses', 'receipt_size')
+    op.drop_column('travel_expenses', 'receipt_hash')
+    op.drop_column('product_images', 'image_size')
+    op.drop_column('product_images', 'image_hash')
@@ -0,0 +1,48 @@
+"""add sales rollup table
+
+Revision ID: 5c0e9d7a2b41
+Revises: 1464f812c314
+Create Date: 2026-10-17 11:26:08.512930
+
+The table starts empty; fill it from the sales history with
+`python rebuild_sales_rollup.py` (or POST /sales/rollup/rebuild).
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c0e9d7a2b41'
+down_revision: Union[str, None] = '1464f812c314'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('sales_rollup',
+    sa.Column('rollup_id', sa.Integer(), nullable=False),
+    sa.Column('period', sa.String(length=5), nullable=False),
+    sa.Column('period_start', sa.Date(), nullable=False),
+    sa.Column('payment_method', sa.String(length=20), nullable=False),
+    sa.Column('category_id', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('location', sa.String(length=100), nullable=False, server_default=''),
+    sa.Column('sales_count', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('revenue', sa.Numeric(precision=14, scale=2), nullable=False, server_default='0.00'),
+    sa.Column('cost', sa.Numeric(precision=14, scale=2), nullable=False, server_default='0.00'),
+    sa.Column('shipping', sa.Numeric(precision=14, scale=2), nullable=False, server_default='0.00'),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('rollup_id'),
+    sa.UniqueConstraint('period', 'period_start', 'payment_method', 'category_id', 'location', name='uq_sales_rollup_bucket')
+    )
+    op.create_index(op.f('ix_sales_rollup_rollup_id'), 'sales_rollup', ['rollup_id'], unique=False)
+    op.create_index(op.f('ix_sales_rollup_period_start'), 'sales_rollup', ['period_start'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_sales_rollup_period_start'), table_name='sales_rollup')
+    op.drop_index(op.f('ix_sales_rollup_rollup_id'), table_name='sales_rollup')
+    op.drop_table('sales_rollup')
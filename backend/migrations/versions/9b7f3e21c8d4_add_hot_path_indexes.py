@@ -0,0 +1,56 @@
+"""add indexes for foreign keys and hot query paths
+
+Revision ID: 9b7f3e21c8d4
+Revises: 5c0e9d7a2b41
+Create Date: 2026-10-17 12:04:31.770215
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9b7f3e21c8d4'
+down_revision: Union[str, None] = '5c0e9d7a2b41'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (index name, table, columns) of the plain and composite indexes
+INDEXES = [
+    ('ix_travel_expenses_event_id', 'travel_expenses', ['event_id']),
+    ('ix_products_category_id', 'products', ['category_id']),
+    ('ix_products_event_id', 'products', ['event_id']),
+    ('ix_products_location', 'products', ['location']),
+    ('ix_products_purchase_date', 'products', ['purchase_date']),
+    ('ix_product_images_product_id_is_primary', 'product_images', ['product_id', 'is_primary']),
+    ('ix_product_instances_product_id_status', 'product_instances', ['product_id', 'status']),
+    ('ix_product_instances_location', 'product_instances', ['location']),
+    ('ix_inventory_product_id', 'inventory', ['product_id']),
+    ('ix_price_points_product_id_effective_from', 'price_points', ['product_id', 'effective_from']),
+    ('ix_price_history_product_id', 'price_history', ['product_id']),
+    ('ix_supplier_products_supplier_id', 'supplier_products', ['supplier_id']),
+    ('ix_supplier_products_product_id', 'supplier_products', ['product_id']),
+    ('ix_order_items_order_id', 'order_items', ['order_id']),
+    ('ix_order_items_product_id', 'order_items', ['product_id']),
+    ('ix_sales_product_id_sale_date', 'sales', ['product_id', 'sale_date']),
+    ('ix_sales_sale_date', 'sales', ['sale_date']),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, unique=False)
+    op.create_index(
+        'ix_product_instances_available', 'product_instances', ['product_id'], unique=False,
+        postgresql_where=sa.text("status = 'available'")
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_product_instances_available', table_name='product_instances')
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,43 @@
+"""add product rentability table
+
+Revision ID: a6a14b5b205e
+Revises: 83738e4b524c
+Create Date: 2026-10-17 09:12:41.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a6a14b5b205e'
+down_revision: Union[str, None] = '83738e4b524c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('product_rentability',
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('rentability_percentage', sa.Numeric(precision=12, scale=2), nullable=False, server_default='0.00'),
+    sa.Column('average_profit', sa.Numeric(precision=12, scale=2), nullable=False, server_default='0.00'),
+    sa.Column('total_revenue', sa.Numeric(precision=12, scale=2), nullable=False, server_default='0.00'),
+    sa.Column('total_cost', sa.Numeric(precision=12, scale=2), nullable=False, server_default='0.00'),
+    sa.Column('total_profit', sa.Numeric(precision=12, scale=2), nullable=False, server_default='0.00'),
+    sa.Column('sales_count', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['product_id'], ['products.product_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('product_id')
+    )
+    op.create_index('ix_product_rentability_rentability_percentage', 'product_rentability', ['rentability_percentage'], unique=False)
+    op.create_index('ix_product_rentability_total_profit', 'product_rentability', ['total_profit'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_product_rentability_total_profit', table_name='product_rentability')
+    op.drop_index('ix_product_rentability_rentability_percentage', table_name='product_rentability')
+    op.drop_table('product_rentability')
@@ -0,0 +1,54 @@
+"""add the sku sequence and per-prefix sku counters
+
+Revision ID: a8d4f6b2c913
+Revises: f2c8d5e04b17
+Create Date: 2026-10-17 19:12:05.530871
+
+"""
+import re
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a8d4f6b2c913'
+down_revision: Union[str, None] = 'f2c8d5e04b17'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Generated SKUs: two-letter prefix, YYMMDDHHMM, then a sequence number
+GENERATED_SKU = re.compile(r"^(.{2})\d{10}(\d{4,})$")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    sku_counters = op.create_table('sku_counters',
+    sa.Column('prefix', sa.String(length=10), nullable=False),
+    sa.Column('last_value', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('prefix')
+    )
+
+    # Start numbering after the highest sequence any prefix has used in any
+    # minute, so new SKUs cannot repeat one generated by the per-minute allocator
+    last_values = {}
+    for (sku,) in op.get_bind().execute(sa.text("SELECT sku FROM products")):
+        match = GENERATED_SKU.match(sku or "")
+        if match:
+            prefix, sequence = match.group(1), int(match.group(2))
+            last_values[prefix] = max(last_values.get(prefix, 0), sequence)
+
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute(sa.schema.CreateSequence(sa.Sequence('sku_sequence', start=max(last_values.values(), default=0) + 1)))
+    elif last_values:
+        op.bulk_insert(sku_counters, [
+            {'prefix': prefix, 'last_value': last_value} for prefix, last_value in last_values.items()
+        ])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute(sa.schema.DropSequence(sa.Sequence('sku_sequence')))
+    op.drop_table('sku_counters')
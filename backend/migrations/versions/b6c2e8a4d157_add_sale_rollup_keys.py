@@ -0,0 +1,38 @@
+"""record the rollup breakdown and costs on sales
+
+Revision ID: b6c2e8a4d157
+Revises: a8d4f6b2c913
+Create Date: 2026-10-18 10:21:47.118402
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b6c2e8a4d157'
+down_revision: Union[str, None] = 'a8d4f6b2c913'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema.
+
+    Existing sales are filled in by the next rollup rebuild
+    (rebuild_sales_rollup.py), which stores the breakdown it counts them with.
+    """
+    op.add_column('sales', sa.Column('rollup_category_id', sa.Integer(), nullable=True))
+    op.add_column('sales', sa.Column('rollup_location', sa.String(length=100), nullable=True))
+    op.add_column('sales', sa.Column('rollup_cost', sa.Numeric(precision=12, scale=2), nullable=True))
+    op.add_column('sales', sa.Column('rollup_shipping', sa.Numeric(precision=12, scale=2), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('sales', 'rollup_shipping')
+    op.drop_column('sales', 'rollup_cost')
+    op.drop_column('sales', 'rollup_location')
+    op.drop_column('sales', 'rollup_category_id')
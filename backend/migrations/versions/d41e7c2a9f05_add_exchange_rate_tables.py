@@ -0,0 +1,46 @@
+"""add exchange rate snapshot and history tables
+
+Revision ID: d41e7c2a9f05
+Revises: 9b7f3e21c8d4
+Create Date: 2026-10-17 16:02:41.207315
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd41e7c2a9f05'
+down_revision: Union[str, None] = '9b7f3e21c8d4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('exchange_rate_snapshots',
+    sa.Column('base_currency', sa.String(length=3), nullable=False),
+    sa.Column('rates', sa.JSON(), nullable=False),
+    sa.Column('effective_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('fetched_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('base_currency')
+    )
+    op.create_table('exchange_rate_history',
+    sa.Column('rate_id', sa.Integer(), nullable=False),
+    sa.Column('base_currency', sa.String(length=3), nullable=False),
+    sa.Column('currency', sa.String(length=3), nullable=False),
+    sa.Column('rate', sa.Numeric(precision=20, scale=10), nullable=False),
+    sa.Column('effective_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('rate_id'),
+    sa.UniqueConstraint('base_currency', 'currency', 'effective_at', name='uq_exchange_rate_history_rate')
+    )
+    op.create_index(op.f('ix_exchange_rate_history_rate_id'), 'exchange_rate_history', ['rate_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_exchange_rate_history_rate_id'), table_name='exchange_rate_history')
+    op.drop_table('exchange_rate_history')
+    op.drop_table('exchange_rate_snapshots')
@@ -0,0 +1,57 @@
+"""add exchange rates and base-currency amounts to sales, price points and travel expenses
+
+Revision ID: e7a3b9c15d62
+Revises: d41e7c2a9f05
+Create Date: 2026-10-17 16:48:10.934127
+
+Rows in USD are filled here. Rows in other currencies need the exchange rate
+history; convert them with `python backfill_base_currency.py`.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7a3b9c15d62'
+down_revision: Union[str, None] = 'd41e7c2a9f05'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# table -> (has its own currency column already, amount column -> base-currency column)
+CONVERTED_AMOUNTS = {
+    'sales': (False, {'sale_price': 'sale_price_base'}),
+    'price_points': (True, {
+        'base_cost': 'base_cost_base',
+        'selling_price': 'selling_price_base',
+        'shipment_cost': 'shipment_cost_base',
+    }),
+    'travel_expenses': (False, {'amount': 'amount_base'}),
+}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table, (has_currency, amounts) in CONVERTED_AMOUNTS.items():
+        if not has_currency:
+            op.add_column(table, sa.Column('currency', sa.String(length=3), nullable=False, server_default='USD'))
+        op.add_column(table, sa.Column('fx_rate', sa.Numeric(precision=20, scale=10), nullable=True))
+        for base_column in amounts.values():
+            op.add_column(table, sa.Column(base_column, sa.Numeric(precision=12, scale=2), nullable=True))
+
+        assignments = ", ".join(f"{base} = {amount}" for amount, base in amounts.items())
+        op.execute(
+            f"UPDATE {table} SET fx_rate = 1, {assignments} "
+            f"WHERE currency IS NULL OR currency = 'USD'"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table, (has_currency, amounts) in CONVERTED_AMOUNTS.items():
+        for base_column in amounts.values():
+            op.drop_column(table, base_column)
+        op.drop_column(table, 'fx_rate')
+        if not has_currency:
+            op.drop_column(table, 'currency')
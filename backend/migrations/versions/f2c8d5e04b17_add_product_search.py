@@ -0,0 +1,59 @@
+"""add product full-text and trigram search
+
+Revision ID: f2c8d5e04b17
+Revises: e7a3b9c15d62
+Create Date: 2026-10-17 17:20:54.381209
+
+Adds a generated tsvector column to products (name and SKU weighted above the
+description) searched through the yanstore_search text search configuration,
+which is 'simple' plus unaccent, and pg_trgm GIN indexes on name, sku and
+description for fuzzy matches. Needs the pg_trgm and unaccent extensions
+(both ship with PostgreSQL's contrib package).
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2c8d5e04b17'
+down_revision: Union[str, None] = 'e7a3b9c15d62'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TRIGRAM_INDEXES = {
+    'ix_products_name_trgm': 'name',
+    'ix_products_sku_trgm': 'sku',
+    'ix_products_description_trgm': 'description',
+}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.execute("CREATE EXTENSION IF NOT EXISTS unaccent")
+    op.execute("CREATE TEXT SEARCH CONFIGURATION yanstore_search (COPY = simple)")
+    op.execute(
+        "ALTER TEXT SEARCH CONFIGURATION yanstore_search "
+        "ALTER MAPPING FOR hword, hword_part, word WITH unaccent, simple"
+    )
+    op.execute("""
+        ALTER TABLE products ADD COLUMN search_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('yanstore_search'::regconfig, coalesce(name, '')), 'A')
+            || setweight(to_tsvector('yanstore_search'::regconfig, coalesce(sku, '')), 'A')
+            || setweight(to_tsvector('yanstore_search'::regconfig, coalesce(description, '')), 'C')
+        ) STORED
+    """)
+    op.execute("CREATE INDEX ix_products_search_vector ON products USING gin (search_vector)")
+    for name, column in TRIGRAM_INDEXES.items():
+        op.execute(f"CREATE INDEX {name} ON products USING gin ({column} gin_trgm_ops)")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for name in TRIGRAM_INDEXES:
+        op.execute(f"DROP INDEX IF EXISTS {name}")
+    op.execute("DROP INDEX IF EXISTS ix_products_search_vector")
+    op.execute("ALTER TABLE products DROP COLUMN IF EXISTS search_vector")
+    op.execute("DROP TEXT SEARCH CONFIGURATION IF EXISTS yanstore_search")
@@ -1,8 +1,24 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Numeric, ForeignKey, Date, Text, LargeBinary
-from sqlalchemy.orm import relationship, backref
+from sqlalchemy import select, Sequence, Column, Integer, String, DateTime, Boolean, Numeric, ForeignKey, Date, Text, UniqueConstraint, Index, JSON, text
+from sqlalchemy.orm import relationship, backref, column_property
 from sqlalchemy.sql import func
 from database import Base
 
+# Currency every report aggregates in; see currency.py
+BASE_CURRENCY = "USD"
+
+def _in_base_currency(context) -> bool:
+    return context.get_current_parameters().get("currency") in (None, BASE_CURRENCY)
+
+def _fx_rate_default(context):
+    """Insert default of fx_rate: 1 for rows in the base currency, set by currency.py otherwise"""
+    return 1 if _in_base_currency(context) else None
+
+def _base_amount_default(amount_column: str):
+    """Insert default of a base-currency amount: the amount itself when it is already in the base currency"""
+    def default(context):
+        return context.get_current_parameters().get(amount_column) if _in_base_currency(context) else None
+    return default
+
 class Event(Base):
     """
     Manages events where the company goes to collect products for sale.
@@ -32,12 +48,16 @@ class TravelExpense(Base):
     __tablename__ = "travel_expenses"
 
     expense_id = Column(Integer, primary_key=True, index=True)
-    event_id = Column(Integer, ForeignKey('events.event_id', ondelete='CASCADE'), nullable=False)
+    event_id = Column(Integer, ForeignKey('events.event_id', ondelete='CASCADE'), nullable=False, index=True)
     name = Column(String(200), nullable=False)
     description = Column(Text)
     amount = Column(Numeric(10, 2), nullable=False)
+    currency = Column(String(3), nullable=False, default=BASE_CURRENCY, server_default=BASE_CURRENCY)
+    fx_rate = Column(Numeric(20, 10), default=_fx_rate_default)  # Units of currency per unit of BASE_CURRENCY
+    amount_base = Column(Numeric(12, 2), default=_base_amount_default("amount"))
     expense_date = Column(Date, nullable=False)
-    receipt_data = Column(LargeBinary)  # Store receipt image data
+    receipt_hash = Column(String(64))  # SHA-256 key of the receipt image in blob storage
+    receipt_size = Column(Integer)
     receipt_type = Column(String(10))  # 'jpg' or 'png'
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -45,6 +65,10 @@ class TravelExpense(Base):
     # Relationships
     event = relationship("Event", back_populates="travel_expenses")
 
+    @property
+    def has_receipt(self) -> bool:
+        return self.receipt_hash is not None
+
 class ProductCategory(Base):
     __tablename__ = "product_categories"
     
@@ -62,14 +86,16 @@ class Product(Base):
     
     product_id = Column(Integer, primary_key=True, index=True)
     sku = Column(String(50), unique=True, nullable=False)
-    category_id = Column(Integer, ForeignKey('product_categories.category_id', ondelete='SET NULL'))
-    event_id = Column(Integer, ForeignKey('events.event_id', ondelete='SET NULL'))
+    category_id = Column(Integer, ForeignKey('product_categories.category_id', ondelete='SET NULL'), index=True)
+    event_id = Column(Integer, ForeignKey('events.event_id', ondelete='SET NULL'), index=True)
     name = Column(String(200), nullable=False)
     description = Column(String)
-    location = Column(String(100))
+    # On PostgreSQL the table also has a generated search_vector column and trigram
+    # indexes on name, sku and description, used by /search/products (see search.py)
+    location = Column(String(100), index=True)
     condition = Column(String(20), nullable=False) 
     is_active = Column(Boolean, default=True)
-    purchase_date = Column(Date)  # Changed from DateTime to Date
+    purchase_date = Column(Date, index=True)  # Changed from DateTime to Date
     obtained_method = Column(String(50))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -84,69 +110,52 @@ class Product(Base):
     supplier_products = relationship("SupplierProduct", back_populates="product", cascade="all, delete-orphan")
     order_items = relationship("OrderItem", back_populates="product", cascade="all, delete-orphan")
     inventory = relationship("Inventory", back_populates="product", cascade="all, delete-orphan")
+    rentability = relationship("ProductRentability", back_populates="product", uselist=False, cascade="all, delete-orphan")
 
     def calculate_rentability(self, db_session) -> dict:
         """Calculate various rentability metrics for the product"""
-        # Get latest price point
-        latest_price = (db_session.query(PricePoint)
-            .filter(PricePoint.product_id == self.product_id)
-            .order_by(PricePoint.effective_from.desc())
-            .first())
-            
-        # Get all sales for this product
-        sales = (db_session.query(Sale)
-            .filter(Sale.product_id == self.product_id)
-            .all())
-            
-        if not latest_price:
-            return {
-                "rentability_percentage": 0,
-                "average_profit": 0,
-                "total_revenue": 0,
-                "total_cost": 0,
-                "total_profit": 0,
-                "sales_count": 0
-            }
-
-        # Calculate metrics
-        total_revenue = sum(float(sale.sale_price) for sale in sales)
-        total_cost = float(latest_price.base_cost + latest_price.shipment_cost)
-        sales_count = len(sales)
-        
-        # Avoid division by zero
-        if sales_count == 0 or total_cost == 0:
-            return {
-                "rentability_percentage": 0,
-                "average_profit": 0,
-                "total_revenue": total_revenue,
-                "total_cost": total_cost,
-                "total_profit": 0,
-                "sales_count": 0
-            }
-
-        total_profit = total_revenue - (total_cost * sales_count)
-        average_profit = total_profit / sales_count
-        rentability_percentage = (total_profit / (total_cost * sales_count)) * 100
+        from rentability import compute_rentability
 
+        metrics = compute_rentability(db_session, [self.product_id])[self.product_id]
         return {
-            "rentability_percentage": round(rentability_percentage, 2),
-            "average_profit": round(average_profit, 2),
-            "total_revenue": round(total_revenue, 2),
-            "total_cost": round(total_cost, 2),
-            "total_profit": round(total_profit, 2),
-            "sales_count": sales_count
+            key: value if key == "sales_count" else float(value)
+            for key, value in metrics.items()
         }
 
+class ProductRentability(Base):
+    """
+    Precomputed rentability metrics per product.
+    Kept up to date when sales or price points are recorded, so listings
+    can be sorted and paginated without recomputing every product.
+    """
+    __tablename__ = "product_rentability"
+
+    product_id = Column(Integer, ForeignKey('products.product_id', ondelete='CASCADE'), primary_key=True)
+    rentability_percentage = Column(Numeric(12, 2), nullable=False, default=0.00, index=True)
+    average_profit = Column(Numeric(12, 2), nullable=False, default=0.00)
+    total_revenue = Column(Numeric(12, 2), nullable=False, default=0.00)
+    total_cost = Column(Numeric(12, 2), nullable=False, default=0.00)
+    total_profit = Column(Numeric(12, 2), nullable=False, default=0.00, index=True)
+    sales_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    # Relationship back to product
+    product = relationship("Product", back_populates="rentability")
+
 class ProductImage(Base):
     """
     Stores product images with their relationships to products.
     One product can have multiple images, but only one primary image.
     """
     __tablename__ = "product_images"
+    __table_args__ = (
+        Index('ix_product_images_product_id_is_primary', 'product_id', 'is_primary'),
+    )
 
     image_id = Column(Integer, primary_key=True, index=True)
     product_id = Column(Integer, ForeignKey('products.product_id', ondelete='CASCADE'), nullable=False)
-    image_data = Column(LargeBinary, nullable=False)  # Store the actual image data
+    image_hash = Column(String(64), nullable=False)  # SHA-256 key of the image in blob storage
+    image_size = Column(Integer)
     image_type = Column(String(10), nullable=False)
     is_primary = Column(Boolean, default=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -154,15 +163,48 @@ class ProductImage(Base):
     # Relationship back to product
     product = relationship("Product", back_populates="images")
 
+# Number of images of a product, counted in SQL so listings can show it without
+# loading the images. Deferred: endpoints that return it undefer it in their query.
+Product.image_count = column_property(
+    select(func.count(ProductImage.image_id))
+    .where(ProductImage.product_id == Product.product_id)
+    .correlate_except(ProductImage)
+    .scalar_subquery(),
+    deferred=True
+)
+
+# Blob key of the image /products/{id}/image serves (the primary one, else the
+# first), so clients can request it as ?v=<hash> and cache it for good.
+# Deferred like image_count.
+Product.image_hash = column_property(
+    select(ProductImage.image_hash)
+    .where(ProductImage.product_id == Product.product_id)
+    .order_by(ProductImage.is_primary.desc().nulls_last(), ProductImage.image_id)
+    .limit(1)
+    .correlate_except(ProductImage)
+    .scalar_subquery(),
+    deferred=True
+)
+
 class ProductInstance(Base):
     __tablename__ = "product_instances"
+    __table_args__ = (
+        Index('ix_product_instances_product_id_status', 'product_id', 'status'),
+        # Most reads only look at stock that can still be sold
+        Index(
+            'ix_product_instances_available',
+            'product_id',
+            postgresql_where=text("status = 'available'"),
+            sqlite_where=text("status = 'available'")
+        ),
+    )
     
     instance_id = Column(Integer, primary_key=True, index=True)
     product_id = Column(Integer, ForeignKey("products.product_id"), nullable=False)
     base_cost = Column(Numeric(10, 2), nullable=False)
     status = Column(String(20), default='available', nullable=False)
     purchase_date = Column(Date, nullable=True)
-    location = Column(String(100), nullable=True)
+    location = Column(String(100), nullable=True, index=True)
     condition = Column(String(50), nullable=True, default='New')  # Add default value
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
@@ -178,7 +220,7 @@ class Inventory(Base):
     __tablename__ = "inventory"
 
     inventory_id = Column(Integer, primary_key=True, index=True)
-    product_id = Column(Integer, ForeignKey('products.product_id', ondelete='CASCADE'), nullable=False)
+    product_id = Column(Integer, ForeignKey('products.product_id', ondelete='CASCADE'), nullable=False, index=True)
     quantity = Column(Integer, nullable=False, default=0)
     available_quantity = Column(Integer, nullable=False, default=0)
     reserved_quantity = Column(Integer, nullable=False, default=0)
@@ -216,6 +258,9 @@ class PricePoint(Base):
     Supports multiple currencies and tracks price effectiveness periods.
     """
     __tablename__ = "price_points"
+    __table_args__ = (
+        Index('ix_price_points_product_id_effective_from', 'product_id', 'effective_from'),
+    )
 
     price_point_id = Column(Integer, primary_key=True, index=True)
     product_id = Column(Integer, ForeignKey('products.product_id', ondelete='CASCADE'), nullable=False)
@@ -224,6 +269,12 @@ class PricePoint(Base):
     market_price = Column(Numeric(10, 2))
     shipment_cost = Column(Numeric(10, 2), default=0.00, nullable=False)
     currency = Column(String(3), default='USD')
+    # Rate used when the price point was recorded (units of currency per unit of
+    # BASE_CURRENCY) and the amounts converted with it, so reports can SUM them
+    fx_rate = Column(Numeric(20, 10), default=_fx_rate_default)
+    base_cost_base = Column(Numeric(12, 2), default=_base_amount_default("base_cost"))
+    selling_price_base = Column(Numeric(12, 2), default=_base_amount_default("selling_price"))
+    shipment_cost_base = Column(Numeric(12, 2), default=_base_amount_default("shipment_cost"))
     effective_from = Column(DateTime(timezone=True), server_default=func.now())
     effective_to = Column(DateTime(timezone=True))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -239,7 +290,7 @@ class PriceHistory(Base):
     __tablename__ = "price_history"
 
     history_id = Column(Integer, primary_key=True, index=True)
-    product_id = Column(Integer, ForeignKey('products.product_id', ondelete='CASCADE'), nullable=False)
+    product_id = Column(Integer, ForeignKey('products.product_id', ondelete='CASCADE'), nullable=False, index=True)
     old_price = Column(Numeric(10, 2), nullable=False)
     new_price = Column(Numeric(10, 2), nullable=False)
     change_date = Column(DateTime(timezone=True), server_default=func.now())
@@ -275,8 +326,8 @@ class SupplierProduct(Base):
     __tablename__ = "supplier_products"
 
     supplier_product_id = Column(Integer, primary_key=True, index=True)
-    supplier_id = Column(Integer, ForeignKey('suppliers.supplier_id', ondelete='CASCADE'), nullable=False)
-    product_id = Column(Integer, ForeignKey('products.product_id', ondelete='CASCADE'), nullable=False)
+    supplier_id = Column(Integer, ForeignKey('suppliers.supplier_id', ondelete='CASCADE'), nullable=False, index=True)
+    product_id = Column(Integer, ForeignKey('products.product_id', ondelete='CASCADE'), nullable=False, index=True)
     supplier_sku = Column(String(50))
     supplier_price = Column(Numeric(10, 2), nullable=False)
     lead_time_days = Column(Integer)
@@ -320,8 +371,8 @@ class OrderItem(Base):
     __tablename__ = "order_items"
 
     order_item_id = Column(Integer, primary_key=True, index=True)
-    order_id = Column(Integer, ForeignKey('orders.order_id', ondelete='CASCADE'), nullable=False)
-    product_id = Column(Integer, ForeignKey('products.product_id', ondelete='CASCADE'), nullable=False)
+    order_id = Column(Integer, ForeignKey('orders.order_id', ondelete='CASCADE'), nullable=False, index=True)
+    product_id = Column(Integer, ForeignKey('products.product_id', ondelete='CASCADE'), nullable=False, index=True)
     quantity = Column(Integer, nullable=False)
     unit_price = Column(Numeric(10, 2), nullable=False)
     subtotal = Column(Numeric(10, 2), nullable=False)
@@ -338,13 +389,26 @@ class Sale(Base):
     Links to product and maintains sale history.
     """
     __tablename__ = "sales"
+    __table_args__ = (
+        Index('ix_sales_product_id_sale_date', 'product_id', 'sale_date'),
+    )
 
     sale_id = Column(Integer, primary_key=True, index=True)
     product_id = Column(Integer, ForeignKey('products.product_id', ondelete='CASCADE'), nullable=False)
     sale_price = Column(Numeric(10, 2), nullable=False)
-    sale_date = Column(DateTime(timezone=True), nullable=False)
+    currency = Column(String(3), nullable=False, default=BASE_CURRENCY, server_default=BASE_CURRENCY)
+    fx_rate = Column(Numeric(20, 10), default=_fx_rate_default)  # Units of currency per unit of BASE_CURRENCY
+    sale_price_base = Column(Numeric(12, 2), default=_base_amount_default("sale_price"))
+    sale_date = Column(DateTime(timezone=True), nullable=False, index=True)
     payment_method = Column(String(20), nullable=False)
     notes = Column(Text)
+    # Breakdown and costs the sale was counted with in the sales rollup, so that
+    # deleting it later subtracts exactly that even if the product has moved or
+    # been re-priced since. rollup_location is NULL until the sale is counted.
+    rollup_category_id = Column(Integer)  # 0 when the product had no category
+    rollup_location = Column(String(100))  # '' when the product had no location
+    rollup_cost = Column(Numeric(12, 2))
+    rollup_shipping = Column(Numeric(12, 2))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     # Relationships
@@ -374,6 +438,70 @@ class FinancialMetric(Base):
     profit_margin = Column(Numeric(5, 2))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
+class SalesRollup(Base):
+    """
+    Sales aggregated per day and per month, broken down by payment method,
+    category and location. Updated in the same transaction as every sale
+    that is recorded or deleted, so reports read one row per period instead
+    of scanning the sales table.
+    Uncategorized sales use category_id 0 and sales without a location use
+    an empty string, keeping every breakdown key non-null and unique.
+    """
+    __tablename__ = "sales_rollup"
+    __table_args__ = (
+        UniqueConstraint('period', 'period_start', 'payment_method', 'category_id', 'location', name='uq_sales_rollup_bucket'),
+    )
+
+    rollup_id = Column(Integer, primary_key=True, index=True)
+    period = Column(String(5), nullable=False)  # 'day' or 'month'
+    period_start = Column(Date, nullable=False, index=True)
+    payment_method = Column(String(20), nullable=False)
+    category_id = Column(Integer, nullable=False, default=0)
+    location = Column(String(100), nullable=False, default='')
+    sales_count = Column(Integer, nullable=False, default=0)
+    revenue = Column(Numeric(14, 2), nullable=False, default=0.00)
+    cost = Column(Numeric(14, 2), nullable=False, default=0.00)
+    shipping = Column(Numeric(14, 2), nullable=False, default=0.00)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+# Numbers of generated SKUs on PostgreSQL, shared by every prefix (see skus.allocate_skus)
+SKU_SEQUENCE = Sequence("sku_sequence", metadata=Base.metadata)
+
+class SkuCounter(Base):
+    """
+    Last SKU sequence number handed out for each category prefix, used instead
+    of SKU_SEQUENCE on databases without sequences (see skus.allocate_skus)
+    """
+    __tablename__ = "sku_counters"
+
+    prefix = Column(String(10), primary_key=True)
+    last_value = Column(Integer, nullable=False)
+
+class ExchangeRateSnapshot(Base):
+    """
+    Last good set of exchange rates fetched for a base currency, so the
+    rates survive restarts and outages of the rate provider.
+    """
+    __tablename__ = "exchange_rate_snapshots"
+
+    base_currency = Column(String(3), primary_key=True)
+    rates = Column(JSON, nullable=False)  # {"COP": 4012.5, "EUR": 0.92, ...}
+    effective_at = Column(DateTime(timezone=True), nullable=False)  # When the provider last updated the rates
+    fetched_at = Column(DateTime(timezone=True), nullable=False)
+
+class ExchangeRateHistory(Base):
+    """One row per currency each time the provider publishes new rates, for point-in-time conversion"""
+    __tablename__ = "exchange_rate_history"
+    __table_args__ = (
+        UniqueConstraint('base_currency', 'currency', 'effective_at', name='uq_exchange_rate_history_rate'),
+    )
+
+    rate_id = Column(Integer, primary_key=True, index=True)
+    base_currency = Column(String(3), nullable=False)
+    currency = Column(String(3), nullable=False)
+    rate = Column(Numeric(20, 10), nullable=False)
+    effective_at = Column(DateTime(timezone=True), nullable=False)
+
 class ProfitAndLoss(Base):
     __tablename__ = "profit_and_loss"
 
@@ -0,0 +1,227 @@
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Dict, List
+
+from sqlalchemy import case, func, literal, null, select, union_all
+from sqlalchemy.orm import Session
+
+import models
+
+ZERO = Decimal("0.0")
+
+
+def add_months(month_start: date, months: int) -> date:
+    """Return the first day of the month `months` after `month_start`"""
+    month_index = month_start.year * 12 + month_start.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def month_starts(first_month: date, last_month: date) -> List[date]:
+    """List the first day of every month between two months, inclusive"""
+    months = []
+    current = first_month.replace(day=1)
+    while current <= last_month:
+        months.append(current)
+        current = add_months(current, 1)
+    return months
+
+
+def _month_label(db: Session, column):
+    """SQL expression rendering a date/timestamp column as 'YYYY-MM'"""
+    if db.bind.dialect.name == "postgresql":
+        return func.to_char(column, "YYYY-MM")
+    return func.strftime("%Y-%m", column)
+
+
+def effective_sale_costs(*criteria):
+    """
+    Cost and shipment of every sale matching the criteria, taken from the price point that
+    was effective at sale time: the latest one starting on or before the sale, or
+    the earliest one when all price points were recorded after the sale.
+    Exactly one price point is kept per sale, so products with several price
+    points are no longer counted more than once. Amounts are the precomputed
+    base-currency (USD) columns, so sales in other currencies sum correctly.
+    """
+    started_before_sale = models.PricePoint.effective_from <= models.Sale.sale_date
+    ranked = select(
+        models.Sale.sale_id,
+        models.Sale.sale_date,
+        models.Sale.sale_price_base.label("sale_price"),
+        models.PricePoint.base_cost_base.label("base_cost"),
+        models.PricePoint.shipment_cost_base.label("shipment_cost"),
+        func.row_number().over(
+            partition_by=models.Sale.sale_id,
+            order_by=(
+                case((started_before_sale, 0), else_=1),
+                case((started_before_sale, models.PricePoint.effective_from)).desc(),
+                models.PricePoint.effective_from,
+                models.PricePoint.price_point_id
+            )
+        ).label("position")
+    ).select_from(models.Sale).outerjoin(
+        models.PricePoint, models.PricePoint.product_id == models.Sale.product_id
+    ).where(*criteria).subquery()
+    return select(ranked).where(ranked.c.position == 1).subquery()
+
+
+def _latest_product_costs():
+    """Base cost of each product's most recent price point"""
+    ranked = select(
+        models.PricePoint.product_id,
+        models.PricePoint.base_cost_base.label("base_cost"),
+        func.row_number().over(
+            partition_by=models.PricePoint.product_id,
+            order_by=(models.PricePoint.effective_from.desc().nulls_last(), models.PricePoint.price_point_id.desc())
+        ).label("position")
+    ).subquery()
+    return select(ranked).where(ranked.c.position == 1).subquery()
+
+
+def compute_profit_and_loss(db: Session, first_month: date, last_month: date) -> Dict[date, dict]:
+    """
+    Compute the profit and loss figures of every month between two months (inclusive).
+    Sales, purchases and inventory are aggregated per month by a single UNION ALL
+    query; the monthly statements are then derived from those few rows.
+    Returns a mapping of month start date to the ProfitAndLoss column values.
+    """
+    months = month_starts(first_month, last_month)
+    range_start, range_end = months[0], add_months(months[-1], 1)
+    range_start_dt = datetime.combine(range_start, time.min)
+    range_end_dt = datetime.combine(range_end, time.min)
+
+    sale_costs = effective_sale_costs(
+        models.Sale.sale_date >= range_start_dt,
+        models.Sale.sale_date < range_end_dt
+    )
+    product_costs = _latest_product_costs()
+
+    sales_by_month = select(
+        literal("sales").label("kind"),
+        _month_label(db, sale_costs.c.sale_date).label("month"),
+        null().label("location"),
+        func.sum(sale_costs.c.sale_price).label("amount"),
+        func.sum(sale_costs.c.base_cost).label("cost"),
+        func.sum(sale_costs.c.shipment_cost).label("shipment")
+    ).group_by(_month_label(db, sale_costs.c.sale_date))
+
+    purchases_by_month = select(
+        literal("purchases").label("kind"),
+        _month_label(db, models.Product.purchase_date).label("month"),
+        models.Product.location.label("location"),
+        func.sum(product_costs.c.base_cost).label("amount"),
+        null().label("cost"),
+        null().label("shipment")
+    ).select_from(models.Product).join(
+        product_costs, product_costs.c.product_id == models.Product.product_id
+    ).where(
+        models.Product.location.in_(["Colombia", "USA"]),
+        models.Product.purchase_date >= range_start,
+        models.Product.purchase_date < range_end
+    ).group_by(_month_label(db, models.Product.purchase_date), models.Product.location)
+
+    # Products still in inventory, bucketed by purchase month; everything bought
+    # before the range is folded into a single "before" bucket
+    inventory_month = case(
+        (models.Product.purchase_date < range_start, literal("before")),
+        else_=_month_label(db, models.Product.purchase_date)
+    )
+    inventory_by_month = select(
+        literal("inventory").label("kind"),
+        inventory_month.label("month"),
+        null().label("location"),
+        func.sum(product_costs.c.base_cost).label("amount"),
+        null().label("cost"),
+        null().label("shipment")
+    ).select_from(models.Product).join(
+        product_costs, product_costs.c.product_id == models.Product.product_id
+    ).join(
+        models.Inventory, models.Inventory.product_id == models.Product.product_id
+    ).where(
+        models.Inventory.quantity > 0,
+        models.Product.purchase_date < range_end
+    ).group_by(inventory_month)
+
+    rows = db.execute(union_all(sales_by_month, purchases_by_month, inventory_by_month)).all()
+
+    sales = {}
+    purchases = {}
+    inventory_added = {}
+    inventory_before_range = ZERO
+    for kind, month, location, amount, cost, shipment in rows:
+        if kind == "sales":
+            sales[month] = (Decimal(amount or 0), Decimal(cost or 0), Decimal(shipment or 0))
+        elif kind == "purchases":
+            purchases[(month, location)] = Decimal(amount or 0)
+        elif month == "before":
+            inventory_before_range = Decimal(amount or 0)
+        else:
+            inventory_added[month] = inventory_added.get(month, ZERO) + Decimal(amount or 0)
+
+    statements = {}
+    beginning_inventory_value = inventory_before_range
+    for month_start in months:
+        label = month_start.strftime("%Y-%m")
+        gross_sales, cost_of_sales, shipping_expense = sales.get(label, (ZERO, ZERO, ZERO))
+        purchases_colombia = purchases.get((label, "Colombia"), ZERO)
+        purchases_usa = purchases.get((label, "USA"), ZERO)
+
+        sales_discounts = ZERO
+        net_sales = gross_sales - sales_discounts
+        gross_profit = net_sales - (cost_of_sales + shipping_expense)
+        payroll_payments = ZERO
+        operating_income = gross_profit - payroll_payments
+        tax_collection = ZERO
+        reserve_collection = ZERO
+        net_income = operating_income - tax_collection
+
+        ending_inventory_value = beginning_inventory_value + purchases_colombia + purchases_usa - cost_of_sales
+        # If ending inventory is negative, adjust cost of sales to prevent negative inventory
+        if ending_inventory_value < 0:
+            cost_of_sales = beginning_inventory_value + purchases_colombia + purchases_usa
+            ending_inventory_value = ZERO
+
+        statements[month_start] = {
+            "gross_sales": gross_sales,
+            "sales_discounts": sales_discounts,
+            "shipping_expense": shipping_expense,
+            "gross_profit": gross_profit,
+            "beginning_inventory_value": beginning_inventory_value,
+            "purchases_colombia": purchases_colombia,
+            "purchases_usa": purchases_usa,
+            "ending_inventory_value": ending_inventory_value,
+            "cost_of_sales": cost_of_sales,
+            "payroll_payments": payroll_payments,
+            "costs_and_expenses": cost_of_sales + shipping_expense + payroll_payments,
+            "income": net_sales,
+            "operating_income": operating_income,
+            "tax_collection": tax_collection,
+            "reserve_collection": reserve_collection,
+            "net_income": net_income,
+        }
+        # Beginning inventory of the next month counts products bought up to the end of this one
+        beginning_inventory_value += inventory_added.get(label, ZERO)
+
+    return statements
+
+
+def save_profit_and_loss(db: Session, statements: Dict[date, dict]) -> List[models.ProfitAndLoss]:
+    """
+    Create or update the ProfitAndLoss rows of the given months.
+    Existing rows are fetched in one query; the caller is responsible for committing.
+    """
+    existing = {
+        pnl.month: pnl for pnl in db.query(models.ProfitAndLoss).filter(
+            models.ProfitAndLoss.month.in_(list(statements))
+        ).all()
+    }
+
+    saved = []
+    for month_start, values in sorted(statements.items()):
+        pnl = existing.get(month_start)
+        if pnl is None:
+            pnl = models.ProfitAndLoss(month=month_start)
+            db.add(pnl)
+        for field, value in values.items():
+            setattr(pnl, field, value)
+        saved.append(pnl)
+    return saved
@@ -0,0 +1,215 @@
+import csv
+import io
+import json
+import logging
+from collections import defaultdict
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+import models
+import schema
+from skus import allocate_skus, sku_prefix
+
+logger = logging.getLogger(__name__)
+
+IMPORT_FORMATS = ("csv", "jsonl")
+DEFAULT_IMPORT_BATCH_SIZE = 1000
+
+
+def detect_import_format(filename: Optional[str], content_type: Optional[str]) -> Optional[str]:
+    """Guess the import format from the uploaded file's name or content type"""
+    name = (filename or "").lower()
+    if name.endswith(".csv") or content_type == "text/csv":
+        return "csv"
+    if name.endswith((".jsonl", ".ndjson")) or content_type in ("application/x-ndjson", "application/jsonl"):
+        return "jsonl"
+    return None
+
+
+def iter_import_rows(fileobj: BinaryIO, import_format: str) -> Iterator[Tuple[int, Optional[dict], Optional[str]]]:
+    """
+    Read an import file one row at a time, yielding (row number, data, parse error).
+    Row numbers start at 1 for the first data row (the CSV header is not counted).
+    Empty CSV cells are turned into None so optional fields can be left blank.
+    """
+    text = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+    if import_format == "csv":
+        for row_number, row in enumerate(csv.DictReader(text), start=1):
+            yield row_number, {
+                key.strip(): (value.strip() or None) if isinstance(value, str) else value
+                for key, value in row.items() if key
+            }, None
+        return
+
+    row_number = 0
+    for line in text:
+        if not line.strip():
+            continue
+        row_number += 1
+        try:
+            data = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield row_number, None, f"Invalid JSON: {e.msg}"
+            continue
+        if not isinstance(data, dict):
+            yield row_number, None, "Each line must be a JSON object"
+            continue
+        yield row_number, data, None
+
+
+def _validation_message(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in item['loc'])}: {item['msg']}" for item in error.errors()
+    )
+
+
+class ProductImporter:
+    """
+    Validates import rows as they are read and inserts them in batches:
+    one multi-row INSERT ... RETURNING for the products of a batch and one
+    executemany for their instances, committed per batch.
+    Categories and events are looked up once up front instead of per row.
+    """
+
+    def __init__(self, db: Session, batch_size: int = DEFAULT_IMPORT_BATCH_SIZE):
+        self.db = db
+        self.batch_size = batch_size
+        self.categories: Dict[int, str] = dict(
+            db.query(models.ProductCategory.category_id, models.ProductCategory.category_name).all()
+        )
+        self.category_ids_by_name = {name.lower(): category_id for category_id, name in self.categories.items()}
+        self.event_ids = {event_id for (event_id,) in db.query(models.Event.event_id).all()}
+        self.seen_skus = set()
+        self.imported_count = 0
+        self.instance_count = 0
+        self.errors: List[dict] = []
+
+    def _error(self, row_number: int, message: str) -> None:
+        self.errors.append({"row": row_number, "error": message})
+
+    def _resolve_category(self, row: schema.ProductImportRow) -> Optional[int]:
+        if row.category_id is not None:
+            return row.category_id if row.category_id in self.categories else None
+        if row.category:
+            return self.category_ids_by_name.get(row.category.strip().lower())
+        return None
+
+    def validate(self, row_number: int, data: dict) -> Optional[Tuple[int, schema.ProductImportRow, int]]:
+        try:
+            row = schema.ProductImportRow(**data)
+        except ValidationError as e:
+            self._error(row_number, _validation_message(e))
+            return None
+
+        category_id = self._resolve_category(row)
+        if category_id is None:
+            self._error(row_number, "Category not found")
+            return None
+        if row.event_id is not None and row.event_id not in self.event_ids:
+            self._error(row_number, "Event not found")
+            return None
+        if row.sku:
+            if row.sku in self.seen_skus:
+                self._error(row_number, f"Duplicate SKU '{row.sku}' in file")
+                return None
+            self.seen_skus.add(row.sku)
+        return row_number, row, category_id
+
+    def _assign_skus(self, batch: List[Tuple[int, schema.ProductImportRow, int]]) -> List[Tuple[int, schema.ProductImportRow, int, str]]:
+        given_skus = [row.sku for _, row, _ in batch if row.sku]
+        taken = set()
+        if given_skus:
+            taken = {
+                sku for (sku,) in self.db.query(models.Product.sku).filter(models.Product.sku.in_(given_skus)).all()
+            }
+
+        needs_sku = defaultdict(list)
+        assigned = []
+        for row_number, row, category_id in batch:
+            if row.sku is None:
+                needs_sku[sku_prefix(self.categories[category_id])].append((row_number, row, category_id))
+            elif row.sku in taken:
+                self._error(row_number, f"SKU '{row.sku}' already exists")
+            else:
+                assigned.append((row_number, row, category_id, row.sku))
+
+        for prefix, rows in needs_sku.items():
+            for (row_number, row, category_id), sku in zip(rows, allocate_skus(self.db, prefix, len(rows))):
+                assigned.append((row_number, row, category_id, sku))
+        return assigned
+
+    def flush(self, batch: List[Tuple[int, schema.ProductImportRow, int]]) -> None:
+        if not batch:
+            return
+        assigned = self._assign_skus(batch)
+        if not assigned:
+            return
+
+        try:
+            result = self.db.execute(
+                insert(models.Product).returning(models.Product.product_id, models.Product.sku),
+                [
+                    {
+                        "name": row.name,
+                        "sku": sku,
+                        "category_id": category_id,
+                        "event_id": row.event_id,
+                        "description": row.description,
+                        "condition": row.condition,
+                        "purchase_date": row.purchase_date,
+                        "location": row.location,
+                        "obtained_method": row.obtained_method,
+                    }
+                    for _, row, category_id, sku in assigned
+                ]
+            )
+            product_ids = {sku: product_id for product_id, sku in result.all()}
+
+            instance_rows = [
+                {
+                    "product_id": product_ids[sku],
+                    "base_cost": base_cost,
+                    "purchase_date": row.purchase_date,
+                    "location": row.location,
+                    "condition": row.condition,
+                }
+                for _, row, _, sku in assigned
+                for base_cost in row.base_costs
+            ]
+            self.db.execute(insert(models.ProductInstance), instance_rows)
+            self.db.commit()
+        except Exception as e:
+            self.db.rollback()
+            logger.error(f"Error importing products batch: {str(e)}")
+            for row_number, *_ in assigned:
+                self._error(row_number, "Batch insert failed; no product of this batch was imported")
+            return
+
+        self.imported_count += len(assigned)
+        self.instance_count += len(instance_rows)
+
+    def run(self, rows: Iterator[Tuple[int, Optional[dict], Optional[str]]]) -> dict:
+        batch = []
+        for row_number, data, parse_error in rows:
+            if parse_error:
+                self._error(row_number, parse_error)
+                continue
+            validated = self.validate(row_number, data)
+            if validated is None:
+                continue
+            batch.append(validated)
+            if len(batch) >= self.batch_size:
+                self.flush(batch)
+                batch = []
+        self.flush(batch)
+
+        self.errors.sort(key=lambda error: error["row"])
+        return {
+            "message": f"Imported {self.imported_count} products",
+            "imported_count": self.imported_count,
+            "instance_count": self.instance_count,
+            "errors": self.errors,
+        }
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Rebuild the sales rollup table from the full sales history.
+
+Run it once after the sales_rollup and sale rollup keys migrations (it stores
+on older sales the breakdown they are counted with), or whenever the rollup needs
+to be recomputed (for example after editing sales directly in the database).
+"""
+
+import logging
+import os
+import sys
+
+# Add the backend directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database import SessionLocal
+from sales_rollup import rebuild_sales_rollup
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def main():
+    db = SessionLocal()
+    try:
+        rows = rebuild_sales_rollup(db)
+        db.commit()
+        logger.info(f"Sales rollup rebuilt with {rows} rows")
+    except Exception as e:
+        logger.error(f"Rebuilding the sales rollup failed: {e}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+from decimal import Decimal
+from typing import Dict, List, Optional
+
+from sqlalchemy import and_, delete, func, insert
+from sqlalchemy.orm import Session
+
+import models
+
+ZERO = Decimal("0.00")
+TWO_PLACES = Decimal("0.01")
+
+# Columns of ProductRentability that the products-with-rentability endpoint can sort by
+RENTABILITY_SORT_FIELDS = [
+    "rentability_percentage",
+    "average_profit",
+    "total_revenue",
+    "total_cost",
+    "total_profit",
+    "sales_count",
+]
+
+
+def _rentability_metrics(unit_cost: Optional[Decimal], total_revenue: Decimal, sales_count: int) -> dict:
+    """
+    Turn the aggregated figures of one product into its rentability metrics.
+    Mirrors the rules of the original per-product calculation: without a price
+    point everything is zero, and without sales or cost only revenue and cost are kept.
+    """
+    if unit_cost is None:
+        return {
+            "rentability_percentage": ZERO,
+            "average_profit": ZERO,
+            "total_revenue": ZERO,
+            "total_cost": ZERO,
+            "total_profit": ZERO,
+            "sales_count": 0
+        }
+
+    if sales_count == 0 or unit_cost == 0:
+        return {
+            "rentability_percentage": ZERO,
+            "average_profit": ZERO,
+            "total_revenue": total_revenue.quantize(TWO_PLACES),
+            "total_cost": unit_cost.quantize(TWO_PLACES),
+            "total_profit": ZERO,
+            "sales_count": 0
+        }
+
+    total_profit = total_revenue - (unit_cost * sales_count)
+    return {
+        "rentability_percentage": (total_profit / (unit_cost * sales_count) * 100).quantize(TWO_PLACES),
+        "average_profit": (total_profit / sales_count).quantize(TWO_PLACES),
+        "total_revenue": total_revenue.quantize(TWO_PLACES),
+        "total_cost": unit_cost.quantize(TWO_PLACES),
+        "total_profit": total_profit.quantize(TWO_PLACES),
+        "sales_count": sales_count
+    }
+
+
+def compute_rentability(db: Session, product_ids: Optional[List[int]] = None) -> Dict[int, dict]:
+    """
+    Compute rentability metrics for many products in one grouped query.
+    The latest price point of each product is picked with a ROW_NUMBER window
+    and joined to the per-product sales aggregates.
+    Returns a mapping of product_id to its metrics.
+    """
+    latest_price = db.query(
+        models.PricePoint.product_id.label("product_id"),
+        (models.PricePoint.base_cost_base + models.PricePoint.shipment_cost_base).label("unit_cost"),
+        func.row_number().over(
+            partition_by=models.PricePoint.product_id,
+            order_by=(models.PricePoint.effective_from.desc().nulls_last(), models.PricePoint.price_point_id.desc())
+        ).label("position")
+    )
+    sales = db.query(
+        models.Sale.product_id.label("product_id"),
+        func.sum(models.Sale.sale_price_base).label("total_revenue"),
+        func.count(models.Sale.sale_id).label("sales_count")
+    )
+    if product_ids is not None:
+        latest_price = latest_price.filter(models.PricePoint.product_id.in_(product_ids))
+        sales = sales.filter(models.Sale.product_id.in_(product_ids))
+
+    latest_price = latest_price.subquery()
+    sales = sales.group_by(models.Sale.product_id).subquery()
+
+    query = db.query(
+        models.Product.product_id,
+        latest_price.c.unit_cost,
+        func.coalesce(sales.c.total_revenue, 0),
+        func.coalesce(sales.c.sales_count, 0)
+    ).outerjoin(
+        latest_price,
+        and_(latest_price.c.product_id == models.Product.product_id, latest_price.c.position == 1)
+    ).outerjoin(
+        sales, sales.c.product_id == models.Product.product_id
+    )
+    if product_ids is not None:
+        query = query.filter(models.Product.product_id.in_(product_ids))
+
+    return {
+        product_id: _rentability_metrics(
+            Decimal(unit_cost) if unit_cost is not None else None,
+            Decimal(total_revenue),
+            int(sales_count)
+        )
+        for product_id, unit_cost, total_revenue, sales_count in query.all()
+    }
+
+
+def refresh_product_rentability(db: Session, product_ids: Optional[List[int]] = None) -> int:
+    """
+    Recompute the stored rentability rows for the given products, or for every
+    product when no ids are given. The caller is responsible for committing.
+    Returns the number of rows written.
+    """
+    metrics = compute_rentability(db, product_ids)
+
+    statement = delete(models.ProductRentability)
+    if product_ids is not None:
+        statement = statement.where(models.ProductRentability.product_id.in_(product_ids))
+    db.execute(statement)
+
+    if metrics:
+        db.execute(
+            insert(models.ProductRentability),
+            [{"product_id": product_id, **values} for product_id, values in metrics.items()]
+        )
+    return len(metrics)
+
+
+def refresh_missing_rentability(db: Session) -> int:
+    """
+    Compute rentability rows for products that do not have one yet,
+    such as products created after the last refresh.
+    The caller is responsible for committing.
+    """
+    missing_ids = [
+        product_id for (product_id,) in db.query(models.Product.product_id)
+        .outerjoin(
+            models.ProductRentability,
+            models.ProductRentability.product_id == models.Product.product_id
+        )
+        .filter(models.ProductRentability.product_id.is_(None))
+        .all()
+    ]
+    if not missing_ids:
+        return 0
+    return refresh_product_rentability(db, missing_ids)
@@ -0,0 +1,183 @@
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import case, delete, func, insert, select, update
+from sqlalchemy.orm import Session
+
+import models
+from pnl import effective_sale_costs
+
+ROLLUP_PERIODS = ("day", "month")
+
+# Breakdowns the rollup can be grouped by, mapped to their SalesRollup column
+ROLLUP_GROUPS = {
+    "payment_method": models.SalesRollup.payment_method,
+    "category": models.SalesRollup.category_id,
+    "location": models.SalesRollup.location,
+}
+
+ZERO = Decimal("0.00")
+
+BucketKey = Tuple[str, date, str, int, str]
+
+
+def _sale_rows(*criteria):
+    """
+    Sales matching the criteria with their effective cost and breakdown keys.
+    Sales already counted in the rollup use the keys and costs recorded on them;
+    the others use the product's current category and location and the price
+    point that was effective at sale time.
+    """
+    sale_costs = effective_sale_costs(*criteria)
+    counted = models.Sale.rollup_location.isnot(None)
+    return select(
+        models.Sale.sale_id,
+        counted.label("counted"),
+        sale_costs.c.sale_date,
+        sale_costs.c.sale_price,
+        case((counted, models.Sale.rollup_cost), else_=sale_costs.c.base_cost).label("base_cost"),
+        case((counted, models.Sale.rollup_shipping), else_=sale_costs.c.shipment_cost).label("shipment_cost"),
+        models.Sale.payment_method,
+        case((counted, models.Sale.rollup_category_id), else_=func.coalesce(models.Product.category_id, 0)).label("category_id"),
+        case((counted, models.Sale.rollup_location), else_=func.coalesce(models.Product.location, "")).label("location")
+    ).select_from(sale_costs).join(
+        models.Sale, models.Sale.sale_id == sale_costs.c.sale_id
+    ).join(
+        models.Product, models.Product.product_id == models.Sale.product_id
+    )
+
+
+def _bucket(rows: Iterable, sign: int = 1, uncounted: Optional[List[dict]] = None) -> Dict[BucketKey, list]:
+    """
+    Fold sale rows into [count, revenue, cost, shipping] per day and per month bucket.
+    The breakdown and costs of sales not counted before are appended to `uncounted`.
+    """
+    buckets: Dict[BucketKey, list] = {}
+    for sale_id, counted, sale_date, sale_price, base_cost, shipment_cost, payment_method, category_id, location in rows:
+        if not counted and uncounted is not None:
+            uncounted.append({
+                "sale_id": sale_id,
+                "rollup_category_id": category_id or 0,
+                "rollup_location": location or "",
+                "rollup_cost": base_cost,
+                "rollup_shipping": shipment_cost,
+            })
+        day = sale_date.date() if isinstance(sale_date, datetime) else sale_date
+        for period, period_start in (("day", day), ("month", day.replace(day=1))):
+            key = (period, period_start, payment_method, category_id or 0, location or "")
+            totals = buckets.setdefault(key, [0, ZERO, ZERO, ZERO])
+            totals[0] += sign
+            totals[1] += sign * Decimal(sale_price or 0)
+            totals[2] += sign * Decimal(base_cost or 0)
+            totals[3] += sign * Decimal(shipment_cost or 0)
+    return buckets
+
+
+def _record_counted(db: Session, counted: List[dict], batch_size: int = 1000) -> None:
+    """Store on each sale the breakdown and costs it was counted with"""
+    for start in range(0, len(counted), batch_size):
+        db.execute(update(models.Sale), counted[start:start + batch_size])
+
+
+def _rollup_rows(buckets: Dict[BucketKey, list]) -> List[dict]:
+    return [
+        {
+            "period": period,
+            "period_start": period_start,
+            "payment_method": payment_method,
+            "category_id": category_id,
+            "location": location,
+            "sales_count": sales_count,
+            "revenue": revenue,
+            "cost": cost,
+            "shipping": shipping,
+        }
+        for (period, period_start, payment_method, category_id, location), (sales_count, revenue, cost, shipping)
+        in buckets.items()
+    ]
+
+
+def _upsert_insert(db: Session):
+    if db.bind.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(models.SalesRollup)
+
+
+def _apply_deltas(db: Session, buckets: Dict[BucketKey, list]) -> None:
+    """
+    Add the bucket totals to the stored rollup with a single INSERT ... ON CONFLICT
+    DO UPDATE, so concurrent sales on the same day increment the row atomically.
+    Buckets left without sales are removed.
+    """
+    if not buckets:
+        return
+
+    rollup = models.SalesRollup
+    statement = _upsert_insert(db)
+    statement = statement.on_conflict_do_update(
+        index_elements=["period", "period_start", "payment_method", "category_id", "location"],
+        set_={
+            "sales_count": rollup.sales_count + statement.excluded.sales_count,
+            "revenue": rollup.revenue + statement.excluded.revenue,
+            "cost": rollup.cost + statement.excluded.cost,
+            "shipping": rollup.shipping + statement.excluded.shipping,
+            "updated_at": func.now(),
+        }
+    )
+    db.execute(statement, _rollup_rows(buckets))
+
+    touched_periods = {period_start for _, period_start, _, _, _ in buckets}
+    db.execute(
+        delete(rollup).where(
+            rollup.period_start.in_(touched_periods),
+            rollup.sales_count <= 0
+        )
+    )
+
+
+def add_sales_to_rollup(db: Session, sale_ids: List[int]) -> None:
+    """
+    Count newly recorded sales in the rollup. Call it after the sales are
+    flushed and before committing, so both are saved in the same transaction.
+    """
+    if sale_ids:
+        rows = db.execute(_sale_rows(models.Sale.sale_id.in_(sale_ids))).all()
+        counted = []
+        _apply_deltas(db, _bucket(rows, uncounted=counted))
+        _record_counted(db, counted)
+
+
+def remove_sales_from_rollup(db: Session, sale_ids: List[int]) -> None:
+    """
+    Subtract sales from the rollup, with the breakdown and costs they were
+    counted with. Must be called before the sales are deleted, in the same
+    transaction as the delete.
+    """
+    if sale_ids:
+        rows = db.execute(_sale_rows(models.Sale.sale_id.in_(sale_ids))).all()
+        _apply_deltas(db, _bucket(rows, sign=-1))
+
+
+def rebuild_sales_rollup(db: Session) -> int:
+    """
+    Recompute the whole rollup from the sales history, streaming the sales
+    instead of loading them at once. Sales keep the breakdown and costs they
+    were counted with; sales recorded before those were stored use the current
+    category and location of their product, which are then stored on them.
+    The caller is responsible for committing. Returns the number of rollup rows written.
+    """
+    rows = db.execute(
+        _sale_rows().execution_options(yield_per=1000)
+    )
+    counted = []
+    buckets = _bucket(rows, uncounted=counted)
+    _record_counted(db, counted)
+
+    db.execute(delete(models.SalesRollup))
+    rollup_rows = _rollup_rows(buckets)
+    if rollup_rows:
+        db.execute(insert(models.SalesRollup), rollup_rows)
+    return len(rollup_rows)
@@ -48,12 +48,17 @@ class EventResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class EventBudgetBatchRequest(BaseModel):
+    """Schema for recalculating end budgets of several events at once"""
+    event_ids: List[int]
+
 # Travel Expense Schemas
 class TravelExpenseBase(BaseModel):
     """Base schema for travel expense data"""
     name: str = Field(..., min_length=1, max_length=200)
     description: Optional[str] = None
     amount: Decimal = Field(..., ge=0)
+    currency: str = Field('USD', pattern='^[A-Z]{3}$')
     expense_date: date
 
 class TravelExpenseCreate(TravelExpenseBase):
@@ -71,7 +76,11 @@ class TravelExpenseResponse(TravelExpenseBase):
     """Schema for travel expense responses"""
     expense_id: int
     event_id: int
+    fx_rate: Optional[Decimal] = None  # Units of currency per USD when the expense was recorded
+    amount_base: Optional[Decimal] = None  # amount converted to USD
+    has_receipt: bool = False
     receipt_type: Optional[str] = None
+    receipt_hash: Optional[str] = None  # Pass as ?v= to /travel-expenses/{id}/receipt for a cacheable URL
     created_at: datetime
     updated_at: datetime
 
@@ -120,6 +129,49 @@ class ProductCreate(ProductBase):
     """Schema for creating a new product"""
     category_id: int
 
+class ProductImportRow(BaseModel):
+    """
+    One product of a bulk import file. The category can be given by id or by name,
+    and base_costs lists the cost of each instance (separated by ';' in CSV files).
+    A SKU is generated when none is given.
+    """
+    name: str = Field(..., min_length=1, max_length=200)
+    sku: Optional[str] = Field(None, min_length=3, max_length=50)
+    category_id: Optional[int] = None
+    category: Optional[str] = None
+    description: Optional[str] = None
+    condition: str = Field(..., pattern=VALID_CONDITIONS)
+    location: Optional[str] = Field(None, max_length=100)
+    purchase_date: date
+    obtained_method: str = Field(..., min_length=1, max_length=50)
+    event_id: Optional[int] = None
+    base_costs: List[Decimal] = Field(..., min_length=1)
+
+    @validator('base_costs', pre=True)
+    def split_base_costs(cls, v):
+        if isinstance(v, str):
+            return [cost.strip() for cost in v.split(';') if cost.strip()]
+        if isinstance(v, (int, float, Decimal)):
+            return [v]
+        return v
+
+    @validator('base_costs', each_item=True)
+    def non_negative_cost(cls, v):
+        if v < 0:
+            raise ValueError('Base costs must be greater than or equal to 0')
+        return v
+
+    @validator('purchase_date', pre=True)
+    def parse_date(cls, v):
+        if isinstance(v, str):
+            for date_format in ("%Y-%m-%d", "%m/%d/%Y", "%d/%m/%Y"):
+                try:
+                    return datetime.strptime(v, date_format).date()
+                except ValueError:
+                    continue
+            raise ValueError('Invalid date format. Use YYYY-MM-DD')
+        return v
+
 class ProductImageCreate(BaseModel):
     """Schema for creating a product image"""
     image_url: str
@@ -152,6 +204,10 @@ class PricePointCreate(PricePointBase):
 class PricePointResponse(PricePointBase):
     """Schema for price point responses"""
     price_point_id: int
+    fx_rate: Optional[Decimal] = None  # Units of currency per USD when the price point was recorded
+    base_cost_base: Optional[Decimal] = None
+    selling_price_base: Optional[Decimal] = None
+    shipment_cost_base: Optional[Decimal] = None
     created_at: datetime
 
     class Config:
@@ -199,6 +255,7 @@ class ProfitAndLossResponse(ProfitAndLossBase):
 class SaleBase(BaseModel):
     """Base schema for sale data"""
     sale_price: Decimal = Field(..., ge=0)
+    currency: str = Field('USD', pattern='^[A-Z]{3}$')
     sale_date: datetime
     payment_method: str = Field(..., pattern='^(Credit|Cash|USD|Trade)$')
     notes: Optional[str] = None
@@ -208,10 +265,25 @@ class SaleCreate(SaleBase):
     # product_id is not needed here as it comes from the URL path
     pass
 
+class InstanceSaleItem(BaseModel):
+    """One instance of a batch sale and the price it was sold for"""
+    instance_id: int
+    sale_price: Decimal = Field(..., ge=0)
+
+class InstanceSellBatchRequest(BaseModel):
+    """Schema for selling several instances at once, e.g. a lot of cards"""
+    sale_date: datetime
+    payment_method: str = Field(..., pattern='^(Credit|Cash|USD|Trade)$')
+    currency: str = Field('USD', pattern='^[A-Z]{3}$')
+    notes: Optional[str] = None
+    items: List[InstanceSaleItem] = Field(..., min_length=1)
+
 class SaleResponse(SaleBase):
     """Schema for sale responses"""
     sale_id: int
     product_id: int
+    fx_rate: Optional[Decimal] = None  # Units of currency per USD on the sale date
+    sale_price_base: Optional[Decimal] = None  # sale_price converted to USD
     created_at: datetime
 
     class Config:
@@ -264,6 +336,29 @@ class InstanceBulkUpdateLocationRequest(BaseModel):
     instance_ids: List[int]
     new_location: str = Field(..., min_length=1)
 
+class ProductCloneRequest(BaseModel):
+    """
+    Schema for duplicating a product. The copy gets a new SKU and shares the
+    original's images; base_costs lists the cost of each instance to create.
+    """
+    name: Optional[str] = Field(None, min_length=1, max_length=200)
+    base_costs: List[Decimal] = Field(default_factory=list, max_length=1000)
+    copy_images: bool = True
+
+    @validator('base_costs', each_item=True)
+    def non_negative_cost(cls, v):
+        if v < 0:
+            raise ValueError('Base costs must be greater than or equal to 0')
+        return v
+
+class InstanceLocationMoveRequest(BaseModel):
+    """Schema for moving every instance matching a filter to another location"""
+    from_location: str = Field(..., min_length=1)
+    new_location: str = Field(..., min_length=1)
+    status: Optional[str] = Field(default='available', pattern='^(available|sold|reserved)$')
+    category_id: Optional[int] = None
+    product_id: Optional[int] = None
+
 class ProductInstanceBase(BaseModel):
     """Base schema for product instance data"""
     product_id: int
@@ -327,10 +422,20 @@ class ProductResponse(ProductBase):
     total_cost: float = 0
     total_profit: float = 0
     sales_count: int = 0
+    image_count: int = 0
+    image_hash: Optional[str] = None  # Pass as ?v= to /products/{id}/image for a cacheable URL
 
     class Config:
         orm_mode = True
 
+class ProductListResponse(ProductResponse):
+    """Schema for the product listing, with per-product instance aggregates"""
+    available_count: int = 0
+    sold_count: int = 0
+    min_base_cost: Optional[float] = None
+    avg_base_cost: Optional[float] = None
+    max_base_cost: Optional[float] = None
+
 class PriceHistoryResponse(BaseModel):
     """Schema for price history responses"""
     history_id: int
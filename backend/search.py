@@ -0,0 +1,163 @@
+import html
+import re
+from typing import List
+
+from sqlalchemy import case, func, or_, select, text
+from sqlalchemy.orm import Session
+
+import models
+
+# Text search configuration created by the product search migration: the
+# 'simple' parser (no stemming, card names mix English, Spanish and Japanese)
+# with unaccent, so "pokemon" matches "Pokémon"
+SEARCH_CONFIG = "yanstore_search"
+
+HIGHLIGHT_START = "<mark>"
+HIGHLIGHT_STOP = "</mark>"
+
+# Trigram similarity a name or SKU needs to count as a fuzzy match (pg_trgm's default)
+SIMILARITY_THRESHOLD = 0.3
+
+# Objects behind the PostgreSQL search, also created by the product search
+# migration: pg_trgm and unaccent, the text search configuration, the
+# generated search_vector column and the GIN indexes
+SEARCH_SCHEMA_SQL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    f"""
+    DO $$
+    BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = '{SEARCH_CONFIG}') THEN
+            CREATE TEXT SEARCH CONFIGURATION {SEARCH_CONFIG} (COPY = simple);
+            ALTER TEXT SEARCH CONFIGURATION {SEARCH_CONFIG}
+                ALTER MAPPING FOR hword, hword_part, word WITH unaccent, simple;
+        END IF;
+    END
+    $$
+    """,
+    f"""
+    ALTER TABLE products ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('{SEARCH_CONFIG}'::regconfig, coalesce(name, '')), 'A')
+        || setweight(to_tsvector('{SEARCH_CONFIG}'::regconfig, coalesce(sku, '')), 'A')
+        || setweight(to_tsvector('{SEARCH_CONFIG}'::regconfig, coalesce(description, '')), 'C')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_products_search_vector ON products USING gin (search_vector)",
+    "CREATE INDEX IF NOT EXISTS ix_products_name_trgm ON products USING gin (name gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_products_sku_trgm ON products USING gin (sku gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_products_description_trgm ON products USING gin (description gin_trgm_ops)",
+]
+
+# Matches are ranked and paginated first; ts_headline, which is expensive,
+# only runs for the page of results that is returned
+_POSTGRES_SEARCH = text(f"""
+    WITH q AS (SELECT websearch_to_tsquery('{SEARCH_CONFIG}', :q) AS query),
+    matches AS (
+        SELECT p.product_id, p.name, p.sku, p.description, p.category_id, p.location, p.is_active,
+               ts_rank_cd(p.search_vector, q.query)
+                   + greatest(similarity(p.name, :q), similarity(p.sku, :q)) AS rank
+        FROM products AS p, q
+        WHERE p.search_vector @@ q.query
+           OR p.name % :q
+           OR p.sku % :q
+           OR :q <% p.description
+        ORDER BY rank DESC, p.product_id
+        LIMIT :limit OFFSET :offset
+    )
+    SELECT m.product_id, m.name, m.sku, m.category_id, m.location, m.is_active, m.rank,
+           ts_headline('{SEARCH_CONFIG}', m.name, q.query,
+                       'StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_STOP}, HighlightAll=true') AS name_highlight,
+           CASE WHEN to_tsvector('{SEARCH_CONFIG}', coalesce(m.description, '')) @@ q.query
+                THEN ts_headline('{SEARCH_CONFIG}', m.description, q.query,
+                                 'StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_STOP}, MaxFragments=2, MaxWords=20, MinWords=5')
+                ELSE '' END AS description_highlight
+    FROM matches AS m, q
+    ORDER BY m.rank DESC, m.product_id
+""")
+
+
+def create_search_schema(connection) -> None:
+    """Create the PostgreSQL search objects (idempotent), for databases built with create_all"""
+    for statement in SEARCH_SCHEMA_SQL:
+        connection.execute(text(statement))
+
+
+def _search_postgres(db: Session, q: str, limit: int, offset: int) -> List[dict]:
+    """
+    Ranked search using the generated search_vector column (GIN) for whole
+    words and the pg_trgm GIN indexes on name, sku and description for typos
+    and partial codes. Both conditions are index-backed, so the planner
+    answers them with a BitmapOr of the indexes instead of a table scan.
+    """
+    db.execute(text("SELECT set_config('pg_trgm.similarity_threshold', :threshold, true)"),
+               {"threshold": str(SIMILARITY_THRESHOLD)})
+    rows = db.execute(_POSTGRES_SEARCH, {"q": q, "limit": limit, "offset": offset}).mappings().all()
+    return [dict(row) for row in rows]
+
+
+def _highlight(value: str, terms: List[str]) -> str:
+    if not value or not terms:
+        return value
+    pattern = re.compile("|".join(re.escape(term) for term in terms), re.IGNORECASE)
+    return pattern.sub(lambda match: f"{HIGHLIGHT_START}{match.group(0)}{HIGHLIGHT_STOP}", value)
+
+
+def _search_fallback(db: Session, q: str, limit: int, offset: int) -> List[dict]:
+    """Case-insensitive substring search for databases without pg_trgm (used by the SQLite tests)"""
+    terms = [term for term in q.split() if term]
+    columns = (models.Product.name, models.Product.sku, models.Product.description)
+    matches = [
+        or_(*[func.lower(column).like(f"%{term.lower()}%") for column in columns])
+        for term in terms
+    ]
+    name_matches = [func.lower(models.Product.name).like(f"%{term.lower()}%") for term in terms]
+    rank = sum(case((match, 1.0), else_=0.0) for match in name_matches) + case(
+        (func.lower(models.Product.name).like(f"{q.lower()}%"), 1.0), else_=0.0
+    )
+    rows = db.execute(
+        select(
+            models.Product.product_id,
+            models.Product.name,
+            models.Product.sku,
+            models.Product.category_id,
+            models.Product.location,
+            models.Product.is_active,
+            rank.label("rank"),
+            models.Product.description
+        ).where(*matches).order_by(rank.desc(), models.Product.product_id).limit(limit).offset(offset)
+    ).mappings().all()
+
+    results = []
+    for row in rows:
+        result = dict(row)
+        description = result.pop("description") or ""
+        result["name_highlight"] = _highlight(result["name"], terms)
+        result["description_highlight"] = _highlight(description, terms) if any(
+            term.lower() in description.lower() for term in terms
+        ) else ""
+        results.append(result)
+    return results
+
+
+def search_products(db: Session, q: str, limit: int = 20, offset: int = 0) -> List[dict]:
+    """
+    Products matching a free-text query, best matches first. Each result carries
+    the product's name and description with the matched words wrapped in
+    <mark> tags; the text around them is HTML-escaped.
+    """
+    search = _search_postgres if db.bind.dialect.name == "postgresql" else _search_fallback
+    results = search(db, q, limit, offset)
+    for result in results:
+        for key in ("name_highlight", "description_highlight"):
+            result[key] = _escape_highlight(result[key])
+        result["rank"] = round(float(result["rank"] or 0), 6)
+    return results
+
+
+def _escape_highlight(value: str) -> str:
+    """Escape HTML in highlighted text while keeping the highlight tags"""
+    if not value:
+        return value
+    parts = re.split(f"({re.escape(HIGHLIGHT_START)}|{re.escape(HIGHLIGHT_STOP)})", value)
+    return "".join(part if part in (HIGHLIGHT_START, HIGHLIGHT_STOP) else html.escape(part, quote=False) for part in parts)
@@ -0,0 +1,54 @@
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+import models
+
+
+def sku_prefix(category_name: str) -> str:
+    """First two letters of the category name, upper-cased"""
+    return category_name[:2].upper()
+
+
+def reserve_sku_numbers(db: Session, prefix: str, count: int) -> List[int]:
+    """
+    Reserve `count` unused SKU sequence numbers for a prefix in one round-trip.
+
+    On PostgreSQL they come from SKU_SEQUENCE (SELECT nextval(...) FROM
+    generate_series(1, count)): nextval takes no row lock and ignores the
+    transaction, so concurrent requests never wait on each other and no second
+    connection is needed. Like any sequence, numbers of a rolled back
+    transaction are skipped, not reused.
+
+    Elsewhere (SQLite) the prefix's SkuCounter row is advanced with a single
+    INSERT ... ON CONFLICT DO UPDATE ... RETURNING in the caller's transaction;
+    SQLite serialises writers, so the row lock costs no extra concurrency.
+    """
+    if db.bind.dialect.name == "postgresql":
+        numbers = db.execute(
+            select(models.SKU_SEQUENCE.next_value()).select_from(func.generate_series(1, count))
+        ).scalars().all()
+        return sorted(numbers)
+
+    from sqlalchemy.dialects.sqlite import insert
+    statement = insert(models.SkuCounter).values(prefix=prefix, last_value=count)
+    statement = statement.on_conflict_do_update(
+        index_elements=[models.SkuCounter.prefix],
+        set_={"last_value": models.SkuCounter.last_value + statement.excluded.last_value}
+    ).returning(models.SkuCounter.last_value)
+    last_value = db.execute(statement).scalar_one()
+    return list(range(last_value - count + 1, last_value + 1))
+
+
+def allocate_skus(db: Session, prefix: str, count: int, now: Optional[datetime] = None) -> List[str]:
+    """
+    Generate `count` unique SKUs of the form <prefix><YYMMDDHHMM><sequence>.
+    The sequence numbers come from reserve_sku_numbers, so SKUs allocated
+    concurrently, or in bulk for an import, never collide.
+    """
+    if count <= 0:
+        return []
+    base = f"{prefix}{(now or datetime.now()).strftime('%y%m%d%H%M')}"
+    return [f"{base}{sequence:04d}" for sequence in reserve_sku_numbers(db, prefix, count)]
@@ -0,0 +1,287 @@
+import hashlib
+import logging
+from abc import ABC, abstractmethod
+import os
+import tempfile
+from functools import lru_cache
+from typing import BinaryIO, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# Size of the chunks used when hashing and copying blobs
+CHUNK_SIZE = 1024 * 1024
+
+
+class BlobNotFoundError(Exception):
+    """Raised when a blob key does not exist in the storage backend"""
+
+
+class BlobTooLargeError(Exception):
+    """Raised when a streamed blob grows past the size limit given to put_stream"""
+
+
+def _copy_hashing(fileobj: BinaryIO, target: BinaryIO, max_size: Optional[int] = None) -> str:
+    """
+    Copy a file object in chunks while hashing it, so no more than one chunk
+    is held in memory. Returns the SHA-256 of the content.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = fileobj.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        size += len(chunk)
+        if max_size is not None and size > max_size:
+            raise BlobTooLargeError(f"Blob exceeds the limit of {max_size} bytes")
+        digest.update(chunk)
+        target.write(chunk)
+    return digest.hexdigest()
+
+
+class BlobStorage(ABC):
+    """
+    Content-addressed storage for binary files such as product images and receipts.
+    Blobs are keyed by the SHA-256 of their content, so storing the same file
+    twice keeps a single copy.
+    """
+
+    def put(self, data: bytes) -> str:
+        """Store a blob from bytes and return its key"""
+        key = hashlib.sha256(data).hexdigest()
+        self.put_as(key, data)
+        return key
+
+    def put_as(self, key: str, data: bytes) -> None:
+        """
+        Store a blob under a key chosen by the caller, used for content derived
+        from another blob (such as resized images) whose key is known up front.
+        """
+        if not self.exists(key):
+            self._write(key, data)
+
+    @abstractmethod
+    def put_stream(self, fileobj: BinaryIO, max_size: Optional[int] = None) -> str:
+        """
+        Store a blob from a file object, hashing it in chunks so the content
+        is never held in memory as a whole. Returns its key. Raises
+        BlobTooLargeError, storing nothing, once more than `max_size` bytes
+        have been read.
+        """
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        """Whether a blob is stored under the key"""
+
+    @abstractmethod
+    def size(self, key: str) -> int:
+        """Size of a blob in bytes"""
+
+    @abstractmethod
+    def open(self, key: str) -> BinaryIO:
+        """Open a blob for reading"""
+
+    def open_range(self, key: str, start: int, end: int) -> BinaryIO:
+        """
+        Open a blob for reading from offset `start`; reads past `end`
+        (inclusive) are allowed but not guaranteed to return data.
+        """
+        blob = self.open(key)
+        if blob.seekable():
+            blob.seek(start)
+            return blob
+        skip = start
+        while skip > 0:
+            skipped = len(blob.read(min(skip, CHUNK_SIZE)))
+            if not skipped:
+                break
+            skip -= skipped
+        return blob
+
+    def iter_chunks(self, key: str, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        """Yield the content of a blob in chunks"""
+        with self.open(key) as blob:
+            while True:
+                chunk = blob.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    def local_path(self, key: str) -> Optional[str]:
+        """Filesystem path of a blob when the backend keeps it on local disk, else None"""
+        return None
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """Remove a blob; missing keys are ignored"""
+
+    @abstractmethod
+    def _write(self, key: str, data: bytes) -> None:
+        """Write a blob under its key"""
+
+
+class LocalBlobStorage(BlobStorage):
+    """Stores blobs on the local filesystem under <root>/<ab>/<cd>/<sha256>"""
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    def _move_into_place(self, temp_path: str, key: str) -> None:
+        path = self._path(key)
+        if os.path.exists(path):
+            os.remove(temp_path)
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(temp_path, path)
+
+    def _write(self, key: str, data: bytes) -> None:
+        fd, temp_path = tempfile.mkstemp(dir=self.root, prefix=".upload-")
+        with os.fdopen(fd, "wb") as temp_file:
+            temp_file.write(data)
+        self._move_into_place(temp_path, key)
+
+    def put_stream(self, fileobj: BinaryIO, max_size: Optional[int] = None) -> str:
+        fd, temp_path = tempfile.mkstemp(dir=self.root, prefix=".upload-")
+        try:
+            with os.fdopen(fd, "wb") as temp_file:
+                key = _copy_hashing(fileobj, temp_file, max_size)
+        except Exception:
+            os.remove(temp_path)
+            raise
+        self._move_into_place(temp_path, key)
+        return key
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def size(self, key: str) -> int:
+        try:
+            return os.path.getsize(self._path(key))
+        except FileNotFoundError:
+            raise BlobNotFoundError(key)
+
+    def open(self, key: str) -> BinaryIO:
+        try:
+            return open(self._path(key), "rb")
+        except FileNotFoundError:
+            raise BlobNotFoundError(key)
+
+    def local_path(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        return path if os.path.exists(path) else None
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+class S3BlobStorage(BlobStorage):
+    """
+    Stores blobs in an S3-compatible bucket.
+    `client` only needs the boto3 methods put_object, get_object, head_object
+    and delete_object, so MinIO, Ceph or a local stand-in can be used as well.
+    """
+
+    def __init__(self, client, bucket: str, prefix: str = "blobs/"):
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def _object_key(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    def _write(self, key: str, data: bytes) -> None:
+        self.client.put_object(Bucket=self.bucket, Key=self._object_key(key), Body=data)
+
+    def put_stream(self, fileobj: BinaryIO, max_size: Optional[int] = None) -> str:
+        # Spool to a temporary file first: the key is only known once the whole
+        # content has been hashed
+        with tempfile.TemporaryFile() as spool:
+            key = _copy_hashing(fileobj, spool, max_size)
+            if not self.exists(key):
+                spool.seek(0)
+                self.client.put_object(Bucket=self.bucket, Key=self._object_key(key), Body=spool)
+        return key
+
+    def _head(self, key: str) -> Optional[dict]:
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+        except Exception as e:
+            # botocore's ClientError carries the S3 error code in e.response
+            error_code = getattr(e, "response", {}).get("Error", {}).get("Code")
+            if error_code in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+    def exists(self, key: str) -> bool:
+        return self._head(key) is not None
+
+    def size(self, key: str) -> int:
+        head = self._head(key)
+        if head is None:
+            raise BlobNotFoundError(key)
+        return int(head["ContentLength"])
+
+    def open(self, key: str) -> BinaryIO:
+        if not self.exists(key):
+            raise BlobNotFoundError(key)
+        return self.client.get_object(Bucket=self.bucket, Key=self._object_key(key))["Body"]
+
+    def open_range(self, key: str, start: int, end: int) -> BinaryIO:
+        # StreamingBody cannot seek: let S3 send only the requested bytes
+        if not self.exists(key):
+            raise BlobNotFoundError(key)
+        return self.client.get_object(
+            Bucket=self.bucket, Key=self._object_key(key), Range=f"bytes={start}-{end}"
+        )["Body"]
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+
+
+def create_blob_storage(backend: Optional[str] = None) -> BlobStorage:
+    """
+    Build the blob storage configured through the environment.
+    BLOB_STORAGE_BACKEND selects "local" (default, rooted at BLOB_STORAGE_PATH)
+    or "s3" (S3_BUCKET, optional S3_ENDPOINT_URL and S3_PREFIX; requires boto3).
+
+    With ENV=production the local backend is refused: on Heroku dynos and
+    Docker containers the disk is discarded on every deploy or restart and is
+    not shared between instances, so uploads would be lost. Set
+    BLOB_STORAGE_ALLOW_LOCAL=true to use it anyway on a disk known to persist.
+    """
+    backend = backend or os.getenv("BLOB_STORAGE_BACKEND", "local")
+
+    if backend == "local":
+        allow_local = os.getenv("BLOB_STORAGE_ALLOW_LOCAL", "false").lower() == "true"
+        if os.getenv("ENV") == "production" and not allow_local:
+            raise RuntimeError(
+                "The local blob storage backend loses uploads on every deploy: set BLOB_STORAGE_BACKEND=s3 "
+                "in production (or BLOB_STORAGE_ALLOW_LOCAL=true if the local disk persists)"
+            )
+        root = os.getenv("BLOB_STORAGE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "blobs"))
+        return LocalBlobStorage(root)
+
+    if backend == "s3":
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError("boto3 is required for the s3 blob storage backend")
+        client = boto3.client("s3", endpoint_url=os.getenv("S3_ENDPOINT_URL") or None)
+        return S3BlobStorage(client, os.environ["S3_BUCKET"], os.getenv("S3_PREFIX", "blobs/"))
+
+    raise ValueError(f"Unknown blob storage backend: {backend}")
+
+
+@lru_cache(maxsize=1)
+def get_blob_storage() -> BlobStorage:
+    """Dependency returning the process-wide blob storage"""
+    storage = create_blob_storage()
+    logger.info(f"Using {type(storage).__name__} for blob storage")
+    return storage
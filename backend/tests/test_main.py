@@ -6,6 +6,7 @@ from typing import Generator
 
 # Assuming your FastAPI app and models are structured as follows:
 # Adjust paths if your project structure is different.
+import io
 import sys
 import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -31,8 +32,33 @@ def override_get_db() -> Generator[Session, None, None]:
 
 app.dependency_overrides[get_db] = override_get_db
 
+# Async endpoints read the same SQLite file through aiosqlite. NullPool keeps
+# connections from outliving the event loop of each TestClient call.
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import NullPool
+from database import get_async_db
+async_engine = create_async_engine("sqlite+aiosqlite:///./test.db", poolclass=NullPool)
+TestingAsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+async def override_get_async_db():
+    async with TestingAsyncSessionLocal() as db:
+        yield db
+
+app.dependency_overrides[get_async_db] = override_get_async_db
+
+from database import get_session_factory
+app.dependency_overrides[get_session_factory] = lambda: TestingSessionLocal
+
+# Keep uploaded blobs in a throwaway directory
+import tempfile
+from storage import LocalBlobStorage, get_blob_storage
+test_blob_storage = LocalBlobStorage(tempfile.mkdtemp(prefix="yanstore-blobs-"))
+app.dependency_overrides[get_blob_storage] = lambda: test_blob_storage
+
 @pytest.fixture(scope="function")
 def db_session() -> Generator[Session, None, None]:
+    from main import reference_cache
+    reference_cache.clear()  # Cached lists would outlive the dropped tables
     Base.metadata.create_all(bind=engine)
     db = TestingSessionLocal()
     try:
@@ -249,3 +275,1395 @@ def test_sqlite_db_file_creation():
     # The core idea is that the file interaction happened.
     # If you drop tables AND delete the file in teardown, this test might need adjustment.
     # For now, drop_all doesn't delete the file itself.
+
+# --- Event end budget tests ---
+
+def create_test_event(db: Session, name: str, initial_budget: str):
+    from datetime import date
+    from decimal import Decimal
+    from models import Event
+    event = Event(
+        name=name,
+        country="USA",
+        start_date=date(2025, 1, 1),
+        end_date=date(2025, 1, 5),
+        initial_budget=Decimal(initial_budget)
+    )
+    db.add(event)
+    db.commit()
+    db.refresh(event)
+    return event
+
+def add_event_costs(db: Session, event_id: int, sku: str, base_costs, expense_amounts):
+    from datetime import date
+    from decimal import Decimal
+    from models import ProductInstance, TravelExpense
+    product = Product(
+        name=f"Event Product {sku}",
+        sku=sku,
+        category_id=db.default_category_id,
+        event_id=event_id,
+        condition="New",
+        purchase_date=date(2025, 1, 2),
+        obtained_method="Purchased"
+    )
+    db.add(product)
+    db.flush()
+    for base_cost in base_costs:
+        db.add(ProductInstance(product_id=product.product_id, base_cost=Decimal(base_cost)))
+    for amount in expense_amounts:
+        db.add(TravelExpense(event_id=event_id, name="Expense", amount=Decimal(amount), expense_date=date(2025, 1, 3)))
+    db.commit()
+    return product
+
+def test_calculate_event_end_budget(client: TestClient, db_session: Session):
+    event = create_test_event(db_session, "Buying Trip", "1000.00")
+    add_event_costs(db_session, event.event_id, "EVT001", ["10.10", "20.20", "0.01"], ["100.00", "50.50"])
+
+    response = client.patch(f"/events/{event.event_id}/calculate-end-budget")
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total_spent_on_products"] == 30.31
+    assert data["total_travel_expenses"] == 150.5
+    assert data["end_budget"] == 819.19
+    db_session.refresh(event)
+    assert str(event.end_budget) == "819.19"
+
+def test_end_budget_converts_expenses_without_base_amounts(client: TestClient, db_session: Session):
+    from datetime import date, datetime, timezone
+    from decimal import Decimal
+    from models import TravelExpense
+    record_rate(db_session, "EUR", "0.5", datetime(2024, 12, 1, tzinfo=timezone.utc))
+    event = create_test_event(db_session, "Legacy Trip", "1000.00")
+    # Rows written before the base-currency migration have no amount_base
+    # (only USD rows are filled by it) until the backfill script runs
+    for currency, amount in [("EUR", "40.00"), ("GBP", "7.00")]:
+        expense = TravelExpense(event_id=event.event_id, name="Legacy", amount=Decimal(amount), currency="USD",
+                                expense_date=date(2025, 1, 3))
+        db_session.add(expense)
+        db_session.flush()
+        expense.currency, expense.fx_rate, expense.amount_base = currency, None, None
+    db_session.commit()
+
+    data = client.patch(f"/events/{event.event_id}/calculate-end-budget").json()
+
+    # 40 EUR at 0.5 per USD, and 7 GBP (no rate recorded) counted as is
+    assert data["total_travel_expenses"] == 87.0
+    assert data["end_budget"] == 913.0
+    db_session.expire_all()
+    converted = db_session.query(TravelExpense).filter(TravelExpense.currency == "EUR").one()
+    assert converted.amount_base == Decimal("80.00")
+
+def test_calculate_event_end_budget_not_found(client: TestClient, db_session: Session):
+    response = client.patch("/events/9999/calculate-end-budget")
+    assert response.status_code == 404
+
+def test_calculate_events_end_budget_batch(client: TestClient, db_session: Session):
+    event1 = create_test_event(db_session, "Trip One", "500.00")
+    event2 = create_test_event(db_session, "Trip Two", "200.00")
+    add_event_costs(db_session, event1.event_id, "EVT002", ["100.00"], ["25.00"])
+
+    response = client.patch(
+        "/events/calculate-end-budget",
+        json={"event_ids": [event1.event_id, event2.event_id, 9999]}
+    )
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["updated_count"] == 2
+    budgets = {r["event_id"]: r["end_budget"] for r in data["results"]}
+    assert budgets[event1.event_id] == 375
+    assert budgets[event2.event_id] == 200
+    assert data["errors"] == [{"event_id": 9999, "error": "Event not found"}]
+
+# --- Instance listing tests ---
+
+def create_test_instances(db: Session, name: str, sku: str, locations):
+    from datetime import date
+    from decimal import Decimal
+    from models import ProductInstance
+    product = Product(
+        name=name,
+        sku=sku,
+        category_id=db.default_category_id,
+        condition="New",
+        purchase_date=date(2025, 2, 1),
+        obtained_method="Purchased"
+    )
+    db.add(product)
+    db.flush()
+    instances = [
+        ProductInstance(product_id=product.product_id, base_cost=Decimal("5.00"), location=location, condition="New")
+        for location in locations
+    ]
+    db.add_all(instances)
+    db.commit()
+    return product, instances
+
+def test_get_instances_keyset_pagination(client: TestClient, db_session: Session):
+    create_test_instances(db_session, "Pikachu", "INS001", ["USA", "USA", "Colombia", "USA", "Colombia"])
+
+    first_page = client.get("/instances/", params={"limit": 2})
+    assert first_page.status_code == 200
+    assert len(first_page.json()) == 2
+    assert first_page.headers["X-Total-Count"] == "5"
+    assert first_page.json()[0]["product"]["name"] == "Pikachu"
+
+    seen = [item["instance_id"] for item in first_page.json()]
+    cursor = first_page.headers.get("X-Next-Cursor")
+    while cursor:
+        page = client.get("/instances/", params={"limit": 2, "cursor": cursor})
+        # Only the first page pays for the count estimate
+        assert "X-Total-Count" not in page.headers
+        seen.extend(item["instance_id"] for item in page.json())
+        cursor = page.headers.get("X-Next-Cursor")
+
+    assert len(seen) == 5
+    assert seen == sorted(seen)
+
+def test_instance_count_estimate_binds_filter_values():
+    from sqlalchemy.dialects import postgresql
+    from main import _ExplainJSON, _instances_query
+    compiled = _ExplainJSON(_instances_query(name="x'; DROP TABLE products; --")).compile(dialect=postgresql.dialect())
+    assert str(compiled).startswith("EXPLAIN (FORMAT JSON) SELECT")
+    assert "DROP TABLE" not in str(compiled)
+    assert "%x'; DROP TABLE products; --%" in compiled.params.values()
+
+def test_get_instances_filters_and_projection(client: TestClient, db_session: Session):
+    create_test_instances(db_session, "Charizard", "INS002", ["USA", "Colombia"])
+    create_test_instances(db_session, "Bulbasaur", "INS003", ["USA"])
+
+    response = client.get(
+        "/instances/",
+        params={"name": "chari", "location": "USA", "fields": "base_cost,product.name"}
+    )
+
+    assert response.status_code == 200
+    data = response.json()
+    assert len(data) == 1
+    assert set(data[0].keys()) == {"instance_id", "base_cost", "product"}
+    assert data[0]["product"] == {"name": "Charizard"}
+    assert response.headers["X-Total-Count"] == "1"
+
+def test_get_instances_unknown_field(client: TestClient, db_session: Session):
+    response = client.get("/instances/", params={"fields": "secret"})
+    assert response.status_code == 400
+
+# --- Rentability tests ---
+
+def test_products_with_rentability_tracks_sales(client: TestClient, db_session: Session):
+    product, instances = create_test_instances(db_session, "Mewtwo", "RNT001", ["USA", "USA"])
+    create_test_instances(db_session, "Unsold", "RNT002", ["USA"])
+
+    response = client.post("/price-points/", json={
+        "product_id": product.product_id,
+        "base_cost": "8.00",
+        "selling_price": "15.00",
+        "shipment_cost": "2.00",
+        "currency": "USD"
+    })
+    assert response.status_code == 200
+
+    for instance, price in zip(instances, ["15.00", "20.00"]):
+        response = client.post(f"/instances/{instance.instance_id}/sell", json={
+            "sale_price": price,
+            "sale_date": "2025-03-01T12:00:00",
+            "payment_method": "Cash"
+        })
+        assert response.status_code == 200
+
+    response = client.get("/products-with-rentability/", params={"has_sales": True})
+    assert response.status_code == 200
+    data = response.json()
+    assert len(data) == 1
+    assert data[0]["product_id"] == product.product_id
+    assert data[0]["sales_count"] == 2
+    assert data[0]["total_revenue"] == 35.0
+    assert data[0]["total_cost"] == 10.0
+    assert data[0]["total_profit"] == 15.0
+    assert data[0]["rentability_percentage"] == 75.0
+
+    all_products = client.get("/products-with-rentability/", params={"sort_by": "total_profit"}).json()
+    assert [p["name"] for p in all_products] == ["Mewtwo", "Unsold"]
+
+def test_products_with_rentability_invalid_sort(client: TestClient, db_session: Session):
+    response = client.get("/products-with-rentability/", params={"sort_by": "name"})
+    assert response.status_code == 400
+
+# --- Blob storage tests ---
+
+PNG_BYTES = b"\x89PNG\r\n\x1a\n" + b"\x00" * 64
+
+def test_local_blob_storage_deduplicates(tmp_path):
+    from io import BytesIO
+    storage = LocalBlobStorage(str(tmp_path))
+    key = storage.put(PNG_BYTES)
+    assert storage.put_stream(BytesIO(PNG_BYTES)) == key
+    assert storage.size(key) == len(PNG_BYTES)
+    assert len([p for p in tmp_path.rglob("*") if p.is_file()]) == 1
+    with storage.open(key) as blob:
+        assert blob.read() == PNG_BYTES
+
+def test_local_blob_storage_refused_in_production(tmp_path, monkeypatch):
+    from storage import create_blob_storage
+    monkeypatch.setenv("BLOB_STORAGE_PATH", str(tmp_path))
+    monkeypatch.setenv("ENV", "production")
+    with pytest.raises(RuntimeError):
+        create_blob_storage("local")
+    monkeypatch.setenv("BLOB_STORAGE_ALLOW_LOCAL", "true")
+    assert isinstance(create_blob_storage("local"), LocalBlobStorage)
+
+def test_get_product_image_from_blob_storage(client: TestClient, db_session: Session):
+    from models import ProductImage
+    product, _ = create_test_instances(db_session, "Eevee", "IMG001", ["USA"])
+    key = test_blob_storage.put(PNG_BYTES)
+    db_session.add(ProductImage(product_id=product.product_id, image_hash=key, image_type="png", is_primary=True))
+    db_session.commit()
+
+    response = client.get(f"/products/{product.product_id}/image")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/png"
+    assert response.content == PNG_BYTES
+
+def test_get_product_image_not_found(client: TestClient, db_session: Session):
+    response = client.get("/products/9999/image")
+    assert response.status_code == 404
+
+def test_travel_expense_receipt_roundtrip(client: TestClient, db_session: Session):
+    event = create_test_event(db_session, "Receipt Trip", "100.00")
+
+    response = client.post(
+        "/travel-expenses/",
+        data={"event_id": event.event_id, "name": "Taxi", "amount": "12.50", "expense_date": "2025-01-02"},
+        files={"receipt": ("receipt.png", PNG_BYTES, "image/png")}
+    )
+    assert response.status_code == 200
+    expense_id = response.json()["expense_id"]
+
+    response = client.get(f"/travel-expenses/{expense_id}/receipt")
+    assert response.status_code == 200
+    assert response.content == PNG_BYTES
+    assert response.headers["cache-control"] == "no-cache"
+
+    receipt_hash = client.get(f"/events/{event.event_id}/travel-expenses").json()[0]["receipt_hash"]
+    response = client.get(f"/travel-expenses/{expense_id}/receipt", params={"v": receipt_hash})
+    assert "immutable" in response.headers["cache-control"]
+
+def test_local_blob_storage_put_stream_size_limit(tmp_path):
+    from io import BytesIO
+    from storage import BlobTooLargeError
+    storage = LocalBlobStorage(str(tmp_path))
+    with pytest.raises(BlobTooLargeError):
+        storage.put_stream(BytesIO(PNG_BYTES), max_size=len(PNG_BYTES) - 1)
+    # The partial copy is discarded
+    assert [p for p in tmp_path.rglob("*") if p.is_file()] == []
+    assert storage.size(storage.put_stream(BytesIO(PNG_BYTES), max_size=len(PNG_BYTES))) == len(PNG_BYTES)
+
+def test_receipt_upload_type_sniffed_and_size_limited(client: TestClient, db_session: Session, monkeypatch):
+    import uploads
+    event = create_test_event(db_session, "Upload Trip", "100.00")
+    data = {"event_id": event.event_id, "name": "Taxi", "amount": "12.50", "expense_date": "2025-01-02"}
+
+    # The declared content type is ignored in favour of the file's leading bytes
+    jpeg_bytes = b"\xff\xd8\xff\xe0" + b"\x00" * 32
+    response = client.post("/travel-expenses/", data=data,
+                           files={"receipt": ("receipt.png", jpeg_bytes, "image/png")})
+    assert response.status_code == 200
+    assert response.json()["has_receipt"] is True
+    from models import TravelExpense
+    expense = db_session.get(TravelExpense, response.json()["expense_id"])
+    assert expense.receipt_type == "jpg"
+    assert expense.receipt_size == len(jpeg_bytes)
+
+    response = client.post("/travel-expenses/", data=data,
+                           files={"receipt": ("receipt.png", b"<html>not an image</html>", "image/png")})
+    assert response.status_code == 400
+
+    monkeypatch.setattr(uploads, "MAX_UPLOAD_BYTES", len(PNG_BYTES) - 1)
+    response = client.post("/travel-expenses/", data=data,
+                           files={"receipt": ("receipt.png", PNG_BYTES, "image/png")})
+    assert response.status_code == 413
+
+def test_multipart_size_limit_rejects_before_reading_the_body():
+    from fastapi import FastAPI, Request
+    from uploads import MultipartSizeLimitMiddleware
+    received = []
+    limited_app = FastAPI()
+    limited_app.add_middleware(MultipartSizeLimitMiddleware, max_size=len(PNG_BYTES) + 200)
+
+    @limited_app.post("/upload")
+    async def upload(request: Request):
+        form = await request.form()
+        received.append(await form["file"].read())
+        return {}
+
+    with TestClient(limited_app) as limited_client:
+        assert limited_client.post("/upload", files={"file": ("a.png", PNG_BYTES, "image/png")}).status_code == 200
+        # Declared too large: refused from the Content-Length alone
+        response = limited_client.post("/upload", files={"file": ("a.png", PNG_BYTES * 4, "image/png")})
+        assert response.status_code == 413
+        # Sent chunked, without a Content-Length: stopped once past the limit
+        body = b"--b\r\nContent-Disposition: form-data; name=\"file\"; filename=\"a.png\"\r\n\r\n" + PNG_BYTES * 4 + b"\r\n--b--\r\n"
+        response = limited_client.post(
+            "/upload",
+            content=(body[i:i + 64] for i in range(0, len(body), 64)),
+            headers={"Content-Type": "multipart/form-data; boundary=b"}
+        )
+        assert response.status_code == 413
+    assert received == [PNG_BYTES]
+
+# --- Image caching tests ---
+
+def add_test_image(db: Session, sku: str):
+    from models import ProductImage
+    product, _ = create_test_instances(db, "Cached", sku, ["USA"])
+    key = test_blob_storage.put(PNG_BYTES)
+    db.add(ProductImage(product_id=product.product_id, image_hash=key, image_type="png", is_primary=True))
+    db.commit()
+    return product, key
+
+def test_product_image_etag_and_304(client: TestClient, db_session: Session):
+    product, key = add_test_image(db_session, "CCH001")
+
+    response = client.get(f"/products/{product.product_id}/image")
+    assert response.status_code == 200
+    assert response.headers["etag"] == f'"{key}"'
+    assert response.headers["cache-control"] == "no-cache"
+    assert "last-modified" in response.headers
+
+    response = client.get(f"/products/{product.product_id}/image", headers={"If-None-Match": f'"{key}"'})
+    assert response.status_code == 304
+    assert response.content == b""
+
+    response = client.get(
+        f"/products/{product.product_id}/image",
+        headers={"If-Modified-Since": "Fri, 01 Jan 2100 00:00:00 GMT"}
+    )
+    assert response.status_code == 304
+
+    response = client.get(f"/products/{product.product_id}/image", headers={"If-None-Match": '"other"'})
+    assert response.status_code == 200
+
+def test_product_image_immutable_for_versioned_url(client: TestClient, db_session: Session):
+    product, key = add_test_image(db_session, "CCH002")
+    # Clients get the version from the product responses
+    image_hash = client.get(f"/products/{product.product_id}").json()["image_hash"]
+    assert image_hash == key
+    assert client.get("/products/").json()[0]["image_hash"] == key
+    response = client.get(f"/products/{product.product_id}/image", params={"v": image_hash})
+    assert "immutable" in response.headers["cache-control"]
+
+def test_product_image_range_requests(client: TestClient, db_session: Session):
+    product, _ = add_test_image(db_session, "CCH003")
+    url = f"/products/{product.product_id}/image"
+
+    response = client.get(url, headers={"Range": "bytes=0-7"})
+    assert response.status_code == 206
+    assert response.content == PNG_BYTES[:8]
+    assert response.headers["content-range"] == f"bytes 0-7/{len(PNG_BYTES)}"
+
+    response = client.get(url, headers={"Range": "bytes=-4"})
+    assert response.status_code == 206
+    assert response.content == PNG_BYTES[-4:]
+
+    response = client.get(url, headers={"Range": "bytes=1000-"})
+    assert response.status_code == 416
+
+class FakeS3Body(io.RawIOBase):
+    """Stand-in for botocore's StreamingBody: an IOBase that cannot seek"""
+
+    def __init__(self, data: bytes):
+        self.stream = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        return self.stream.read(size)
+
+class FakeS3Client:
+    def __init__(self):
+        self.objects = {}
+        self.ranges = []
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[Key] = Body if isinstance(Body, bytes) else Body.read()
+
+    def head_object(self, Bucket, Key):
+        if Key not in self.objects:
+            error = Exception("Not Found")
+            error.response = {"Error": {"Code": "404"}}
+            raise error
+        return {"ContentLength": len(self.objects[Key])}
+
+    def get_object(self, Bucket, Key, Range=None):
+        data = self.objects[Key]
+        if Range:
+            self.ranges.append(Range)
+            start, end = (int(offset) for offset in Range[len("bytes="):].split("-"))
+            data = data[start:end + 1]
+        return {"Body": FakeS3Body(data)}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop(Key, None)
+
+def test_product_image_range_requests_from_s3(client: TestClient, db_session: Session):
+    from models import ProductImage
+    from storage import S3BlobStorage
+    s3 = FakeS3Client()
+    storage = S3BlobStorage(s3, "bucket")
+    product, _ = create_test_instances(db_session, "Cached", "CCH004", ["USA"])
+    db_session.add(ProductImage(product_id=product.product_id, image_hash=storage.put(PNG_BYTES), image_type="png"))
+    db_session.commit()
+
+    app.dependency_overrides[get_blob_storage] = lambda: storage
+    try:
+        response = client.get(f"/products/{product.product_id}/image", headers={"Range": "bytes=2-9"})
+    finally:
+        app.dependency_overrides[get_blob_storage] = lambda: test_blob_storage
+    assert response.status_code == 206
+    assert response.content == PNG_BYTES[2:10]
+    assert s3.ranges == ["bytes=2-9"]
+
+# --- Image variant tests ---
+
+def test_product_image_thumbnail_variant(client: TestClient, db_session: Session):
+    from io import BytesIO
+    from PIL import Image
+    from models import ProductImage
+    source = BytesIO()
+    Image.new("RGB", (400, 200), color="red").save(source, format="PNG")
+    product, _ = create_test_instances(db_session, "Large", "VAR001", ["USA"])
+    key = test_blob_storage.put(source.getvalue())
+    db_session.add(ProductImage(product_id=product.product_id, image_hash=key, image_type="png", is_primary=True))
+    db_session.commit()
+
+    response = client.get(f"/products/{product.product_id}/image", params={"size": "thumb", "format": "webp"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/webp"
+    thumbnail = Image.open(BytesIO(response.content))
+    assert thumbnail.format == "WEBP"
+    assert thumbnail.size == (100, 50)
+
+    # Served from storage on the next request
+    again = client.get(f"/products/{product.product_id}/image", params={"size": "thumb", "format": "webp"})
+    assert again.headers["etag"] == response.headers["etag"]
+    assert again.content == response.content
+
+def test_product_image_invalid_variant(client: TestClient, db_session: Session):
+    product, _ = add_test_image(db_session, "VAR002")
+    assert client.get(f"/products/{product.product_id}/image", params={"size": "huge"}).status_code == 400
+    assert client.get(f"/products/{product.product_id}/image", params={"format": "webp"}).status_code == 400
+
+# --- Profit and loss tests ---
+
+def add_priced_sale(db: Session, sku: str, price_points, sale_price: str, sale_date):
+    from datetime import date
+    from decimal import Decimal
+    from models import Inventory, PricePoint, Sale
+    product = Product(
+        name=f"P&L {sku}",
+        sku=sku,
+        category_id=db.default_category_id,
+        condition="New",
+        purchase_date=date(2024, 12, 1),
+        location="USA",
+        obtained_method="Purchased"
+    )
+    db.add(product)
+    db.flush()
+    for effective_from, base_cost in price_points:
+        db.add(PricePoint(
+            product_id=product.product_id,
+            base_cost=Decimal(base_cost),
+            selling_price=Decimal("99.00"),
+            shipment_cost=Decimal("1.00"),
+            currency="USD",
+            effective_from=effective_from
+        ))
+    db.add(Inventory(product_id=product.product_id, quantity=1, available_quantity=1))
+    db.add(Sale(
+        product_id=product.product_id,
+        sale_price=Decimal(sale_price),
+        sale_date=sale_date,
+        payment_method="Cash"
+    ))
+    db.commit()
+    return product
+
+def test_profit_and_loss_uses_effective_price_point(client: TestClient, db_session: Session):
+    from datetime import datetime
+    add_priced_sale(
+        db_session, "PNL001",
+        [(datetime(2025, 1, 1), "10.00"), (datetime(2025, 3, 1), "30.00")],
+        "50.00", datetime(2025, 2, 10, 15, 0)
+    )
+
+    response = client.post("/profit-and-loss/", json={"month": "2025-02"})
+
+    assert response.status_code == 201
+    data = response.json()
+    assert float(data["gross_sales"]) == 50.0
+    assert float(data["cost_of_sales"]) == 10.0
+    assert float(data["shipping_expense"]) == 1.0
+    assert float(data["gross_profit"]) == 39.0
+
+def test_profit_and_loss_backfill(client: TestClient, db_session: Session):
+    from datetime import datetime
+    add_priced_sale(db_session, "PNL002", [(datetime(2025, 1, 1), "5.00")], "20.00", datetime(2025, 1, 31, 23, 30))
+    add_priced_sale(db_session, "PNL003", [(datetime(2025, 1, 1), "7.00")], "12.00", datetime(2025, 3, 15))
+
+    response = client.post("/profit-and-loss/backfill", params={"from": "2025-01", "to": "2025-03"})
+
+    assert response.status_code == 201
+    data = response.json()
+    assert [row["month"] for row in data] == ["2025-01-01", "2025-02-01", "2025-03-01"]
+    assert [float(row["gross_sales"]) for row in data] == [20.0, 0.0, 12.0]
+
+    # Re-running updates the same rows instead of adding new ones
+    client.post("/profit-and-loss/backfill", params={"from": "2025-01", "to": "2025-03"})
+    assert len(client.get("/profit-and-loss/").json()) == 3
+
+def test_profit_and_loss_backfill_invalid_range(client: TestClient, db_session: Session):
+    response = client.post("/profit-and-loss/backfill", params={"from": "2025-05", "to": "2025-01"})
+    assert response.status_code == 400
+
+# --- Sales rollup tests ---
+
+def sell_instances(client: TestClient, instances, sales):
+    sale_ids = []
+    for instance, (price, sale_date, payment_method) in zip(instances, sales):
+        response = client.post(f"/instances/{instance.instance_id}/sell", json={
+            "sale_price": price,
+            "sale_date": sale_date,
+            "payment_method": payment_method
+        })
+        assert response.status_code == 200
+        sale_ids.append(response.json()["sale_id"])
+    return sale_ids
+
+def test_sales_rollup_tracks_sales_and_deletes(client: TestClient, db_session: Session):
+    product, instances = create_test_instances(db_session, "Eevee", "RLP001", ["USA", "USA", "USA"])
+    sale_ids = sell_instances(client, instances, [
+        ("10.00", "2025-04-01T10:00:00", "Cash"),
+        ("20.00", "2025-04-01T18:00:00", "Credit"),
+        ("30.00", "2025-04-20T09:00:00", "Cash"),
+    ])
+
+    daily = client.get("/sales/rollup", params={"period": "day"}).json()
+    assert [(row["period_start"], row["sales_count"], row["revenue"]) for row in daily] == [
+        ("2025-04-01", 2, 30.0),
+        ("2025-04-20", 1, 30.0),
+    ]
+
+    by_payment = client.get("/sales/rollup", params={"period": "month", "group_by": "payment_method"}).json()
+    assert [(row["payment_method"], row["sales_count"], row["revenue"]) for row in by_payment] == [
+        ("Cash", 2, 40.0),
+        ("Credit", 1, 20.0),
+    ]
+
+    assert client.delete(f"/sales/{sale_ids[2]}").status_code == 200
+    daily = client.get("/sales/rollup", params={"period": "day"}).json()
+    assert [row["period_start"] for row in daily] == ["2025-04-01"]
+
+    # Rebuilding from history gives the same totals as the incremental updates
+    monthly = client.get("/sales/rollup", params={"period": "month"}).json()
+    response = client.post("/sales/rollup/rebuild")
+    assert response.status_code == 200
+    assert client.get("/sales/rollup", params={"period": "month"}).json() == monthly
+
+    assert client.delete(f"/products/{product.product_id}").status_code == 200
+    assert client.get("/sales/rollup", params={"period": "month"}).json() == []
+
+def test_sales_rollup_delete_uses_counted_breakdown(client: TestClient, db_session: Session):
+    product, instances = create_test_instances(db_session, "Jolteon", "RLP002", ["USA", "USA"])
+    product.location = "USA"
+    db_session.commit()
+    sale_ids = sell_instances(client, instances, [
+        ("10.00", "2025-04-02T10:00:00", "Cash"),
+        ("5.00", "2025-04-02T11:00:00", "Cash"),
+    ])
+
+    # Moving the product afterwards must not change which bucket its sales leave
+    product.location = "Colombia"
+    db_session.commit()
+
+    assert client.delete(f"/sales/{sale_ids[0]}").status_code == 200
+    by_location = client.get("/sales/rollup", params={"period": "day", "group_by": "location"}).json()
+    assert [(row["location"], row["sales_count"], row["revenue"]) for row in by_location] == [("USA", 1, 5.0)]
+
+    response = client.post("/sales/rollup/rebuild")
+    assert response.status_code == 200
+    assert client.get("/sales/rollup", params={"period": "day", "group_by": "location"}).json() == by_location
+
+def test_sales_rollup_invalid_group(client: TestClient, db_session: Session):
+    assert client.get("/sales/rollup", params={"group_by": "supplier"}).status_code == 400
+    assert client.get("/sales/rollup", params={"period": "week"}).status_code == 400
+
+# --- Statistics tests ---
+
+def test_inventory_stats(client: TestClient, db_session: Session):
+    from datetime import datetime, timedelta
+    from main import inventory_stats_cache
+    inventory_stats_cache.clear()
+
+    def add_product(sku, location, created_at=None):
+        product = Product(name=sku, sku=sku, category_id=db_session.default_category_id,
+                          condition="New", location=location, obtained_method="Purchased")
+        if created_at:
+            product.created_at = created_at
+        db_session.add(product)
+        db_session.commit()
+
+    add_product("STA001", "USA", datetime.now() - timedelta(days=200))
+    add_product("STA002", None)
+
+    response = client.get("/stats/inventory")
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total"] == 2
+    assert data["by_location"] == {"Colombia": 1, "USA": 1}
+    assert data["by_category"] == {"Default Category": 2}
+    assert data["by_age"]["less_than_30_days"] == 1
+    assert data["by_age"]["more_than_180_days"] == 1
+    assert "max-age" in response.headers["Cache-Control"]
+
+    # Served from the cache until the TTL expires
+    add_product("STA003", "USA")
+    assert client.get("/stats/inventory").json()["total"] == 2
+    inventory_stats_cache.clear()
+    assert client.get("/stats/inventory").json()["total"] == 3
+
+# --- Async read endpoint tests ---
+
+def test_get_products_paginated_with_instance_aggregates(client: TestClient, db_session: Session):
+    from decimal import Decimal
+    cheap, cheap_instances = create_test_instances(db_session, "Magikarp", "AGG001", ["USA", "USA", "USA"])
+    cheap_instances[0].base_cost = Decimal("1.00")
+    cheap_instances[1].status = "sold"
+    pricey, pricey_instances = create_test_instances(db_session, "Gyarados", "AGG002", ["USA"])
+    pricey_instances[0].base_cost = Decimal("40.00")
+    create_test_instances(db_session, "Ditto", "AGG003", [])
+    db_session.commit()
+
+    products = client.get("/products/").json()
+    # One row per product, not per instance
+    assert [p["sku"] for p in products] == ["AGG001", "AGG002", "AGG003"]
+    magikarp = products[0]
+    assert (magikarp["available_count"], magikarp["sold_count"]) == (2, 1)
+    assert (magikarp["min_base_cost"], magikarp["max_base_cost"]) == (1.0, 5.0)
+    assert magikarp["avg_base_cost"] == pytest.approx(11 / 3)
+    assert (products[2]["available_count"], products[2]["min_base_cost"]) == (0, None)
+
+    page = client.get("/products/", params={"skip": 1, "limit": 1}).json()
+    assert [p["sku"] for p in page] == ["AGG002"]
+
+    by_cost = client.get("/products/", params={"sort_by": "max_base_cost", "order": "desc"}).json()
+    assert [p["sku"] for p in by_cost] == ["AGG002", "AGG001", "AGG003"]
+    by_available = client.get("/products/", params={"sort_by": "available_count", "order": "desc"}).json()
+    assert [p["sku"] for p in by_available] == ["AGG001", "AGG002", "AGG003"]
+
+    assert client.get("/products/", params={"sort_by": "image_hash"}).status_code == 400
+    assert client.get("/products/", params={"order": "sideways"}).status_code == 400
+
+def test_get_product_instances_paginated(client: TestClient, db_session: Session):
+    product, instances = create_test_instances(db_session, "Eevee", "PIN001", ["USA", "USA", "Colombia"])
+    create_test_instances(db_session, "Vaporeon", "PIN002", ["USA"])
+    instances[1].status = "sold"
+    db_session.commit()
+
+    first_page = client.get(f"/products/{product.product_id}/instances", params={"limit": 2})
+    assert first_page.status_code == 200
+    assert [i["instance_id"] for i in first_page.json()] == [instances[0].instance_id, instances[1].instance_id]
+    next_page = client.get(
+        f"/products/{product.product_id}/instances",
+        params={"limit": 2, "cursor": first_page.headers["X-Next-Cursor"]}
+    )
+    assert [i["instance_id"] for i in next_page.json()] == [instances[2].instance_id]
+    assert "X-Next-Cursor" not in next_page.headers
+
+    available = client.get(f"/products/{product.product_id}/instances", params={"status": "available"}).json()
+    assert [i["location"] for i in available] == ["USA", "Colombia"]
+    assert client.get("/products/999999/instances").status_code == 404
+
+def test_clone_product_shares_images_and_creates_instances(client: TestClient, db_session: Session):
+    from models import ProductImage, ProductInstance
+    product, key = add_test_image(db_session, "CLN001")
+    product.description = "Holo"
+    db_session.commit()
+
+    response = client.post(f"/products/{product.product_id}/clone", json={"name": "Cached copy", "base_costs": ["3.50", "4.00"]})
+    assert response.status_code == 200
+    clone = response.json()
+    assert clone["product_id"] != product.product_id
+    assert clone["sku"] != product.sku
+    assert (clone["name"], clone["description"], clone["image_count"]) == ("Cached copy", "Holo", 1)
+
+    images = db_session.query(ProductImage).filter(ProductImage.product_id == clone["product_id"]).all()
+    assert [(image.image_hash, image.is_primary) for image in images] == [(key, True)]
+    costs = db_session.query(ProductInstance.base_cost, ProductInstance.status).filter(
+        ProductInstance.product_id == clone["product_id"]
+    ).order_by(ProductInstance.instance_id).all()
+    assert [(str(cost), status) for cost, status in costs] == [("3.50", "available"), ("4.00", "available")]
+
+    bare = client.post(f"/products/{product.product_id}/clone", json={"copy_images": False}).json()
+    assert (bare["name"], bare["image_count"]) == (product.name, 0)
+    assert client.post("/products/999999/clone", json={}).status_code == 404
+    assert client.post(f"/products/{product.product_id}/clone", json={"base_costs": ["-1"]}).status_code == 422
+
+def test_async_read_endpoints(client: TestClient, db_session: Session):
+    product, instances = create_test_instances(db_session, "Snorlax", "ASY001", ["USA"])
+    create_test_event(db_session, "Async Expo", "100.00")
+    sell_instances(client, instances, [("12.00", "2025-05-01T10:00:00", "USD")])
+
+    response = client.get(f"/products/{product.product_id}")
+    assert response.status_code == 200
+    assert response.json()["name"] == "Snorlax"
+    assert client.get("/products/999999").status_code == 404
+
+    assert [p["sku"] for p in client.get("/products/").json()] == ["ASY001"]
+    assert [c["category_name"] for c in client.get("/categories/").json()] == ["Default Category"]
+    assert len(client.get("/events/").json()) == 1
+
+    sales = client.get("/sales/", params={"start_date": "2025-05-01", "end_date": "2025-05-01"}).json()
+    assert [(s["product_id"], s["payment_method"]) for s in sales] == [(product.product_id, "USD")]
+
+# --- Connection pool tests ---
+
+def test_instrumented_pool_records_waits_and_timeouts(tmp_path):
+    from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+    from pool_metrics import InstrumentedQueuePool, pool_status
+    pool_engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}",
+        poolclass=InstrumentedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.05
+    )
+
+    with pool_engine.connect():
+        with pytest.raises(PoolTimeoutError):
+            pool_engine.connect()
+        status = pool_status(pool_engine)
+        assert status["checked_out"] == 1
+
+    status = pool_status(pool_engine)
+    assert status["checkouts"] == 1
+    assert status["timeouts"] == 1
+    assert status["wait_seconds_max"] >= 0.05
+    pool_engine.dispose()
+
+def test_db_pool_metrics_endpoint(client: TestClient):
+    response = client.get("/metrics/db-pool")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["mode"] == "queue"
+    assert data["sync"]["pool_class"] == "InstrumentedQueuePool"
+    assert {"size", "checked_out", "checkouts", "timeouts", "wait_seconds_avg"} <= data["sync"].keys()
+
+# --- Product import tests ---
+
+def test_import_products_csv(client: TestClient, db_session: Session):
+    from models import ProductInstance
+    csv_content = (
+        "name,category,condition,purchase_date,obtained_method,base_costs,location\n"
+        "Pikachu,Default Category,Near Mint,2025-06-01,Purchased,5.00;6.50,USA\n"
+        "Broken,Default Category,Destroyed,2025-06-01,Purchased,1.00,USA\n"
+        "Mew,Unknown,New,2025-06-01,Purchased,3.00,USA\n"
+        "Raichu,Default Category,Good,06/02/2025,Trade,4.00,Colombia\n"
+    )
+
+    response = client.post(
+        "/products/import",
+        files={"file": ("cards.csv", csv_content, "text/csv")},
+        params={"batch_size": 1}
+    )
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["imported_count"] == 2
+    assert data["instance_count"] == 3
+    assert [(error["row"], error["error"].split(":")[0]) for error in data["errors"]] == [
+        (2, "condition"),
+        (3, "Category not found"),
+    ]
+
+    products = db_session.query(Product).order_by(Product.product_id).all()
+    assert [p.name for p in products] == ["Pikachu", "Raichu"]
+    assert len({p.sku for p in products}) == 2
+    assert all(p.sku.startswith("DE") for p in products)
+    assert db_session.query(ProductInstance).filter(ProductInstance.product_id == products[0].product_id).count() == 2
+
+def test_import_products_jsonl_skus(client: TestClient, db_session: Session):
+    lines = [
+        '{"name": "A", "category_id": %d, "condition": "New", "purchase_date": "2025-06-01", "obtained_method": "Purchased", "base_costs": [1.5], "sku": "CUSTOM1"}' % db_session.default_category_id,
+        '{"name": "B", "category_id": %d, "condition": "New", "purchase_date": "2025-06-01", "obtained_method": "Purchased", "base_costs": [2], "sku": "CUSTOM1"}' % db_session.default_category_id,
+        'not json',
+        '{"name": "C", "category_id": %d, "condition": "New", "purchase_date": "2025-06-01", "obtained_method": "Purchased", "base_costs": 3}' % db_session.default_category_id,
+    ]
+
+    response = client.post("/products/import", files={"file": ("cards.jsonl", "\n".join(lines), "application/x-ndjson")})
+
+    data = response.json()
+    assert data["imported_count"] == 2
+    assert [error["row"] for error in data["errors"]] == [2, 3]
+    assert "CUSTOM1" in {p.sku for p in db_session.query(Product).all()}
+
+    # Importing the same SKU again is reported instead of failing the batch
+    response = client.post("/products/import", files={"file": ("cards.jsonl", lines[0], "application/x-ndjson")})
+    assert response.json()["errors"] == [{"row": 1, "error": "SKU 'CUSTOM1' already exists"}]
+
+def test_import_products_unknown_format(client: TestClient, db_session: Session):
+    response = client.post("/products/import", files={"file": ("cards.xlsx", b"data", "application/octet-stream")})
+    assert response.status_code == 400
+
+# --- SKU allocation tests ---
+
+def test_allocate_skus_concurrent_blocks_never_collide(db_session: Session):
+    from concurrent.futures import ThreadPoolExecutor
+    from datetime import date, datetime
+    from sqlalchemy import insert
+    from skus import allocate_skus
+    now = datetime(2025, 7, 1, 12, 30)  # Everything in the same minute, the old failure mode
+
+    def create_products(worker):
+        with TestingSessionLocal() as db:
+            for batch in range(25):
+                skus = allocate_skus(db, "DE", 10, now=now)
+                db.execute(insert(Product), [
+                    {"name": f"Card {worker}-{batch}", "sku": sku, "category_id": db_session.default_category_id,
+                     "condition": "New", "purchase_date": date(2025, 7, 1), "obtained_method": "Purchased"}
+                    for sku in skus
+                ])
+                db.commit()
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(create_products, range(8)))
+
+    skus = [sku for (sku,) in db_session.query(Product.sku)]
+    assert len(skus) == len(set(skus)) == 2000
+    assert all(sku.startswith("DE2507011230") for sku in skus)
+    assert allocate_skus(db_session, "DE", 2, now=now) == ["DE25070112302001", "DE25070112302002"]
+    assert allocate_skus(db_session, "PO", 1, now=now) == ["PO25070112300001"]
+
+def test_clone_product_concurrent_requests_get_unique_skus(client: TestClient, db_session: Session):
+    from concurrent.futures import ThreadPoolExecutor
+    product, _ = create_test_instances(db_session, "Popular", "POP001", [])
+
+    def clone(_):
+        response = client.post(f"/products/{product.product_id}/clone", json={})
+        return response.status_code, response.json().get("sku")
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(clone, range(100)))
+
+    assert {status for status, _ in results} == {200}
+    assert len({sku for _, sku in results}) == 100
+
+# --- Export tests ---
+
+def test_export_instances_csv_and_ndjson(client: TestClient, db_session: Session):
+    import csv as csv_module
+    import io
+    import json
+    create_test_instances(db_session, "Gengar", "EXP001", ["USA", "Colombia"])
+
+    response = client.get("/export/instances", params={"format": "csv"}, headers={"Accept-Encoding": "identity"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    assert "attachment" in response.headers["content-disposition"]
+    rows = list(csv_module.DictReader(io.StringIO(response.text)))
+    assert [(row["sku"], row["location"], row["base_cost"]) for row in rows] == [
+        ("EXP001", "USA", "5.00"),
+        ("EXP001", "Colombia", "5.00"),
+    ]
+
+    response = client.get("/export/products", params={"format": "ndjson"}, headers={"Accept-Encoding": "identity"})
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["sku"] for line in lines] == ["EXP001"]
+
+def test_export_sales_gzip_and_date_range(client: TestClient, db_session: Session):
+    import gzip
+    product, instances = create_test_instances(db_session, "Haunter", "EXP002", ["USA", "USA"])
+    sell_instances(client, instances, [
+        ("10.00", "2025-07-01T10:00:00", "Cash"),
+        ("20.00", "2025-07-31T23:00:00", "Cash"),
+    ])
+
+    with client.stream(
+        "GET", "/export/sales",
+        params={"format": "csv", "end_date": "2025-07-31"},
+        headers={"Accept-Encoding": "gzip"}
+    ) as response:
+        assert response.status_code == 200
+        assert response.headers["content-encoding"] == "gzip"
+        raw = b"".join(response.iter_raw())
+    lines = gzip.decompress(raw).decode().strip().splitlines()
+    assert len(lines) == 3
+
+    response = client.get("/export/sales", params={"start_date": "2025-07-15"}, headers={"Accept-Encoding": "identity"})
+    assert len(response.text.strip().splitlines()) == 2
+
+def test_export_honours_gzip_q_values(client: TestClient, db_session: Session):
+    create_test_instances(db_session, "Gastly", "EXP003", ["USA"])
+    for accept_encoding, gzipped in [
+        ("gzip;q=0, identity", False),
+        ("deflate, gzip;q=0.0", False),
+        ("gzip; q=0.5", True),
+        ("*", True),
+        ("*, gzip;q=0", False),
+        ("br", False),
+    ]:
+        response = client.get("/export/products", headers={"Accept-Encoding": accept_encoding})
+        assert response.status_code == 200
+        assert ("content-encoding" in response.headers) == gzipped, accept_encoding
+
+def test_export_unknown_dataset(client: TestClient, db_session: Session):
+    assert client.get("/export/suppliers").status_code == 404
+    assert client.get("/export/sales", params={"format": "xml"}).status_code == 400
+
+# --- Batch sell tests ---
+
+def test_sell_batch_is_all_or_nothing(client: TestClient, db_session: Session):
+    from models import ProductInstance, Sale
+    product, instances = create_test_instances(db_session, "Lot", "BAT001", ["USA", "USA", "USA"])
+    ids = [instance.instance_id for instance in instances]
+    payload = {"sale_date": "2025-08-01T12:00:00", "payment_method": "Cash"}
+
+    response = client.post("/instances/sell-batch", json={
+        **payload, "items": [{"instance_id": ids[0], "sale_price": "10.00"}, {"instance_id": ids[1], "sale_price": "12.00"}]
+    })
+    assert response.status_code == 200
+    assert sorted(float(sale["sale_price"]) for sale in response.json()) == [10.0, 12.0]
+
+    # ids[0] is already sold, so ids[2] must not be sold either
+    response = client.post("/instances/sell-batch", json={
+        **payload, "items": [{"instance_id": ids[2], "sale_price": "5.00"}, {"instance_id": ids[0], "sale_price": "5.00"}]
+    })
+    assert response.status_code == 409
+    assert response.json()["detail"]["instance_ids"] == [ids[0]]
+    db_session.expire_all()
+    assert db_session.get(ProductInstance, ids[2]).status == "available"
+    assert db_session.query(Sale).count() == 2
+
+    response = client.post("/instances/sell-batch", json={**payload, "items": [{"instance_id": 999999, "sale_price": "5.00"}]})
+    assert response.status_code == 404
+
+    duplicate = [{"instance_id": ids[2], "sale_price": "5.00"}] * 2
+    assert client.post("/instances/sell-batch", json={**payload, "items": duplicate}).status_code == 400
+
+def test_sell_batch_concurrent_requests_never_double_sell(client: TestClient, db_session: Session):
+    from concurrent.futures import ThreadPoolExecutor
+    from models import ProductInstance, Sale
+    product, instances = create_test_instances(db_session, "Contested", "BAT002", ["USA"] * 4)
+    items = [{"instance_id": instance.instance_id, "sale_price": "9.00"} for instance in instances]
+
+    def sell(_):
+        return client.post("/instances/sell-batch", json={
+            "sale_date": "2025-08-02T12:00:00", "payment_method": "Cash", "items": items
+        }).status_code
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        statuses = list(pool.map(sell, range(8)))
+
+    assert statuses.count(200) == 1
+    assert set(statuses) <= {200, 409}
+    assert db_session.query(Sale).count() == 4
+    assert db_session.query(ProductInstance).filter(ProductInstance.status == "sold").count() == 4
+
+# --- Bulk location update tests ---
+
+def test_bulk_update_instance_location_reports_missing_ids(client: TestClient, db_session: Session):
+    from models import ProductInstance
+    product, instances = create_test_instances(db_session, "Mover", "MOV001", ["Warehouse A", "Warehouse A"])
+    ids = [instance.instance_id for instance in instances]
+
+    response = client.patch("/instances/bulk-update-location", json={"instance_ids": ids + [999999], "new_location": "Warehouse B"})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["updated_count"] == 2
+    assert data["errors"] == [{"instance_id": 999999, "error": "Instance not found"}]
+    db_session.expire_all()
+    assert {db_session.get(ProductInstance, i).location for i in ids} == {"Warehouse B"}
+
+def test_move_instances_location_by_filter(client: TestClient, db_session: Session):
+    from models import ProductCategory, ProductInstance
+    other = ProductCategory(category_name="Other")
+    db_session.add(other)
+    db_session.commit()
+    product, instances = create_test_instances(db_session, "Filtered", "MOV002", ["Warehouse A"] * 3 + ["Warehouse C"])
+    instances[0].status = "sold"
+    other_product, other_instances = create_test_instances(db_session, "Elsewhere", "MOV003", ["Warehouse A"])
+    other_product.category_id = other.category_id
+    db_session.commit()
+
+    response = client.patch("/instances/move-location", json={
+        "from_location": "Warehouse A",
+        "new_location": "Warehouse B",
+        "category_id": product.category_id,
+    })
+    assert response.status_code == 200
+    assert response.json()["updated_count"] == 2
+
+    db_session.expire_all()
+    locations = {i.instance_id: db_session.get(ProductInstance, i.instance_id).location for i in instances + other_instances}
+    assert locations[instances[0].instance_id] == "Warehouse A"  # sold, not moved
+    assert locations[instances[1].instance_id] == locations[instances[2].instance_id] == "Warehouse B"
+    assert locations[instances[3].instance_id] == "Warehouse C"
+    assert locations[other_instances[0].instance_id] == "Warehouse A"
+
+# --- Reference data cache tests ---
+
+def test_category_list_is_cached_with_etag_and_invalidated_on_write(client: TestClient, db_session: Session):
+    response = client.get("/categories/")
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+    assert response.headers["cache-control"] == "private, no-cache"
+    assert [c["category_name"] for c in response.json()] == ["Default Category"]
+
+    revalidated = client.get("/categories/", headers={"If-None-Match": etag})
+    assert revalidated.status_code == 304
+    assert revalidated.content == b""
+
+    # Writes that bypass the API are not seen until the entry expires...
+    db_session.add(ProductCategory(category_name="Hidden"))
+    db_session.commit()
+    assert client.get("/categories/", headers={"If-None-Match": etag}).status_code == 304
+
+    # ...but the API's own writes invalidate the cached lists
+    assert client.post("/categories/", json={"category_name": "Figures"}).status_code == 200
+    response = client.get("/categories/", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert [c["category_name"] for c in response.json()] == ["Default Category", "Hidden", "Figures"]
+
+def test_local_cache_backend_expires_and_evicts_least_recently_used():
+    from cache import LocalCacheBackend, ReferenceDataCache
+    backend = LocalCacheBackend(max_entries=2)
+    backend.set("a", b"1", ttl=60)
+    backend.set("b", b"2", ttl=60)
+    assert backend.get("a") == b"1"  # "a" is now the most recently used
+    backend.set("c", b"3", ttl=60)
+    assert backend.get("b") is None
+    assert backend.get("a") == b"1" and backend.get("c") == b"3"
+
+    backend.set("d", b"4", ttl=0)
+    assert backend.get("d") is None
+
+    cache = ReferenceDataCache(LocalCacheBackend(), ttl=60)
+    cache.set("events", "0:100", b"[]")
+    cache.set("suppliers", "0:100", b"[]")
+    cache.invalidate("events")
+    assert cache.get("events", "0:100") is None
+    assert cache.get("suppliers", "0:100") == b"[]"
+
+def test_reference_cache_local_ttl_is_short_with_several_workers(monkeypatch):
+    from cache import LocalCacheBackend, RedisCacheBackend, create_cache_backend, create_reference_cache
+    monkeypatch.delenv("REFERENCE_CACHE_BACKEND", raising=False)
+    monkeypatch.delenv("REDIS_URL", raising=False)
+    monkeypatch.setenv("REFERENCE_CACHE_TTL", "300")
+    monkeypatch.delenv("WEB_CONCURRENCY", raising=False)
+    cache = create_reference_cache()
+    assert isinstance(cache.backend, LocalCacheBackend)
+    assert cache.ttl == 5
+
+    monkeypatch.setenv("WEB_CONCURRENCY", "1")
+    assert create_reference_cache().ttl == 300
+
+    # A configured Redis becomes the default backend
+    monkeypatch.setenv("REDIS_URL", "redis://localhost:6379/0")
+    pytest.importorskip("redis")
+    assert isinstance(create_cache_backend(), RedisCacheBackend)
+
+# --- Exchange rate tests ---
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class MockRateProvider:
+    """Local stand-in for exchangerate-api serving queued responses"""
+
+    def __init__(self):
+        self.responses = []  # (status, body) pairs; the last one is repeated
+        self.requests = []
+        provider = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                provider.requests.append(self.path)
+                status, body = provider.responses[0] if len(provider.responses) == 1 else provider.responses.pop(0)
+                payload = body if isinstance(body, bytes) else json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/v6/{{api_key}}/latest/{{base_currency}}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def publish(self, rates, updated_unix):
+        self.responses.append((200, {"result": "success", "time_last_update_unix": updated_unix, "conversion_rates": rates}))
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+@pytest.fixture
+def rate_provider():
+    provider = MockRateProvider()
+    yield provider
+    provider.close()
+
+def make_rate_service(rate_provider, **kwargs):
+    from exchange_rates import ExchangeRateService
+    return ExchangeRateService(TestingSessionLocal, api_url=rate_provider.url, api_key="test-key", **kwargs)
+
+def test_exchange_rates_are_cached_persisted_and_kept_in_history(client: TestClient, db_session: Session, rate_provider):
+    from exchange_rates import get_exchange_rate_service
+    from models import ExchangeRateHistory, ExchangeRateSnapshot
+    rate_provider.publish({"USD": 1, "COP": 4100.5, "EUR": 0.9}, 1754006400)  # 2025-08-01 00:00 UTC
+    service = make_rate_service(rate_provider)
+    app.dependency_overrides[get_exchange_rate_service] = lambda: service
+    try:
+        for _ in range(3):
+            response = client.get("/exchange-rates/")
+            assert response.status_code == 200
+            assert response.json()["rates"]["COP"] == 4100.5
+            assert response.json()["stale"] is False
+        assert rate_provider.requests == ["/v6/test-key/latest/USD"]
+        assert "max-age" in response.headers["cache-control"]
+    finally:
+        del app.dependency_overrides[get_exchange_rate_service]
+
+    assert db_session.get(ExchangeRateSnapshot, "USD").rates["COP"] == 4100.5
+    assert db_session.query(ExchangeRateHistory).count() == 3
+
+    # Point-in-time lookups use the rate in effect at that moment
+    response = client.get("/exchange-rates/history", params={"currency": "cop", "at": "2025-08-02T12:00:00"})
+    assert response.status_code == 200
+    assert float(response.json()["rate"]) == 4100.5
+    assert client.get("/exchange-rates/history", params={"currency": "COP", "at": "2025-07-31T12:00:00"}).status_code == 404
+
+def test_exchange_rates_survive_restart_and_refresh_in_background(db_session: Session, rate_provider):
+    import asyncio
+    rate_provider.publish({"COP": 4000.0}, 1754006400)
+    rate_provider.publish({"COP": 4200.0}, 1754092800)
+
+    async def scenario():
+        first = make_rate_service(rate_provider)
+        assert (await first.get_rates("USD")).rates["COP"] == 4000.0
+        await first.stop()
+
+        # A new process starts from the stored snapshot; with max_age=0 it is
+        # served stale right away while the refresh runs in the background
+        restarted = make_rate_service(rate_provider, max_age=0)
+        stale = await restarted.get_rates("USD")
+        assert stale.rates["COP"] == 4000.0
+        await restarted.refresh("USD")
+        assert (await restarted.get_rates("USD")).rates["COP"] == 4200.0
+        await restarted.stop()
+
+        # Provider down: the last good rates are still served
+        rate_provider.responses[:] = [(500, {"result": "error"})]
+        offline = make_rate_service(rate_provider, max_age=0)
+        assert (await offline.get_rates("USD")).rates["COP"] == 4200.0
+        await asyncio.sleep(0.2)  # let the failed background refresh finish
+        assert (await offline.get_rates("USD")).rates["COP"] == 4200.0
+        await offline.stop()
+
+    asyncio.run(scenario())
+    assert len(rate_provider.requests) >= 3
+    from models import ExchangeRateHistory
+    assert db_session.query(ExchangeRateHistory).count() == 2
+
+def test_exchange_rate_failures_are_handled_and_remembered(client: TestClient, rate_provider):
+    import asyncio
+    from exchange_rates import get_exchange_rate_service
+
+    async def scenario():
+        # A 200 response that is not a JSON object is an ExchangeRateError, not a crash
+        rate_provider.responses[:] = [(200, b"<html>maintenance</html>"), (200, [1, 2])]
+        service = make_rate_service(rate_provider)
+        assert await service.get_rates("USD") is None
+        assert await service.get_rates("EUR") is None
+        await service.stop()
+
+        # Failed codes are not requested again until failure_ttl has passed
+        rate_provider.responses[:] = [(404, {"result": "error", "error-type": "unsupported-code"})]
+        requests_before = len(rate_provider.requests)
+        service = make_rate_service(rate_provider)
+        for _ in range(3):
+            assert await service.get_rates("XYZ") is None
+        assert len(rate_provider.requests) == requests_before + 1
+        service.failure_ttl = 0
+        assert await service.get_rates("XYZ") is None
+        assert len(rate_provider.requests) == requests_before + 2
+        await service.stop()
+
+    asyncio.run(scenario())
+
+    service = make_rate_service(rate_provider)
+    app.dependency_overrides[get_exchange_rate_service] = lambda: service
+    try:
+        requests_before = len(rate_provider.requests)
+        for code in ["US", "USD1", "U$D"]:
+            assert client.get("/exchange-rates/", params={"base_currency": code}).status_code == 400
+        assert len(rate_provider.requests) == requests_before
+    finally:
+        del app.dependency_overrides[get_exchange_rate_service]
+    response = client.get("/exchange-rates/history", params={"currency": "C0P", "at": "2025-08-02T12:00:00"})
+    assert response.status_code == 400
+
+# --- Base currency tests ---
+
+def record_rate(db: Session, currency: str, rate: str, effective_at):
+    from decimal import Decimal
+    from models import ExchangeRateHistory
+    db.add(ExchangeRateHistory(base_currency="USD", currency=currency, rate=Decimal(rate), effective_at=effective_at))
+    db.commit()
+
+def test_sales_in_other_currencies_are_stored_with_base_amounts(client: TestClient, db_session: Session):
+    from datetime import datetime, timezone
+    product, instances = create_test_instances(db_session, "Pikachu", "FXS001", ["Colombia"] * 3)
+
+    response = client.post(f"/instances/{instances[0].instance_id}/sell", json={
+        "sale_price": "80000", "currency": "COP", "sale_date": "2025-05-02T10:00:00", "payment_method": "Cash"
+    })
+    assert response.status_code == 400  # No COP rate recorded yet
+
+    record_rate(db_session, "COP", "4000", datetime(2025, 5, 1, tzinfo=timezone.utc))
+    record_rate(db_session, "COP", "4100", datetime(2025, 6, 1, tzinfo=timezone.utc))
+    response = client.post(f"/instances/{instances[0].instance_id}/sell", json={
+        "sale_price": "80000", "currency": "COP", "sale_date": "2025-05-02T10:00:00", "payment_method": "Cash"
+    })
+    assert response.status_code == 200
+    assert float(response.json()["fx_rate"]) == 4000
+    assert float(response.json()["sale_price_base"]) == 20.0
+
+    sell_instances(client, instances[1:2], [("15.00", "2025-05-03T10:00:00", "USD")])
+    response = client.post("/instances/sell-batch", json={
+        "sale_date": "2025-06-02T10:00:00", "payment_method": "Cash", "currency": "COP",
+        "items": [{"instance_id": instances[2].instance_id, "sale_price": "41000"}]
+    })
+    assert float(response.json()[0]["sale_price_base"]) == 10.0
+
+    # The rollup sums the USD amounts: 20 + 15 in May, 10 in June
+    monthly = client.get("/sales/rollup", params={"period": "month"}).json()
+    assert [(row["period_start"], row["revenue"]) for row in monthly] == [("2025-05-01", 35.0), ("2025-06-01", 10.0)]
+
+def test_backfill_converts_rows_written_before_base_amounts(db_session: Session):
+    from datetime import date, datetime, timezone
+    from decimal import Decimal
+    from sqlalchemy import insert, update
+    from currency import backfill_base_amounts
+    from models import Sale, TravelExpense
+    product, _ = create_test_instances(db_session, "Legacy", "FXB001", [])
+    record_rate(db_session, "COP", "4000", datetime(2025, 1, 1, tzinfo=timezone.utc))
+    event = create_test_event(db_session, "Legacy Expo", "100.00")
+
+    sale = {"product_id": product.product_id, "payment_method": "Cash"}
+    db_session.execute(insert(Sale), [
+        {**sale, "sale_price": Decimal("12.50"), "currency": "USD", "sale_date": datetime(2024, 11, 5)},
+        {**sale, "sale_price": Decimal("60000"), "currency": "COP", "sale_date": datetime(2024, 11, 6)},
+        {**sale, "sale_price": Decimal("10"), "currency": "EUR", "sale_date": datetime(2024, 11, 7)},
+    ])
+    db_session.add(TravelExpense(
+        event_id=event.event_id, name="Taxi", amount=Decimal("20000"), currency="COP", expense_date=date(2025, 2, 1)
+    ))
+    # Rows from before the migration have no rate or base amounts
+    db_session.execute(update(Sale).values(fx_rate=None, sale_price_base=None))
+    db_session.execute(update(TravelExpense).values(fx_rate=None, amount_base=None))
+    db_session.commit()
+
+    counts = backfill_base_amounts(db_session)
+    assert counts["sales"] == 2
+    assert counts["sales_missing_rate"] == 1
+    assert counts["travel_expenses"] == 1
+
+    db_session.expire_all()
+    amounts = {sale.currency: (sale.fx_rate, sale.sale_price_base) for sale in db_session.query(Sale)}
+    assert amounts["USD"] == (Decimal(1), Decimal("12.50"))
+    assert amounts["COP"] == (Decimal(4000), Decimal("15.00"))  # older than the history: earliest rate
+    assert amounts["EUR"] == (None, None)
+    assert db_session.query(TravelExpense).one().amount_base == Decimal("5.00")
+
+# --- Product search tests ---
+
+def test_search_products_ranks_paginates_and_highlights(client: TestClient, db_session: Session):
+    from datetime import date
+    for sku, name, description in [
+        ("SRC001", "Charizard ex <Holo>", "Obsidian Flames set"),
+        ("SRC002", "Charmander", "Starter card, pairs well with charizard"),
+        ("SRC003", "Pikachu", None),
+    ]:
+        db_session.add(Product(
+            name=name, sku=sku, description=description, category_id=db_session.default_category_id,
+            condition="New", purchase_date=date(2025, 1, 1), obtained_method="Purchased"
+        ))
+    db_session.commit()
+
+    response = client.get("/search/products", params={"q": "charizard", "limit": 1})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["has_more"] is True
+    first = data["results"][0]
+    assert first["sku"] == "SRC001"  # name matches rank above description matches
+    assert first["name_highlight"] == "<mark>Charizard</mark> ex &lt;Holo&gt;"
+
+    second = client.get("/search/products", params={"q": "charizard", "limit": 1, "offset": 1}).json()
+    assert second["has_more"] is False
+    assert second["results"][0]["sku"] == "SRC002"
+    assert "<mark>charizard</mark>" in second["results"][0]["description_highlight"]
+
+    assert client.get("/search/products", params={"q": "src003"}).json()["results"][0]["name"] == "Pikachu"
+    assert client.get("/search/products", params={"q": ""}).status_code == 422
+
+# --- Image count / receipt flag tests ---
+
+def test_listings_report_image_count_and_receipt_without_extra_queries(client: TestClient, db_session: Session):
+    from datetime import date
+    from decimal import Decimal
+    from sqlalchemy import event as sa_event
+    from models import ProductImage, TravelExpense
+    test_event = create_test_event(db_session, "Badge Expo", "100.00")
+    for index, image_count in enumerate([2, 0, 1]):
+        product, _ = create_test_instances(db_session, f"Badge {index}", f"BDG00{index}", ["USA"])
+        product.event_id = test_event.event_id
+        for _ in range(image_count):
+            db_session.add(ProductImage(product_id=product.product_id, image_hash="0" * 64, image_type="png"))
+    db_session.add_all([
+        TravelExpense(event_id=test_event.event_id, name="Hotel", amount=Decimal("50"), expense_date=date(2025, 1, 2),
+                      receipt_hash="1" * 64, receipt_type="png"),
+        TravelExpense(event_id=test_event.event_id, name="Taxi", amount=Decimal("5"), expense_date=date(2025, 1, 3)),
+    ])
+    db_session.commit()
+
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    sa_event.listen(engine, "before_cursor_execute", listener)
+    try:
+        products = client.get(f"/events/{test_event.event_id}/products").json()
+        expenses = client.get(f"/events/{test_event.event_id}/travel-expenses").json()
+    finally:
+        sa_event.remove(engine, "before_cursor_execute", listener)
+
+    assert sorted((p["sku"], p["image_count"]) for p in products) == [("BDG000", 2), ("BDG001", 0), ("BDG002", 1)]
+    assert {e["name"]: e["has_receipt"] for e in expenses} == {"Hotel": True, "Taxi": False}
+    # The image counts come with the products query: one for the products, one
+    # for their shared event, then the event check and the expenses
+    selects = [s for s in statements if s.lstrip().upper().startswith("SELECT")]
+    assert len(selects) == 4
+    assert len([s for s in selects if "product_images" in s]) == 1
+
+    instances = client.get("/instances/").json()
+    assert {i["product"]["sku"]: i["product"]["image_count"] for i in instances}["BDG000"] == 2
@@ -0,0 +1,171 @@
+"""
+Concurrency tests that need PostgreSQL's row locks.
+
+SQLite runs one writer at a time and has no SELECT ... FOR UPDATE, so the
+locking paths can only be proven against a real server. Like
+test_query_plans.py these tests take a throwaway database from
+TEST_POSTGRES_URL, drop and recreate every table in it, and are skipped when
+it is not set.
+"""
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import main
+import models
+import schema
+from models import Base
+from skus import allocate_skus
+
+TEST_POSTGRES_URL = os.getenv("TEST_POSTGRES_URL")
+
+pytestmark = pytest.mark.skipif(not TEST_POSTGRES_URL, reason="TEST_POSTGRES_URL is not set")
+
+THREADS = 16
+
+
+@pytest.fixture(scope="module")
+def pg_sessions():
+    engine = create_engine(TEST_POSTGRES_URL, pool_size=THREADS, max_overflow=0)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(bind=engine, autoflush=False)
+    Base.metadata.drop_all(bind=engine)
+    engine.dispose()
+
+
+def create_single_instance_products(Session, prefix: str, count: int):
+    """Products with one available instance each, so a sale's product identifies the instance sold"""
+    with Session() as db:
+        category = models.ProductCategory(category_name=f"{prefix} cards")
+        db.add(category)
+        db.flush()
+        instance_ids = {}
+        for index in range(count):
+            product = models.Product(
+                name=f"{prefix} {index}", sku=f"{prefix}-{index}", category_id=category.category_id,
+                condition="New", purchase_date=date(2025, 1, 2), obtained_method="purchase"
+            )
+            db.add(product)
+            db.flush()
+            instance = models.ProductInstance(product_id=product.product_id, base_cost=Decimal("5.00"))
+            db.add(instance)
+            db.flush()
+            instance_ids[instance.instance_id] = product.product_id
+        db.commit()
+        return instance_ids
+
+
+def run_concurrently(Session, calls):
+    """Run each call with its own session, all released at once; returns their HTTP statuses"""
+    barrier = threading.Barrier(len(calls))
+
+    def run(call):
+        with Session() as db:
+            barrier.wait()
+            try:
+                call(db)
+                return 200
+            except HTTPException as e:
+                return e.status_code
+
+    with ThreadPoolExecutor(max_workers=len(calls)) as pool:
+        return list(pool.map(run, calls))
+
+
+def sales_per_product(Session, product_ids):
+    with Session() as db:
+        return dict(db.execute(
+            select(models.Sale.product_id, func.count())
+            .where(models.Sale.product_id.in_(product_ids))
+            .group_by(models.Sale.product_id)
+        ).all())
+
+
+def test_sell_batch_never_sells_an_instance_twice(pg_sessions):
+    instance_products = create_single_instance_products(pg_sessions, "Batch", 10)
+    instance_ids = sorted(instance_products)
+    # Overlapping batches: every instance is requested by several threads at once
+    batches = [
+        [instance_ids[i % len(instance_ids)], instance_ids[(i + 1) % len(instance_ids)]]
+        for i in range(THREADS)
+    ]
+
+    def seller(batch_ids):
+        request = schema.InstanceSellBatchRequest(
+            sale_date=datetime(2025, 8, 2, 12), payment_method="Cash",
+            items=[{"instance_id": instance_id, "sale_price": "9.00"} for instance_id in batch_ids]
+        )
+        return lambda db: main.sell_instances_batch(request, db)
+
+    statuses = run_concurrently(pg_sessions, [seller(batch) for batch in batches])
+
+    assert set(statuses) <= {200, 409}, statuses
+    sold_batches = [batch for batch, status in zip(batches, statuses) if status == 200]
+    assert sold_batches
+    sold_ids = [instance_id for batch in sold_batches for instance_id in batch]
+    # Successful batches never overlap, and each of their instances has exactly one sale
+    assert len(sold_ids) == len(set(sold_ids))
+    counts = sales_per_product(pg_sessions, list(instance_products.values()))
+    assert counts == {instance_products[instance_id]: 1 for instance_id in sold_ids}
+    with pg_sessions() as db:
+        sold = db.scalars(
+            select(models.ProductInstance.instance_id).where(
+                models.ProductInstance.instance_id.in_(instance_ids),
+                models.ProductInstance.status == "sold"
+            )
+        ).all()
+    assert sorted(sold) == sorted(sold_ids)
+
+
+def test_single_sale_of_one_instance_succeeds_once(pg_sessions):
+    instance_products = create_single_instance_products(pg_sessions, "Single", 1)
+    (instance_id, product_id), = instance_products.items()
+    sale = schema.SaleCreate(sale_price=Decimal("9.00"), sale_date=datetime(2025, 8, 2, 12), payment_method="Cash")
+
+    statuses = run_concurrently(
+        pg_sessions, [lambda db: main.sell_product(instance_id, sale, db)] * THREADS
+    )
+
+    assert statuses.count(200) == 1
+    assert set(statuses) == {200, 400}
+    assert sales_per_product(pg_sessions, [product_id]) == {product_id: 1}
+
+
+def test_concurrent_product_creation_gets_unique_skus(pg_sessions):
+    with pg_sessions() as db:
+        category = models.ProductCategory(category_name="Sequence cards")
+        db.add(category)
+        db.commit()
+        category_id = category.category_id
+    rounds, block_size = 5, 20
+    now = datetime(2025, 8, 2, 12)
+
+    def creator(db):
+        # Every thread creates its products in several transactions, like
+        # repeated create, clone and import requests; all SKUs share one minute
+        for _ in range(rounds):
+            for sku in allocate_skus(db, "SE", block_size, now=now):
+                db.add(models.Product(
+                    name=f"Sequence {sku}", sku=sku, category_id=category_id,
+                    condition="New", purchase_date=date(2025, 1, 2), obtained_method="purchase"
+                ))
+            db.commit()
+
+    statuses = run_concurrently(pg_sessions, [creator] * THREADS)
+
+    assert statuses == [200] * THREADS
+    with pg_sessions() as db:
+        skus = db.scalars(select(models.Product.sku).where(models.Product.category_id == category_id)).all()
+    assert len(skus) == THREADS * rounds * block_size
+    assert len(set(skus)) == len(skus)
@@ -0,0 +1,121 @@
+import os
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException, UploadFile
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from storage import BlobStorage, BlobTooLargeError
+
+# Largest receipt or product image accepted, in bytes (10 MB by default)
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+
+# Largest multipart request body accepted: one upload plus room for the other
+# form fields (1 MB by default). Checked before the body is spooled to disk.
+MAX_MULTIPART_BYTES = int(os.getenv("MAX_MULTIPART_BYTES", str(MAX_UPLOAD_BYTES + 1024 * 1024)))
+
+# Leading bytes identifying each accepted image type
+IMAGE_SIGNATURES: Dict[str, bytes] = {
+    "jpg": b"\xff\xd8\xff",
+    "png": b"\x89PNG\r\n\x1a\n",
+}
+
+_SNIFF_SIZE = max(len(signature) for signature in IMAGE_SIGNATURES.values())
+
+
+class UnsupportedUploadError(Exception):
+    """Raised when an upload is not one of the accepted image types"""
+
+
+@dataclass
+class StoredUpload:
+    key: str
+    size: int
+    image_type: str
+
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    """Image type ("jpg" or "png") of content starting with `head`, None when unrecognised"""
+    for image_type, signature in IMAGE_SIGNATURES.items():
+        if head.startswith(signature):
+            return image_type
+    return None
+
+
+class MultipartSizeLimitMiddleware:
+    """
+    Reject multipart requests whose body exceeds `max_size` bytes with 413.
+
+    Starlette spools the whole form to disk before an endpoint runs, so the
+    size checks of store_image_upload only happen after the upload has been
+    received. This rejects a too large Content-Length before reading anything,
+    and stops reading bodies sent without one (chunked) once they exceed the
+    limit. Paths in `exempt_paths` (bulk imports) are not limited.
+    """
+
+    def __init__(self, app: ASGIApp, max_size: int = MAX_MULTIPART_BYTES, exempt_paths: Tuple[str, ...] = ()):
+        self.app = app
+        self.max_size = max_size
+        self.exempt_paths = exempt_paths
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] in self.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        if not headers.get("content-type", "").startswith("multipart/form-data"):
+            await self.app(scope, receive, send)
+            return
+
+        detail = f"Request body exceeds the limit of {self.max_size} bytes"
+        content_length = headers.get("content-length", "")
+        if content_length.isdigit() and int(content_length) > self.max_size:
+            response = JSONResponse({"detail": detail}, status_code=413, headers={"Connection": "close"})
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_size:
+                    # Raised while the endpoint parses its form, answered by the exception handlers
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+def store_image_upload(storage: BlobStorage, upload: UploadFile, max_size: Optional[int] = None) -> StoredUpload:
+    """
+    Validate an uploaded JPG or PNG and stream it into blob storage.
+
+    The type is taken from the file's leading bytes, not from the content type
+    the client declared. The content is copied in chunks (see put_stream), so
+    memory use does not grow with the size of the upload, and the copy stops
+    with BlobTooLargeError as soon as it exceeds `max_size` (MAX_UPLOAD_BYTES
+    by default). Runs blocking file I/O: call it from a sync endpoint or a
+    worker thread, never directly on the event loop.
+
+    By the time this runs Starlette has already spooled the request body to
+    disk; what keeps oversized bodies from being received at all is
+    MultipartSizeLimitMiddleware, which caps the whole multipart request at
+    MAX_MULTIPART_BYTES (MAX_UPLOAD_BYTES plus 1 MB by default).
+    """
+    max_size = MAX_UPLOAD_BYTES if max_size is None else max_size
+    if upload.size is not None and upload.size > max_size:
+        raise BlobTooLargeError(f"Upload exceeds the limit of {max_size} bytes")
+
+    upload.file.seek(0)
+    image_type = sniff_image_type(upload.file.read(_SNIFF_SIZE))
+    if image_type is None:
+        raise UnsupportedUploadError("Upload is not a JPG or PNG image")
+    upload.file.seek(0)
+
+    key = storage.put_stream(upload.file, max_size)
+    return StoredUpload(key=key, size=storage.size(key), image_type=image_type)
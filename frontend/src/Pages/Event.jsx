@@ -443,7 +443,7 @@ const Event = () => {
                       <TableCol>
                         {expense.receipt_type ? (
                           <a
-                            href={`${import.meta.env.VITE_API_URL}/travel-expenses/${expense.expense_id}/receipt`}
+                            href={`${import.meta.env.VITE_API_URL}/travel-expenses/${expense.expense_id}/receipt${expense.receipt_hash ? `?v=${expense.receipt_hash}` : ''}`}
                             target="_blank"
                             rel="noopener noreferrer"
                             className="text-blue-600 hover:text-blue-900"
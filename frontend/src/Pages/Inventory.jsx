@@ -31,7 +31,7 @@ const Inventory = () => {
     'DESCRIPTION'
   ];
 
-  const { loading: apiLoading, error: apiError, getInstances, getCategories, deleteProduct, bulkUpdateProductLocation } = useApi();
+  const { loading: apiLoading, error: apiError, getInstances, getCategories, deleteProduct, bulkUpdateProductLocation, searchProducts } = useApi();
   
   const [allInstances, setAllInstances] = useState([]); // Store all fetched instances
   const [displayedInstances, setDisplayedInstances] = useState([]); // Instances currently shown after all filters
@@ -76,6 +76,8 @@ const Inventory = () => {
   });
 
   const [nameToSearch, setNameToSearch] = useState(""); // Renamed for clarity
+  // Product ids matching the name search (server-side, accent and typo tolerant); null when not searching
+  const [matchingProductIds, setMatchingProductIds] = useState(null);
 
   const [isLocationModalOpen, setIsLocationModalOpen] = useState(false);
   const [newLocation, setNewLocation] = useState('');
@@ -247,10 +249,12 @@ const Inventory = () => {
     }
   };
 
-  const modalHandler = (productId, productName) => {
+  const modalHandler = (productId, productName, imageHash) => {
     if (modalData.open === false && productId) {
       const baseUrl = import.meta.env.VITE_API_URL?.replace(/\/$/, '') || 'http://127.0.0.1:8000';
-      const imageUrl = `${baseUrl}/products/${productId}/image`;
+      // The image hash versions the URL, so the browser can cache it for good
+      const version = imageHash ? `&v=${imageHash}` : '';
+      const imageUrl = `${baseUrl}/products/${productId}/image?size=medium&format=webp${version}`;
       setModalData({ open: true, img: imageUrl, caption: productName || 'Product Image', productId: productId });
     } else {
       setModalData({ open: false, img: '', caption: '', productId: null });
@@ -295,10 +299,9 @@ const Inventory = () => {
     let currentFilteredInstances = [...allInstances]; // Start with all instances
 
     // Apply name search filter
-    if (nameToSearch.trim() !== '') { //
-      const lowerCaseSearchText = nameToSearch.toLowerCase(); //
-      currentFilteredInstances = currentFilteredInstances.filter(item => //
-        item.product.name && typeof item.product.name === 'string' && item.product.name.toLowerCase().includes(lowerCaseSearchText) //
+    if (matchingProductIds !== null) {
+      currentFilteredInstances = currentFilteredInstances.filter(item =>
+        matchingProductIds.has(item.product_id)
       );
     }
 
@@ -342,12 +345,12 @@ const Inventory = () => {
     }
 
     setDisplayedInstances(currentFilteredInstances); // Update the instances to be displayed
-  }, [allInstances, nameToSearch, selectedCategory, selectedLocation, startDate, endDate]); // Dependencies for memoization
+  }, [allInstances, matchingProductIds, selectedCategory, selectedLocation, startDate, endDate]); // Dependencies for memoization
 
   // Run applyFilters whenever filter dependencies change
   useEffect(() => {
     applyFilters();
-  }, [allInstances, nameToSearch, selectedCategory, selectedLocation, startDate, endDate, applyFilters]); //
+  }, [allInstances, matchingProductIds, selectedCategory, selectedLocation, startDate, endDate, applyFilters]); //
 
 
   const handleCategoryChange = (e) => {
@@ -432,6 +435,40 @@ const Inventory = () => {
     setNameToSearch(e.target.value);
   };
 
+  // Search on the server once the user stops typing
+  useEffect(() => {
+    const query = nameToSearch.trim();
+    if (query === '') {
+      setMatchingProductIds(null);
+      return undefined;
+    }
+    let cancelled = false;
+    const timer = setTimeout(async () => {
+      try {
+        // Follow has_more so matches past the first page are not dropped
+        const productIds = new Set();
+        const pageSize = 100;
+        let offset = 0;
+        let hasMore = true;
+        while (hasMore && !cancelled) {
+          const data = await searchProducts({ q: query, limit: pageSize, offset });
+          data.results.forEach(result => productIds.add(result.product_id));
+          hasMore = data.has_more;
+          offset += pageSize;
+        }
+        if (!cancelled) {
+          setMatchingProductIds(productIds);
+        }
+      } catch (error) {
+        console.error('Error searching products:', error);
+      }
+    }, 250);
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
+    };
+  }, [nameToSearch, searchProducts]);
+
   useEffect(() => {
     const newTotalPages = Math.ceil(displayedInstances.length / ITEMS_PER_PAGE); // Use displayedInstances here
     setTotalPages(newTotalPages);
@@ -689,7 +726,7 @@ const Inventory = () => {
                         <TableCol text={item.location || "Colombia"} key={`location-${item.instance_id}`}/>
                         <TableCol text={item.product?.description || 'N/A'} key={`desc-${item.instance_id}`}/>
                         <TableCol key={`image-${item.instance_id}`}>
-                          <div onClick={() => modalHandler(item.product.product_id, item.product.name)} className='text-secondaryBlue font-bold cursor-pointer'>
+                          <div onClick={() => modalHandler(item.product.product_id, item.product.name, item.product.image_hash)} className='text-secondaryBlue font-bold cursor-pointer'>
                             Image
                           </div>
                         </TableCol>
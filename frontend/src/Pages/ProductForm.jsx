@@ -52,7 +52,7 @@ const ProductForm = () => {
   const navigate = useNavigate();
   
   // Add getCategories to the destructured useApi hook
-  const { createProduct, updateProduct, getCategories } = useApi();
+  const { createProduct, cloneProduct, updateProduct, getCategories } = useApi();
   const { formatForApi } = useDateUtils();
   const { loading: exchangeRateLoading, convertToCOP } = useExchangeRate();
   
@@ -105,23 +105,22 @@ const ProductForm = () => {
       if (!response.ok) throw new Error('Failed to fetch product');
       const data = await response.json();
       
-      // Fetch instances using the correct endpoint from main.py
-      const instancesResponse = await fetch(
-        `${import.meta.env.VITE_API_URL}/instances/`
-      );
-      let allBaseCosts = [''];
-      
-      if (instancesResponse.ok) {
-        const instancesData = await instancesResponse.json();
-        // Filter instances for this specific product
-        const productInstances = instancesData.filter(instance => 
-          instance.product_id === parseInt(productId)
+      // Fetch every instance of this product, following the keyset cursor
+      const productInstances = [];
+      let cursor = null;
+      do {
+        const instancesResponse = await fetch(
+          `${import.meta.env.VITE_API_URL}/products/${productId}/instances?limit=1000${cursor ? `&cursor=${cursor}` : ''}`
         );
-        
-        if (productInstances.length > 0) {
-          const uniqueCosts = [...new Set(productInstances.map(instance => instance.base_cost))];
-          allBaseCosts = uniqueCosts.map(cost => cost.toString());
-        }
+        if (!instancesResponse.ok) break;
+        productInstances.push(...(await instancesResponse.json()));
+        cursor = instancesResponse.headers.get('X-Next-Cursor');
+      } while (cursor);
+
+      let allBaseCosts = [''];
+      if (productInstances.length > 0) {
+        const uniqueCosts = [...new Set(productInstances.map(instance => instance.base_cost))];
+        allBaseCosts = uniqueCosts.map(cost => cost.toString());
       }
       
       setOriginalProduct(data);
@@ -260,6 +259,12 @@ const ProductForm = () => {
     return true;
   };
 
+  // Whether any detail the clone endpoint copies from the original was edited
+  const duplicateDetailsChanged = () => {
+    const fields = ['category_id', 'condition', 'obtained_method', 'event_id', 'location', 'purchase_date', 'description'];
+    return fields.some((field) => String(formData[field] ?? '') !== String(originalProduct[field] ?? ''));
+  };
+
   const submitForm = async () => {
     try {
       setIsSubmitting(true);
@@ -292,6 +297,20 @@ const ProductForm = () => {
           message: "Product successfully updated!",
         });
 
+        navigate('/inventory')
+      } else if (isDuplicate && originalProduct && !formData.image && !duplicateDetailsChanged()) {
+        // Only the name or costs differ: let the server copy the product and its images
+        await cloneProduct(duplicateId, {
+          name: formData.name,
+          base_costs: formData.base_costs.filter((cost) => cost !== ''),
+          copy_images: true
+        });
+
+        setSubmitStatus({
+          type: "success",
+          message: "Product successfully duplicated!",
+        });
+
         navigate('/inventory')
       } else {
         // Create new product using the hook
@@ -12,6 +12,7 @@ import { Pie } from 'react-chartjs-2';
 ChartJS.register(ArcElement, Tooltip, Legend);
 
 const ITEMS_PER_PAGE = 100;
+const RENTABILITY_PAGE_SIZE = 500;
 
 const SalesHistory = () => {
   const [sales, setSales] = useState([]);
@@ -125,14 +126,20 @@ const SalesHistory = () => {
   const fetchRentabilityData = async () => {
     setRentabilityLoading(true);
     try {
-      const response = await fetch(`${import.meta.env.VITE_API_URL}/products-with-rentability/`);
-      
-      if (!response.ok) {
-        throw new Error('Failed to fetch rentability data');
+      // Page through every product with sales, not just the first page
+      const data = [];
+      for (let skip = 0; ; skip += RENTABILITY_PAGE_SIZE) {
+        const response = await fetch(`${import.meta.env.VITE_API_URL}/products-with-rentability/?has_sales=true&sort_by=total_profit&skip=${skip}&limit=${RENTABILITY_PAGE_SIZE}`);
+        
+        if (!response.ok) {
+          throw new Error('Failed to fetch rentability data');
+        }
+        
+        const page = await response.json();
+        data.push(...page);
+        if (page.length < RENTABILITY_PAGE_SIZE) break;
       }
       
-      const data = await response.json();
-      
       // Filter products that have sales (sales_count > 0)
       const productsWithSales = data.filter(product => product.sales_count > 0);
       
@@ -4,7 +4,7 @@ import useApi from "../hooks/useApi";
 import MigrationButton from '../Components/MigrationButton/MigrationButton';
 
 const Statistics = () => {
-  const { getProducts, getCategories } = useApi();
+  const { getInventoryStats } = useApi();
 
   const [stats, setStats] = useState({
     total: 0,
@@ -21,64 +21,24 @@ const Statistics = () => {
     }
   });
 
-  const calculateProductAge = (products) => {
-    const now = new Date();
-    return products.reduce((acc, product) => {
-      const createdDate = new Date(product.created_at);
-      const ageInDays = Math.floor((now - createdDate) / (1000 * 60 * 60 * 24));
-
-      if (ageInDays <= 30) acc.lessThan30Days++;
-      else if (ageInDays <= 90) acc.lessThan90Days++;
-      else if (ageInDays <= 180) acc.lessThan180Days++;
-      else acc.moreThan180Days++;
-
-      return acc;
-    }, {
-      lessThan30Days: 0,
-      lessThan90Days: 0,
-      lessThan180Days: 0,
-      moreThan180Days: 0
-    });
-  };
-
-  const calculateStats = async (products) => {
-    // Get categories for mapping
-    const categoriesData = await getCategories();
-    const categoriesMap = categoriesData.reduce((acc, cat) => {
-      acc[cat.category_id] = cat.category_name;
-      return acc;
-    }, {});
-
-    // Calculate statistics
-    const statistics = {
-      total: products.length,
-      byCategory: {},
-      byLocation: {
-        Colombia: 0,
-        USA: 0
-      },
-      byAge: calculateProductAge(products)
-    };
-
-    // Count by category and location
-    products.forEach(product => {
-      const categoryName = categoriesMap[product.category_id] || 'Uncategorized';
-      statistics.byCategory[categoryName] = (statistics.byCategory[categoryName] || 0) + 1;
-      
-      const location = product.location || 'Colombia';
-      statistics.byLocation[location] = (statistics.byLocation[location] || 0) + 1;
-    });
-
-    setStats(statistics);
-  };
-
   useEffect(() => {
     const loadData = async () => {
       try {
-        const data = await getProducts();
-        await calculateStats(data);
+        // Counts are aggregated by the backend, so only the summary is downloaded
+        const data = await getInventoryStats();
+        setStats({
+          total: data.total,
+          byCategory: data.by_category,
+          byLocation: data.by_location,
+          byAge: {
+            lessThan30Days: data.by_age.less_than_30_days,
+            lessThan90Days: data.by_age.less_than_90_days,
+            lessThan180Days: data.by_age.less_than_180_days,
+            moreThan180Days: data.by_age.more_than_180_days
+          }
+        });
       } catch (error) {
-        console.error(`Error fetching the product data:`, error);
+        console.error(`Error fetching the inventory statistics:`, error);
       }
     };
     loadData();
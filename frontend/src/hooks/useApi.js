@@ -151,11 +151,36 @@ export const useApi = () => {
   }, [fetchData]);
 
   /**
-   * Get all product instances
+   * Get product instances
+   * @param {Object} params - Optional query params (cursor, limit, name, category_id,
+   *   location, status, condition, start_date, end_date, fields)
    * @returns {Promise<Array>} Instances array
    */
-  const getInstances = useCallback(() => {
-    return fetchData('/instances/');
+  const getInstances = useCallback((params = {}) => {
+    const query = new URLSearchParams(
+      Object.entries(params).filter(([, value]) => value !== undefined && value !== null && value !== '')
+    ).toString();
+    return fetchData(query ? `/instances/?${query}` : '/instances/');
+  }, [fetchData]);
+
+  /**
+   * Search products by name, SKU and description (ranked, accent and typo tolerant)
+   * @param {Object} params - q (required), limit, offset
+   * @returns {Promise<Object>} { results, has_more, ... } with highlighted matches
+   */
+  const searchProducts = useCallback((params) => {
+    const query = new URLSearchParams(
+      Object.entries(params).filter(([, value]) => value !== undefined && value !== null && value !== '')
+    ).toString();
+    return fetchData(`/search/products?${query}`);
+  }, [fetchData]);
+
+  /**
+   * Get aggregated inventory statistics (counts by category, location and age)
+   * @returns {Promise<Object>} Statistics summary
+   */
+  const getInventoryStats = useCallback(() => {
+    return fetchData('/stats/inventory');
   }, [fetchData]);
 
   /**
@@ -187,6 +212,20 @@ export const useApi = () => {
     });
   }, [fetchData]);
 
+  /**
+   * Duplicate a product: new SKU, same details, shared images and one
+   * instance per base cost, created in a single request
+   * @param {number} id - Product ID to duplicate
+   * @param {Object} data - name, base_costs and copy_images
+   * @returns {Promise<Object>} The new product
+   */
+  const cloneProduct = useCallback((id, data) => {
+    return fetchData(`/products/${id}/clone`, {
+      method: 'POST',
+      body: JSON.stringify(data)
+    });
+  }, [fetchData]);
+
   /**
    * Update a product
    * @param {number} id - Product ID
@@ -328,6 +367,7 @@ export const useApi = () => {
     getProduct,
     getCategories,
     createProduct,
+    cloneProduct,
     updateProduct,
     deleteProduct,
     registerSale,
@@ -339,7 +379,9 @@ export const useApi = () => {
     deleteSupplier,
     updateSupplier,
     bulkUpdateProductLocation,
-    getInstances
+    getInstances,
+    getInventoryStats,
+    searchProducts
   };
 };
 